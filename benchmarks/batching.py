@@ -0,0 +1,125 @@
+"""
+Throughput of a batch-capable tool called concurrently, with and without batching.
+
+The tool stands in for an embedding lookup or a fetch by id on an upstream that
+serves ``--connections`` calls at a time: every call pays a fixed round trip
+(``--overhead-ms``) plus a small cost per item, whether it carries one item or many.
+Without a ``MicroBatcher`` each request pays the round trip itself:
+
+    python -m benchmarks.batching --concurrency 1 16 64 --window-ms 2
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from batching import MicroBatcher
+from benchmarks.common import emit
+from kithub import create_kit, create_kithub
+from models import AuthenticatedTool
+
+PER_ITEM_SECONDS = 0.00002
+
+
+def make_tool(
+    overhead: float, connections: int, batch_sizes: List[int]
+) -> AuthenticatedTool:
+    upstream = asyncio.Semaphore(connections)
+
+    async def lookup(key: str) -> int:
+        """Look up the value of a key."""
+        async with upstream:
+            await asyncio.sleep(overhead + PER_ITEM_SECONDS)
+        return len(key)
+
+    async def lookup_many(items: List[Dict[str, Any]]) -> List[int]:
+        batch_sizes.append(len(items))
+        async with upstream:
+            await asyncio.sleep(overhead + PER_ITEM_SECONDS * len(items))
+        return [len(item["key"]) for item in items]
+
+    return AuthenticatedTool.from_function(
+        coroutine=lookup,
+        name="lookup",
+        description=lookup.__doc__,
+        batch_func=lookup_many,
+    )
+
+
+async def throughput(app: Any, concurrency: int, n_requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)  # type: ignore
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = n_requests
+
+        async def worker() -> None:
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                response = await client.post("/b/lookup", json={"key": "k" * 8})
+                if response.status_code != 200:
+                    raise RuntimeError(f"Got {response.status_code}: {response.text}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return n_requests / (time.perf_counter() - start)
+
+
+def measure(
+    concurrency: int,
+    n_requests: int,
+    overhead: float,
+    connections: int,
+    window: float,
+    max_size: int,
+) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"concurrency": concurrency}
+    for batched in (False, True):
+        batch_sizes: List[int] = []
+        batcher = MicroBatcher(window=window, max_size=max_size) if batched else None
+        kit = create_kit(
+            prefix="/b",
+            tools=[make_tool(overhead, connections, batch_sizes)],
+            batcher=batcher,
+        )
+        rps = asyncio.run(throughput(create_kithub([kit]), concurrency, n_requests))
+        if batched:
+            result["batched_rps"] = round(rps, 1)
+            result["mean_batch_size"] = round(n_requests / len(batch_sizes), 2)
+        else:
+            result["rps"] = round(rps, 1)
+    result["speedup"] = round(result["batched_rps"] / result["rps"], 2)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--overhead-ms", type=float, default=5.0)
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    parser.add_argument("--max-size", type=int, default=64)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = [
+        measure(
+            concurrency,
+            args.requests,
+            args.overhead_ms / 1000,
+            args.connections,
+            args.window_ms / 1000,
+            args.max_size,
+        )
+        for concurrency in args.concurrency
+    ]
+    emit("batching", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
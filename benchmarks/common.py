@@ -0,0 +1,118 @@
+import json
+import platform
+import resource
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+
+def make_synthetic_spec(
+    n_operations: int, params_per_operation: int = 6, base_url: str = "http://127.0.0.1"
+) -> Dict[str, Any]:
+    """Build an OpenAPI spec with ``n_operations`` GET/POST operations on shared refs."""
+    paths: Dict[str, Any] = {}
+    for i in range(n_operations):
+        method = "get" if i % 2 == 0 else "post"
+        path = f"/resource{i // 2}/{{item_id}}"
+        parameters: List[Dict[str, Any]] = [
+            {"$ref": "#/components/parameters/ItemId"},
+            {"$ref": "#/components/parameters/Limit"},
+        ]
+        parameters.extend(
+            {
+                "name": f"field_{j}",
+                "in": "query",
+                "description": f"Filter number {j}",
+                "schema": {"type": ["string", "integer", "boolean"][j % 3]},
+            }
+            for j in range(params_per_operation - 2)
+        )
+        operation: Dict[str, Any] = {
+            "summary": f"Operation {i}",
+            "tags": [f"group{i % 10}"],
+            "parameters": parameters,
+            "security": [{"ApiKeyAuth": []}],
+        }
+        if method == "post":
+            operation["requestBody"] = {
+                "content": {
+                    "application/json": {"schema": {"$ref": "#/components/schemas/Item"}}
+                }
+            }
+        paths.setdefault(path, {})[method] = operation
+
+    return {
+        "openapi": "3.0.0",
+        "info": {"title": "Synthetic API", "version": "1.0.0"},
+        "servers": [{"url": base_url}],
+        "paths": paths,
+        "components": {
+            "parameters": {
+                "ItemId": {
+                    "name": "item_id",
+                    "in": "path",
+                    "required": True,
+                    "schema": {"type": "integer"},
+                },
+                "Limit": {"name": "limit", "in": "query", "schema": {"type": "integer"}},
+            },
+            "schemas": {
+                "Item": {
+                    "type": "object",
+                    "required": ["name"],
+                    "properties": {
+                        "name": {"type": "string", "description": "Item name"},
+                        "price": {"type": "number"},
+                        "tags": {"type": "array", "items": {"type": "string"}},
+                    },
+                }
+            },
+            "securitySchemes": {
+                "ApiKeyAuth": {"type": "apiKey", "in": "header", "name": "X-API-Key"}
+            },
+        },
+    }
+
+
+def write_spec(path: str, spec: Dict[str, Any]) -> str:
+    with open(path, "w") as file:
+        yaml.safe_dump(spec, file, sort_keys=False)
+    return path
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is reported in KiB on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class Timer:
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.seconds = time.perf_counter() - self.start
+
+
+def emit(benchmark: str, results: Any, output: Optional[str] = None) -> None:
+    report = json.dumps(
+        {
+            "benchmark": benchmark,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+        },
+        indent=2,
+    )
+    print(report)  # noqa: T201
+    if output:
+        with open(output, "w") as file:
+            file.write(report + "\n")
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
@@ -0,0 +1,100 @@
+"""
+Startup time and memory of OpenAPI kits: eager, lazy and lazy from a compiled spec.
+
+Every mode runs in a fresh interpreter so peak RSS is not shared between runs:
+
+    python -m benchmarks.openapi_startup --operations 2000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import Timer, emit, make_synthetic_spec, max_rss_mb, write_spec
+
+MODES = ("eager", "lazy", "lazy_compiled")
+
+
+def run_child(spec_file: str, mode: str, cache_dir: str) -> None:
+    from kithub import create_kit, create_kithub
+    from openapi.openapi_tools import create_llm_tools_from_openapi
+
+    lazy = mode != "eager"
+    baseline_rss = max_rss_mb()
+    with Timer() as tools_timer:
+        tools = create_llm_tools_from_openapi(
+            spec_file, lazy=lazy, cache_dir=cache_dir if mode == "lazy_compiled" else None
+        )
+    with Timer() as kit_timer:
+        app = create_kithub([create_kit(prefix="/bench", tools=tools)])
+    with Timer() as first_use:
+        if lazy:
+            tools[0].materialize()
+
+    print(  # noqa: T201
+        json.dumps(
+            {
+                "mode": mode,
+                "tools": len(tools),
+                "routes": len(app.routes),
+                "create_tools_s": round(tools_timer.seconds, 4),
+                "create_kit_s": round(kit_timer.seconds, 4),
+                "first_materialize_s": round(first_use.seconds, 4),
+                "rss_mb": round(max_rss_mb(), 1),
+                "rss_delta_mb": round(max_rss_mb() - baseline_rss, 1),
+            }
+        )
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--operations", type=int, nargs="+", default=[200, 2000])
+    parser.add_argument("--child", choices=MODES)
+    parser.add_argument("--spec")
+    parser.add_argument("--cache-dir")
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.spec, args.child, args.cache_dir)
+        return
+
+    from openapi.openapi_tools import load_compiled_spec
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_operations in args.operations:
+            spec_file = write_spec(
+                os.path.join(tmp, f"spec_{n_operations}.yaml"),
+                make_synthetic_spec(n_operations),
+            )
+            cache_dir = os.path.join(tmp, "compiled")
+            load_compiled_spec(spec_file, cache_dir)
+            for mode in MODES:
+                output = subprocess.run(
+                    [
+                        sys.executable,
+                        "-m",
+                        "benchmarks.openapi_startup",
+                        "--child",
+                        mode,
+                        "--spec",
+                        spec_file,
+                        "--cache-dir",
+                        cache_dir,
+                    ],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout
+                results.append(
+                    {"operations": n_operations, **json.loads(output.splitlines()[-1])}
+                )
+    emit("openapi_startup", results)
+
+
+if __name__ == "__main__":
+    main()
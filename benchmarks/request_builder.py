@@ -0,0 +1,145 @@
+"""
+Per-call cost of turning tool arguments into an upstream request.
+
+Compares the precompiled ``RequestPlan``, validating or handed input validated at the
+HTTP boundary, with the previous per-call ``build_request`` for operations with a
+growing number of parameters:
+
+    python -m benchmarks.request_builder --params 5 20 50
+"""
+
+import argparse
+import timeit
+from typing import Annotated, Any, Dict, List
+
+from pydantic import Field, create_model
+from pydantic.v1 import Field as FieldV1
+from pydantic.v1 import create_model as create_model_v1
+
+from benchmarks.common import emit
+from openapi.resolver import ParamLocation
+from openapi.utils import RequestPlan
+
+AUTH_REQUIREMENTS = [{"type": "apiKey", "in": "header", "name": "X-API-Key"}]
+
+
+def legacy_build_request(method, path, RequestModel, auth_requirements, kwargs):
+    # The builder as it was before request plans, kept here as the baseline
+    validated_data = RequestModel(**kwargs)
+    headers = {}
+    params = {}
+    data = None
+    json_data = None
+
+    for auth_req in auth_requirements:
+        if auth_req["type"] == "apiKey":
+            if auth_req["in"] == "header":
+                headers[auth_req["name"]] = kwargs.get("auth_headers", {}).get(
+                    auth_req["name"]
+                )
+            elif auth_req["in"] == "query":
+                params[auth_req["name"]] = kwargs.get("auth_params", {}).get(
+                    auth_req["name"]
+                )
+        elif auth_req["type"] == "oauth2":
+            token = kwargs.get("auth_headers", {}).get("Authorization")
+            if token:
+                headers["Authorization"] = token
+
+    for param_name, param_value in validated_data.dict(exclude_unset=True).items():
+        param_info = RequestModel.__fields__[param_name]
+        param_location = param_info.field_info.extra.get("in", "body")
+
+        if param_location == "query":
+            params[param_name] = param_value
+        elif param_location == "header":
+            headers[param_name] = str(param_value)
+        elif param_location == "path":
+            path = path.replace(f"{{{param_name}}}", str(param_value))
+        else:
+            if data is None:
+                data = {}
+            data[param_name] = param_value
+
+    if data and method.lower() in ["post", "put", "patch"]:
+        json_data = data
+        data = None
+
+    return {
+        "method": method.upper(),
+        "path": path,
+        "params": params,
+        "headers": headers,
+        "data": data,
+        "json": json_data,
+    }
+
+
+def make_operation(n_params: int):
+    """Two path params, one header and the rest split between query and body."""
+    locations = ["path", "path", "header"] + [
+        "query" if i % 2 == 0 else "body" for i in range(max(n_params - 3, 0))
+    ]
+    located = list(enumerate(locations[:n_params]))
+    # The legacy builder reads locations from pydantic v1 field extras
+    LegacyModel = create_model_v1(
+        f"Legacy{n_params}",
+        **{f"p{i}": (str, FieldV1(..., **{"in": location})) for i, location in located},
+    )  # type: ignore
+    RequestModel = create_model(
+        f"Request{n_params}",
+        **{
+            f"p{i}": (Annotated[str, ParamLocation(location)], Field(...))
+            for i, location in located
+        },
+    )  # type: ignore
+    path = "/accounts/{p0}/items/{p1}"
+    kwargs: Dict[str, Any] = {f"p{i}": f"value-p{i}" for i, _ in located}
+    kwargs["auth_headers"] = {"x-api-key": "secret", "X-API-Key": "secret"}
+    return path, LegacyModel, RequestModel, kwargs
+
+
+def measure(n_params: int, number: int) -> Dict[str, Any]:
+    path, LegacyModel, RequestModel, kwargs = make_operation(n_params)
+    plan = RequestPlan("post", path, RequestModel, AUTH_REQUIREMENTS)
+
+    legacy = min(
+        timeit.repeat(
+            lambda: legacy_build_request(
+                "post", path, LegacyModel, AUTH_REQUIREMENTS, kwargs
+            ),
+            number=number,
+            repeat=5,
+        )
+    )
+    planned = min(timeit.repeat(lambda: plan.build(kwargs), number=number, repeat=5))
+    validated = min(
+        timeit.repeat(lambda: plan.build(kwargs, True), number=number, repeat=5)
+    )
+    validation = min(
+        timeit.repeat(lambda: RequestModel(**kwargs), number=number, repeat=5)
+    )
+    return {
+        "params": n_params,
+        "legacy_us": round(legacy / number * 1e6, 2),
+        "plan_us": round(planned / number * 1e6, 2),
+        "plan_validated_us": round(validated / number * 1e6, 2),
+        "validation_only_us": round(validation / number * 1e6, 2),
+        "speedup": round(legacy / planned, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--params", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    results: List[Dict[str, Any]] = [
+        measure(n_params, args.number) for n_params in args.params
+    ]
+    emit("request_builder", results)
+
+
+if __name__ == "__main__":
+    main()
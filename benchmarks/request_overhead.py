@@ -0,0 +1,279 @@
+"""
+Per-request overhead of KitHub apps, measured in process without a network server.
+
+Requests go through an in-process ASGI client, OpenAPI tools call a local stub
+upstream. Every scenario reports sequential latency and concurrent throughput:
+
+    python -m benchmarks.request_overhead --requests 500 --output overhead.json
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from pydantic.v1 import Field, create_model
+
+from benchmarks.common import Timer, emit, make_synthetic_spec, percentile, write_spec
+from instrumentation import Instrumentation
+from kithub import create_kit, create_kithub
+from models import AuthenticatedTool
+from openapi.openapi_tools import create_llm_tools_from_openapi
+
+# (method, path, json body, headers)
+Call = Tuple[str, str, Optional[Dict[str, Any]], Dict[str, str]]
+
+
+def echo(x: int) -> int:
+    """Return the number it was given."""
+    return x
+
+
+def fail(x: int) -> int:
+    """Always raise."""
+    raise RuntimeError("boom")
+
+
+def make_many_params_tool(n_params: int) -> AuthenticatedTool:
+    fields = {
+        f"p{i}": ((int, str, float, bool)[i % 4], Field(..., description=f"Param {i}"))
+        for i in range(n_params)
+    }
+    return AuthenticatedTool.from_function(
+        func=lambda **kwargs: len(kwargs),
+        name="many_params",
+        description="Count the parameters it was given.",
+        args_schema=create_model("ManyParams", **fields),  # type: ignore
+    )
+
+
+def many_params_body(n_params: int) -> Dict[str, Any]:
+    samples = (1, "text", 1.5, True)
+    return {f"p{i}": samples[i % 4] for i in range(n_params)}
+
+
+def make_auth_tool() -> AuthenticatedTool:
+    return AuthenticatedTool.from_function(
+        func=echo,
+        name="secured_echo",
+        description="Return the number it was given.",
+        auth_requirements=[{"type": "apiKey", "in": "header", "name": "X-API-Key"}],
+    )
+
+
+def make_echo_tools(n_tools: int) -> List[AuthenticatedTool]:
+    return [
+        AuthenticatedTool.from_function(
+            func=echo, name=f"echo_{i}", description=f"Echo number {i}."
+        )
+        for i in range(n_tools)
+    ]
+
+
+async def measure(
+    app: Any, call: Call, n_requests: int, concurrency: int, expected_status: int
+) -> Dict[str, Any]:
+    method, path, body, headers = call
+    transport = httpx.ASGITransport(app=app)  # type: ignore
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def send() -> float:
+            start = time.perf_counter()
+            response = await client.request(method, path, json=body, headers=headers)
+            elapsed = time.perf_counter() - start
+            if response.status_code != expected_status:
+                raise RuntimeError(
+                    f"{path} returned {response.status_code}: {response.text[:200]}"
+                )
+            return elapsed
+
+        for _ in range(min(20, n_requests)):
+            await send()
+
+        latencies = [await send() for _ in range(n_requests)]
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send_limited() -> float:
+            async with semaphore:
+                return await send()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send_limited() for _ in range(n_requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "mean_us": round(statistics.mean(latencies) * 1e6, 1),
+        "p50_us": round(percentile(latencies, 0.5) * 1e6, 1),
+        "p99_us": round(percentile(latencies, 0.99) * 1e6, 1),
+        "throughput_rps": round(n_requests / elapsed, 1),
+    }
+
+
+Scenario = Tuple[str, Callable[[], Any], Call, int]
+
+
+def scenarios(upstream_url: str, tmp: str) -> List[Scenario]:
+    """Name, app factory, request and expected status for every scenario."""
+    openapi_spec = write_spec(
+        os.path.join(tmp, "upstream.yaml"),
+        make_synthetic_spec(1, base_url=upstream_url),
+    )
+    n_params = 30
+    return [
+        (
+            "trivial",
+            lambda: create_kithub([create_kit(prefix="/kit", tools=[echo])]),
+            ("POST", "/kit/echo", {"x": 1}, {}),
+            200,
+        ),
+        (
+            "trivial_instrumented",
+            lambda: create_kithub(
+                [
+                    create_kit(
+                        prefix="/kit", tools=[echo], instrumentation=Instrumentation()
+                    )
+                ]
+            ),
+            ("POST", "/kit/echo", {"x": 1}, {}),
+            200,
+        ),
+        (
+            "many_params",
+            lambda: create_kithub(
+                [create_kit(prefix="/kit", tools=[make_many_params_tool(n_params)])]
+            ),
+            ("POST", "/kit/many_params", many_params_body(n_params), {}),
+            200,
+        ),
+        (
+            "auth_dependency",
+            lambda: create_kithub([create_kit(prefix="/kit", tools=[make_auth_tool()])]),
+            ("POST", "/kit/secured_echo", {"x": 1}, {"X-API-Key": "secret"}),
+            200,
+        ),
+        (
+            "openapi",
+            lambda: create_kithub(
+                [
+                    create_kit(
+                        prefix="/kit", tools=create_llm_tools_from_openapi(openapi_spec)
+                    )
+                ]
+            ),
+            (
+                "POST",
+                "/kit/resource0_item_id",
+                {"item_id": 7, "limit": 10},
+                {"X-API-Key": "secret"},
+            ),
+            200,
+        ),
+        (
+            "validation_error",
+            lambda: create_kithub([create_kit(prefix="/kit", tools=[echo])]),
+            ("POST", "/kit/echo", {"x": "not a number"}, {}),
+            422,
+        ),
+        (
+            "tool_error",
+            lambda: create_kithub([create_kit(prefix="/kit", tools=[fail])]),
+            ("POST", "/kit/fail", {"x": 1}, {}),
+            500,
+        ),
+        (
+            "not_found",
+            lambda: create_kithub([create_kit(prefix="/kit", tools=[echo])]),
+            ("POST", "/kit/missing", {"x": 1}, {}),
+            404,
+        ),
+    ]
+
+
+def run_scenarios(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    from tests.stub_server import StubServer, json_response
+
+    results = []
+    with StubServer(lambda request: json_response({"ok": True})) as upstream:
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, make_app, call, status in scenarios(upstream.url, tmp):
+                if args.only and name not in args.only:
+                    continue
+                app = make_app()
+                stats = asyncio.run(
+                    measure(app, call, args.requests, args.concurrency, status)
+                )
+                results.append({"scenario": name, **stats})
+    return results
+
+
+def run_scaling(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    results = []
+    for n_tools in args.tools:
+        tools = make_echo_tools(n_tools)
+        with Timer() as startup:
+            app = create_kithub([create_kit(prefix="/kit", tools=tools)])
+        # The last tool registered is the worst case for linear route matching
+        call: Call = ("POST", f"/kit/echo_{n_tools - 1}", {"x": 1}, {})
+        stats = asyncio.run(measure(app, call, args.requests, args.concurrency, 200))
+        results.append(
+            {
+                "scenario": "registered_tools",
+                "tools": n_tools,
+                "startup_s": round(startup.seconds, 4),
+                **stats,
+            }
+        )
+    return results
+
+
+def run_openapi_startup(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_operations in args.operations:
+            spec_file = write_spec(
+                os.path.join(tmp, f"spec_{n_operations}.yaml"),
+                make_synthetic_spec(n_operations),
+            )
+            for lazy in (False, True):
+                with Timer() as timer:
+                    tools = create_llm_tools_from_openapi(spec_file, lazy=lazy)
+                results.append(
+                    {
+                        "scenario": "openapi_startup",
+                        "operations": n_operations,
+                        "lazy": lazy,
+                        "tools": len(tools),
+                        "create_tools_s": round(timer.seconds, 4),
+                    }
+                )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--tools", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--operations", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--only", nargs="+", help="Run only these request scenarios")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = run_scenarios(args)
+    if not args.only:
+        results += run_scaling(args) + run_openapi_startup(args)
+    emit("request_overhead", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Build time and routing latency of kits with many tools, per dispatch mode.
+
+``routes`` registers one route per tool, ``table`` serves them all from a single
+route with a name lookup. Calls target the first and the last tool so linear route
+matching shows up, tools run inline to keep the executor out of the numbers:
+
+    python -m benchmarks.routing --tools 10 1000 10000
+"""
+
+import argparse
+import asyncio
+import logging
+from typing import Any, Dict
+
+from benchmarks.common import Timer, emit
+from benchmarks.request_overhead import make_echo_tools, measure
+from kithub import DISPATCH_MODES, create_kit, create_kithub
+
+
+def run(n_tools: int, dispatch: str, n_requests: int) -> Dict[str, Any]:
+    tools = make_echo_tools(n_tools)
+    with Timer() as build:
+        app = create_kithub(
+            [
+                create_kit(
+                    prefix="/kit", tools=tools, execution_mode="inline", dispatch=dispatch
+                )
+            ]
+        )
+    with Timer() as docs:
+        app.openapi()
+
+    result: Dict[str, Any] = {
+        "tools": n_tools,
+        "dispatch": dispatch,
+        "routes": len(app.routes),
+        "build_s": round(build.seconds, 4),
+        "openapi_s": round(docs.seconds, 4),
+    }
+    for position, index in (("first", 0), ("last", n_tools - 1)):
+        stats = asyncio.run(
+            measure(app, ("POST", f"/kit/echo_{index}", {"x": 1}, {}), n_requests, 1, 200)
+        )
+        result[f"{position}_p50_us"] = stats["p50_us"]
+        result[f"{position}_p99_us"] = stats["p99_us"]
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tools", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = [
+        run(n_tools, dispatch, args.requests)
+        for n_tools in args.tools
+        for dispatch in DISPATCH_MODES
+    ]
+    emit("routing", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Cost of returning multi-megabyte results, with and without fast serialization.
+
+Covers a local tool returning a large list of records and an OpenAPI tool proxying
+an equally large upstream response, decoded or passed through as raw bytes:
+
+    python -m benchmarks.serialization --megabytes 1 5 20
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks.common import emit, write_spec
+from kithub import create_kit, create_kithub
+from openapi.openapi_tools import create_llm_tools_from_openapi
+
+
+def make_records(megabytes: float) -> List[Dict[str, Any]]:
+    record = {
+        "id": 0,
+        "name": "record name",
+        "tags": ["alpha", "beta", "gamma"],
+        "price": 12.5,
+        "active": True,
+        "meta": {"source": "benchmark", "score": 0.75},
+    }
+    count = max(1, int(megabytes * 1024 * 1024 / len(json.dumps(record))))
+    return [{**record, "id": i} for i in range(count)]
+
+
+def make_spec(base_url: str) -> Dict[str, Any]:
+    return {
+        "openapi": "3.0.0",
+        "info": {"title": "Records", "version": "1.0.0"},
+        "servers": [{"url": base_url}],
+        "paths": {"/records": {"get": {"summary": "List records"}}},
+    }
+
+
+async def time_calls(app: Any, path: str, repeat: int) -> Dict[str, Any]:
+    transport = httpx.ASGITransport(app=app)  # type: ignore
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        samples = []
+        size = 0
+        for _ in range(repeat + 1):
+            start = time.perf_counter()
+            response = await client.post(path, json={})
+            samples.append(time.perf_counter() - start)
+            response.raise_for_status()
+            size = len(response.content)
+    # The first call warms up lazy pools and connections
+    return {
+        "response_bytes": size,
+        "mean_ms": round(statistics.mean(samples[1:]) * 1e3, 2),
+        "min_ms": round(min(samples[1:]) * 1e3, 2),
+    }
+
+
+def run(megabytes: float, repeat: int) -> List[Dict[str, Any]]:
+    from tests.stub_server import StubServer, json_response
+
+    records = make_records(megabytes)
+    payload = json_response(records)
+
+    def list_records():
+        """List records."""
+        return records
+
+    results = []
+    for fast in (False, True):
+        app = create_kithub(
+            [create_kit(prefix="/kit", tools=[list_records], fast_serialization=fast)]
+        )
+        results.append(
+            {
+                "megabytes": megabytes,
+                "scenario": "local_tool",
+                "fast": fast,
+                **asyncio.run(time_calls(app, "/kit/list_records", repeat)),
+            }
+        )
+
+    with StubServer(lambda request: payload) as upstream:
+        with tempfile.TemporaryDirectory() as tmp:
+            spec_file = write_spec(
+                os.path.join(tmp, "records.yaml"), make_spec(upstream.url)
+            )
+            for fast, raw in ((False, False), (True, False), (True, True)):
+                tools = create_llm_tools_from_openapi(spec_file, raw_responses=raw)
+                app = create_kithub(
+                    [create_kit(prefix="/kit", tools=tools, fast_serialization=fast)]
+                )
+                results.append(
+                    {
+                        "megabytes": megabytes,
+                        "scenario": "openapi_tool",
+                        "fast": fast,
+                        "raw_responses": raw,
+                        **asyncio.run(time_calls(app, "/kit/records", repeat)),
+                    }
+                )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--megabytes", type=float, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = []
+    for megabytes in args.megabytes:
+        results.extend(run(megabytes, args.repeat))
+    emit("serialization", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
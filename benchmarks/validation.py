@@ -0,0 +1,184 @@
+"""
+Per-call CPU of OpenAPI tools with and without validating their input only once.
+
+``validate_once`` kits check a call against the tool's own model at the HTTP boundary
+and hand the result to the request builder as is. Without it the call is validated
+again by the langchain tool and by the request builder. The upstream is replaced by
+an engine answering in process, so only KitHub's own work is measured:
+
+    python -m benchmarks.validation --params 5 20 50
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks.common import emit, write_spec
+from kithub import create_kit, create_kithub
+from openapi.openapi_tools import create_llm_tools_from_openapi
+from openapi.transport import HTTPEngine
+
+QUERY_TYPES = ("string", "integer", "boolean", "number")
+SAMPLES = {"string": "text", "integer": 7, "boolean": True, "number": 1.5}
+
+
+class NullEngine(HTTPEngine):
+    """Answers every request in process without sending it."""
+
+    async def request(self, base_url: str, method: str, path: str, **kwargs: Any) -> Any:
+        return {"ok": True}
+
+
+def make_spec(n_params: int) -> Dict[str, Any]:
+    """One POST operation with a path param, ``n_params`` query params and a body."""
+    order_id = {"type": "integer"}
+    parameters: List[Dict[str, Any]] = [
+        {"name": "order_id", "in": "path", "required": True, "schema": order_id}
+    ]
+    parameters.extend(
+        {
+            "name": f"q{i}",
+            "in": "query",
+            "description": f"Filter number {i}",
+            "schema": {"type": QUERY_TYPES[i % len(QUERY_TYPES)]},
+        }
+        for i in range(n_params)
+    )
+    return {
+        "openapi": "3.0.0",
+        "info": {"title": "Orders", "version": "1.0.0"},
+        "servers": [{"url": "http://127.0.0.1"}],
+        "paths": {
+            "/orders/{order_id}": {
+                "post": {
+                    "summary": "Update an order",
+                    "parameters": parameters,
+                    "requestBody": {
+                        "content": {
+                            "application/json": {
+                                "schema": {"$ref": "#/components/schemas/Order"}
+                            }
+                        }
+                    },
+                }
+            }
+        },
+        "components": {
+            "schemas": {
+                "Order": {
+                    "type": "object",
+                    "required": ["items"],
+                    "properties": {
+                        "note": {"type": "string"},
+                        "items": {
+                            "type": "array",
+                            "items": {"$ref": "#/components/schemas/Line"},
+                        },
+                    },
+                },
+                "Line": {
+                    "type": "object",
+                    "required": ["sku", "quantity"],
+                    "properties": {
+                        "sku": {"type": "string"},
+                        "quantity": {"type": "integer"},
+                        "price": {"type": "number"},
+                    },
+                },
+            }
+        },
+    }
+
+
+def make_body(n_params: int) -> Dict[str, Any]:
+    body: Dict[str, Any] = {
+        f"q{i}": SAMPLES[QUERY_TYPES[i % len(QUERY_TYPES)]] for i in range(n_params)
+    }
+    body["order_id"] = 42
+    body["note"] = "leave at the door"
+    body["items"] = [{"sku": f"sku-{i}", "quantity": i, "price": 9.5} for i in range(5)]
+    return body
+
+
+async def cpu_per_call(app: Any, body: Dict[str, Any], n_requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)  # type: ignore
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def send() -> None:
+            response = await client.post("/orders/orders_order_id", json=body)
+            if response.status_code != 200:
+                raise RuntimeError(f"Got {response.status_code}: {response.text[:200]}")
+
+        for _ in range(min(20, n_requests)):
+            await send()
+        start = time.process_time()
+        for _ in range(n_requests):
+            await send()
+        return (time.process_time() - start) / n_requests
+
+
+async def tool_cpu_per_call(
+    tool: Any, body: Dict[str, Any], number: int
+) -> Dict[str, float]:
+    """CPU below the HTTP boundary, the way each mode calls the tool."""
+    params = {**tool.args_schema(**body).model_dump(), "auth_headers": {}}
+    timings = {}
+    for name, call in (
+        ("invoke", lambda: tool.ainvoke(input=params)),
+        ("validated_call", lambda: tool.validated_call(params)),
+    ):
+        for _ in range(20):
+            await call()
+        start = time.process_time()
+        for _ in range(number):
+            await call()
+        timings[name] = (time.process_time() - start) / number
+    return timings
+
+
+def measure(n_params: int, n_requests: int, spec_file: str) -> Dict[str, Any]:
+    tools = create_llm_tools_from_openapi(spec_file, engine=NullEngine())
+    body = make_body(n_params)
+    http = {}
+    for validate_once in (False, True):
+        app = create_kithub(
+            [create_kit(prefix="/orders", tools=tools, validate_once=validate_once)]
+        )
+        http[validate_once] = asyncio.run(cpu_per_call(app, body, n_requests))
+    tool = asyncio.run(tool_cpu_per_call(tools[0], body, n_requests))
+    return {
+        "params": n_params + 3,
+        "http_cpu_us": round(http[False] * 1e6, 1),
+        "http_cpu_validate_once_us": round(http[True] * 1e6, 1),
+        "http_speedup": round(http[False] / http[True], 2),
+        "tool_cpu_us": round(tool["invoke"] * 1e6, 1),
+        "tool_cpu_validate_once_us": round(tool["validated_call"] * 1e6, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--params", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_params in args.params:
+            spec_file = write_spec(
+                os.path.join(tmp, f"orders_{n_params}.yaml"), make_spec(n_params)
+            )
+            results.append(measure(n_params, args.requests, spec_file))
+    emit("validation", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
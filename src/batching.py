@@ -0,0 +1,173 @@
+import asyncio
+import functools
+import inspect
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from executors import ToolExecutor, ToolRunner
+from instrumentation import Histogram
+from models import AUTH_INPUT_KEYS, accepted_auth_keys
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+BatchRunner = Callable[[List[Dict[str, Any]], Dict[str, Any]], Awaitable[List[Any]]]
+
+
+def create_batch_runner(executor: ToolExecutor, batch_func: Callable) -> BatchRunner:
+    """Calls ``batch_func`` with a batch's params, sync functions in the thread pool."""
+    auth_keys = accepted_auth_keys(batch_func)
+
+    if inspect.iscoroutinefunction(batch_func):
+
+        async def run_batch_async(items, credentials) -> List[Any]:
+            auth = {k: v for k, v in credentials.items() if k in auth_keys}
+            return await batch_func(items, **auth)
+
+        return run_batch_async
+
+    async def run_batch_in_thread(items, credentials) -> List[Any]:
+        auth = {k: v for k, v in credentials.items() if k in auth_keys}
+        call = functools.partial(batch_func, items, **auth)
+        return await executor.submit("thread", call)
+
+    return run_batch_in_thread
+
+
+def batch_credentials(
+    full_params: Dict[str, Any], auth_header_names: List[str]
+) -> Dict[str, Dict[str, Any]]:
+    """The credentials a batch is sent with, all of them part of its key."""
+    auth_headers = full_params.get("auth_headers") or {}
+    return {
+        "auth_headers": {
+            name.lower(): auth_headers[name.lower()]
+            for name in auth_header_names
+            if name.lower() in auth_headers
+        },
+        "auth_params": dict(full_params.get("auth_params") or {}),
+    }
+
+
+class BatchStats:
+    def __init__(self):
+        self.batches = 0
+        self.calls = 0
+        self.full = 0
+        self.sizes = Histogram(BATCH_SIZE_BUCKETS)
+
+
+class PendingBatch:
+    def __init__(self, credentials: Dict[str, Any]):
+        self.credentials = credentials
+        self.items: List[Dict[str, Any]] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher:
+    """
+    Groups concurrent calls to a tool into one call of its batch function.
+
+    The first call of a batch waits up to ``window`` seconds for others to join it,
+    and a batch is sent as soon as it holds ``max_size`` calls. Only calls presenting
+    the same credentials share a batch, and the batch function gets just those: the
+    tool's auth headers and the query params.
+    """
+
+    def __init__(self, window: float = 0.005, max_size: int = 64):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.window = window
+        self.max_size = max_size
+        self.tools: Dict[str, BatchStats] = {}
+        self._pending: Dict[Tuple[Any, ...], PendingBatch] = {}
+        self._running: Set["asyncio.Task[None]"] = set()
+
+    def wrap(
+        self,
+        tool_name: str,
+        batch_runner: BatchRunner,
+        auth_header_names: Optional[List[str]] = None,
+        window: Optional[float] = None,
+        max_size: Optional[int] = None,
+    ) -> ToolRunner:
+        window = self.window if window is None else window
+        max_size = max_size or self.max_size
+        stats = self.tools.setdefault(tool_name, BatchStats())
+
+        async def run(batch: PendingBatch) -> None:
+            try:
+                results = await batch_runner(batch.items, batch.credentials)
+                if len(results) != len(batch.items):
+                    raise ValueError(
+                        f"Batch function of '{tool_name}' returned {len(results)} "
+                        f"results for {len(batch.items)} calls"
+                    )
+            except Exception as e:
+                for future in batch.futures:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for future, result in zip(batch.futures, results):
+                if future.done():
+                    continue
+                # An exception in place of a result fails that call alone
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+        def flush(key: Tuple[Any, ...], batch: PendingBatch) -> None:
+            if self._pending.get(key) is batch:
+                del self._pending[key]
+            if batch.timer is not None:
+                batch.timer.cancel()
+            stats.batches += 1
+            stats.calls += len(batch.items)
+            stats.sizes.observe(len(batch.items))
+            task = asyncio.get_running_loop().create_task(run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+        async def run_batched(full_params: Dict[str, Any]) -> Any:
+            loop = asyncio.get_running_loop()
+            credentials = batch_credentials(full_params, auth_header_names or [])
+            # Batches are per loop too, their futures can only be awaited on it
+            key = (
+                tool_name,
+                loop,
+                json.dumps(credentials, sort_keys=True, default=str),
+            )
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = PendingBatch(credentials)
+                batch.timer = loop.call_later(window, flush, key, batch)
+            future = loop.create_future()
+            batch.items.append(
+                {k: v for k, v in full_params.items() if k not in AUTH_INPUT_KEYS}
+            )
+            batch.futures.append(future)
+            if len(batch.items) >= max_size:
+                stats.full += 1
+                flush(key, batch)
+            return await future
+
+        return run_batched
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": sum(stats.batches for stats in self.tools.values()),
+            "calls": sum(stats.calls for stats in self.tools.values()),
+            "pending": sum(len(batch.items) for batch in self._pending.values()),
+            "tools": {
+                name: {
+                    "batches": stats.batches,
+                    "calls": stats.calls,
+                    "full": stats.full,
+                    "mean_size": round(stats.calls / stats.batches, 2)
+                    if stats.batches
+                    else 0,
+                }
+                for name, stats in sorted(self.tools.items())
+            },
+        }
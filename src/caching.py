@@ -0,0 +1,263 @@
+import asyncio
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from executors import ToolRunner
+
+AUTH_KEY_MODES = ("hash", "exclude")
+
+
+class CacheBackend(ABC):
+    """Stores pickled tool results by key; subclass it to plug in a shared store."""
+
+    evictions: int = 0
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    @abstractmethod
+    async def clear(self) -> None: ...
+
+    def size(self) -> Dict[str, int]:
+        return {}
+
+
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, key: str) -> None:
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        if self.max_bytes is not None and len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    async def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def size(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self._bytes}
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Local stand-in for a shared store such as Redis.
+
+    Every worker process pointing at the same file sees the same entries.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kithub_cache ("
+                "key TEXT PRIMARY KEY, value BLOB, expires_at REAL, accessed_at REAL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # sqlite3 blocks, so the async methods run these in a thread
+    def _get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM kithub_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM kithub_cache WHERE key = ?", (key,))
+                return None
+            conn.execute(
+                "UPDATE kithub_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            return row[0]
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO kithub_cache VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            (count,) = conn.execute("SELECT COUNT(*) FROM kithub_cache").fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM kithub_cache WHERE key IN "
+                    "(SELECT key FROM kithub_cache ORDER BY accessed_at LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                self.evictions += count - self.max_entries
+
+    def _clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM kithub_cache")
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def clear(self) -> None:
+        await asyncio.to_thread(self._clear)
+
+    def size(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM kithub_cache").fetchone()
+        return {"entries": count}
+
+
+def is_cacheable_result(result: Any) -> bool:
+    # OpenAPI operations report upstream failures as an error dict instead of raising
+    return not (
+        isinstance(result, dict) and "error" in result and "status_code" in result
+    )
+
+
+def make_call_key(
+    tool_name: str,
+    full_params: Dict[str, Any],
+    auth_header_names: List[str],
+    auth_key: str = "hash",
+    all_headers: bool = False,
+) -> str:
+    """
+    Key of a call, its credentials included unless ``auth_key`` is ``"exclude"``.
+
+    Only the ``auth_header_names`` headers are credentials, or every header with
+    ``all_headers``.
+    """
+    params = {
+        k: v for k, v in full_params.items() if k not in ("auth_headers", "auth_params")
+    }
+    key: Dict[str, Any] = {"tool": tool_name, "params": params}
+    if auth_key == "hash":
+        auth_headers = full_params.get("auth_headers", {})
+        if not all_headers:
+            auth_headers = [auth_headers.get(name.lower()) for name in auth_header_names]
+        key["auth"] = hashlib.sha256(
+            json.dumps(
+                [auth_headers, full_params.get("auth_params", {})],
+                sort_keys=True,
+                default=str,
+            ).encode()
+        ).hexdigest()
+    encoded = json.dumps(key, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResultCache:
+    def __init__(
+        self,
+        backend: Optional[CacheBackend] = None,
+        ttl: float = 60.0,
+        auth_key: str = "hash",
+        cache_if: Callable[[Any], bool] = is_cacheable_result,
+    ):
+        if auth_key not in AUTH_KEY_MODES:
+            raise ValueError(f"Invalid auth_key '{auth_key}', expected {AUTH_KEY_MODES}")
+        self.backend = backend or MemoryCacheBackend()
+        self.ttl = ttl
+        self.auth_key = auth_key
+        self.cache_if = cache_if
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.misses: Dict[str, int] = defaultdict(int)
+
+    def wrap(
+        self,
+        tool_name: str,
+        runner: ToolRunner,
+        auth_header_names: Optional[List[str]] = None,
+        ttl: Optional[float] = None,
+        all_headers: bool = False,
+    ) -> ToolRunner:
+        ttl = self.ttl if ttl is None else ttl
+
+        async def run_cached(full_params: Dict[str, Any]) -> Any:
+            key = make_call_key(
+                tool_name,
+                full_params,
+                auth_header_names or [],
+                self.auth_key,
+                all_headers,
+            )
+            cached = await self.backend.get(key)
+            if cached is not None:
+                self.hits[tool_name] += 1
+                return pickle.loads(cached)
+
+            self.misses[tool_name] += 1
+            result = await runner(full_params)
+            if ttl > 0 and self.cache_if(result):
+                try:
+                    value = pickle.dumps(result)
+                except Exception:
+                    return result
+                await self.backend.set(key, value, ttl)
+            return result
+
+        return run_cached
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": sum(self.hits.values()),
+            "misses": sum(self.misses.values()),
+            "evictions": self.backend.evictions,
+            **self.backend.size(),
+            "tools": {
+                name: {"hits": self.hits[name], "misses": self.misses[name]}
+                for name in sorted(set(self.hits) | set(self.misses))
+            },
+        }
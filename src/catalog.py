@@ -0,0 +1,167 @@
+import bisect
+import gzip
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from fastapi.responses import Response
+
+from serialization import dumps
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Bodies below this size aren't worth compressing
+MIN_COMPRESS_SIZE = 256
+MAX_FILTERED_BODIES = 256
+
+
+def accepted_encodings(header: str) -> Set[str]:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        params = params.strip()
+        quality = 1.0
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Weak comparison, the same catalog sent gzipped or not is still the same catalog
+    return any(
+        tag.strip().removeprefix("W/") == etag.removeprefix("W/")
+        for tag in header.split(",")
+    )
+
+
+class EncodedBody:
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        self.encoded: Dict[str, bytes] = {}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            self.encoded["gzip"] = gzip.compress(body, compresslevel=6, mtime=0)
+            if brotli is not None:
+                self.encoded["br"] = brotli.compress(body)
+
+    def negotiate(self, accept_encoding: str) -> Tuple[Optional[str], bytes]:
+        if self.encoded and accept_encoding:
+            accepted = accepted_encodings(accept_encoding)
+            for encoding in ("br", "gzip"):
+                if encoding in self.encoded and encoding in accepted:
+                    return encoding, self.encoded[encoding]
+        return None, self.body
+
+
+class Catalog:
+    """
+    A tool catalog encoded once and served as is.
+
+    Responses carry an ``ETag`` so polling clients get a 304 while nothing changed,
+    and are precompressed for clients accepting gzip (or brotli when installed).
+    Filtering by name prefix or tag goes through indexes built with the catalog,
+    each filtered body is encoded once and then reused.
+    """
+
+    def __init__(
+        self,
+        entries: Sequence[Dict[str, Any]],
+        tags: Optional[Sequence[Iterable[str]]] = None,
+        groups: Optional[Sequence[str]] = None,
+        max_age: int = 0,
+    ):
+        self.entries = list(entries)
+        self.tags = [list(entry_tags or ()) for entry_tags in tags or ()] or [
+            [] for _ in self.entries
+        ]
+        self.groups = list(groups) if groups is not None else None
+        self.cache_control = f"max-age={max_age}" if max_age else "no-cache"
+        self._names = sorted(
+            (entry["name"], i) for i, entry in enumerate(self.entries)
+        )
+        self._tags: Dict[str, List[int]] = {}
+        for i, entry_tags in enumerate(self.tags):
+            for tag in entry_tags:
+                self._tags.setdefault(tag, []).append(i)
+        self._full = EncodedBody(self._encode(range(len(self.entries))))
+        self._filtered: Dict[Tuple[str, Tuple[str, ...]], EncodedBody] = {}
+        self._lock = threading.Lock()
+
+    def _encode(self, indices: Iterable[int]) -> bytes:
+        if self.groups is None:
+            return dumps([self.entries[i] for i in indices])
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for i in indices:
+            grouped.setdefault(self.groups[i], []).append(self.entries[i])
+        return dumps(grouped)
+
+    def select(self, prefix: Optional[str] = None, tags: Sequence[str] = ()) -> List[int]:
+        """Catalog positions of the entries matching the prefix and any of the tags."""
+        selected = None
+        if prefix:
+            start = bisect.bisect_left(self._names, (prefix,))
+            selected = set()
+            for name, i in self._names[start:]:
+                if not name.startswith(prefix):
+                    break
+                selected.add(i)
+        if tags:
+            tagged = {i for tag in tags for i in self._tags.get(tag, ())}
+            selected = tagged if selected is None else selected & tagged
+        if selected is None:
+            return list(range(len(self.entries)))
+        return sorted(selected)
+
+    def body(self, prefix: Optional[str] = None, tags: Sequence[str] = ()) -> EncodedBody:
+        if not prefix and not tags:
+            return self._full
+        key = (prefix or "", tuple(sorted(tags)))
+        body = self._filtered.get(key)
+        if body is None:
+            body = EncodedBody(self._encode(self.select(prefix, tags)))
+            with self._lock:
+                if len(self._filtered) >= MAX_FILTERED_BODIES:
+                    self._filtered.clear()
+                self._filtered[key] = body
+        return body
+
+    def response(
+        self,
+        headers: Any,
+        prefix: Optional[str] = None,
+        tags: Optional[Sequence[str]] = None,
+    ) -> Response:
+        body = self.body(prefix, tags or ())
+        response_headers = {
+            "ETag": body.etag,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(headers.get("if-none-match", ""), body.etag):
+            return Response(status_code=304, headers=response_headers)
+        encoding, content = body.negotiate(headers.get("accept-encoding", ""))
+        if encoding is not None:
+            response_headers["Content-Encoding"] = encoding
+        return Response(content, media_type="application/json", headers=response_headers)
+
+
+def merge_catalogs(catalogs: Sequence[Tuple[str, Catalog]], max_age: int = 0) -> Catalog:
+    """One catalog of several kits' tools, grouped by kit prefix."""
+    entries: List[Dict[str, Any]] = []
+    tags: List[List[str]] = []
+    groups: List[str] = []
+    for group, catalog in catalogs:
+        entries.extend(catalog.entries)
+        tags.extend(catalog.tags)
+        groups.extend([group] * len(catalog.entries))
+    return Catalog(entries, tags, groups, max_age)
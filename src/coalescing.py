@@ -0,0 +1,71 @@
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from caching import AUTH_KEY_MODES, make_call_key
+from executors import ToolRunner
+
+
+class SingleFlight:
+    """
+    Shares one execution between concurrent calls with the same tool and params.
+
+    Unlike ResultCache nothing outlives the call: once the shared execution finishes
+    the next call runs the tool again.
+    """
+
+    def __init__(self, auth_key: str = "hash"):
+        if auth_key not in AUTH_KEY_MODES:
+            raise ValueError(f"Invalid auth_key '{auth_key}', expected {AUTH_KEY_MODES}")
+        self.auth_key = auth_key
+        self.executions: Dict[str, int] = defaultdict(int)
+        self.coalesced: Dict[str, int] = defaultdict(int)
+        self._in_flight: Dict[str, "asyncio.Task[Any]"] = {}
+
+    def _forget(self, key: str, task: "asyncio.Task[Any]") -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()  # mark as retrieved when every waiter went away
+
+    def wrap(
+        self,
+        tool_name: str,
+        runner: ToolRunner,
+        auth_header_names: Optional[List[str]] = None,
+        all_headers: bool = False,
+    ) -> ToolRunner:
+        async def run_coalesced(full_params: Dict[str, Any]) -> Any:
+            key = make_call_key(
+                tool_name,
+                full_params,
+                auth_header_names or [],
+                self.auth_key,
+                all_headers,
+            )
+            loop = asyncio.get_running_loop()
+            task = self._in_flight.get(key)
+            if task is not None and task.get_loop() is loop:
+                self.coalesced[tool_name] += 1
+            else:
+                task = loop.create_task(runner(full_params))
+                task.add_done_callback(lambda done: self._forget(key, done))
+                self._in_flight[key] = task
+                self.executions[tool_name] += 1
+            return await asyncio.shield(task)
+
+        return run_coalesced
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "executions": sum(self.executions.values()),
+            "coalesced": sum(self.coalesced.values()),
+            "in_flight": len(self._in_flight),
+            "tools": {
+                name: {
+                    "executions": self.executions[name],
+                    "coalesced": self.coalesced[name],
+                }
+                for name in sorted(set(self.executions) | set(self.coalesced))
+            },
+        }
@@ -0,0 +1,204 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import pickle
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+EXECUTION_MODES = ("thread", "process", "inline")
+
+ToolRunner = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class ToolExecutor:
+    """
+    Dispatches tool calls so blocking tools never run on the event loop.
+
+    Sync tools go to a bounded thread pool (or a process pool for CPU-bound tools),
+    tools with a native coroutine are awaited directly and ``inline`` keeps the old
+    behaviour of calling ``invoke`` on the loop.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_process_workers: Optional[int] = None,
+    ):
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.max_process_workers = max_process_workers or os.cpu_count() or 1
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._in_flight = {mode: 0 for mode in EXECUTION_MODES}
+        self._running_threads = 0
+
+    def _get_pool(self, mode: str) -> Executor:
+        with self._lock:
+            if mode == "process":
+                if self._process_pool is None:
+                    self._process_pool = ProcessPoolExecutor(
+                        max_workers=self.max_process_workers
+                    )
+                return self._process_pool
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="kithub-tool"
+                )
+            return self._thread_pool
+
+    def _run_in_thread(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            self._running_threads += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running_threads -= 1
+
+    @contextmanager
+    def _tracking(self, mode: str) -> Iterator[None]:
+        with self._lock:
+            self._in_flight[mode] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight[mode] -= 1
+
+    async def submit(self, mode: str, func: Callable[..., Any], **kwargs: Any) -> Any:
+        """
+        Run ``func`` in the pool for ``mode`` and return its result.
+
+        Cancelling the call only returns once ``func`` has, since a running thread or
+        process can't be interrupted, so callers hold their slots until then.
+        """
+        pool = self._get_pool(mode)
+        if mode == "process":
+            call = functools.partial(func, **kwargs)
+        else:
+            ctx = contextvars.copy_context()
+            call = functools.partial(ctx.run, self._run_in_thread, func, **kwargs)
+        with self._tracking(mode):
+            concurrent_future = pool.submit(call)
+            future = asyncio.wrap_future(concurrent_future)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not concurrent_future.cancel():
+                    await asyncio.wait({future})
+                raise
+
+    def create_runner(
+        self, tool: Any, mode: str = "thread", validated: bool = False
+    ) -> ToolRunner:
+        """
+        Runner calling ``tool`` with a call's params.
+
+        With ``validated`` the params were checked against the tool's ``args_schema``
+        already, and tools offering a ``validated_call`` get them through it.
+        """
+        if mode not in EXECUTION_MODES:
+            raise ValueError(
+                f"Invalid execution mode '{mode}' for tool {tool.name}, "
+                f"expected one of {EXECUTION_MODES}"
+            )
+
+        validated_call = getattr(tool, "validated_call", None) if validated else None
+        if validated_call is not None and mode != "process":
+            return self._create_validated_runner(validated_call, mode)
+
+        if mode == "process":
+            func = getattr(tool, "func", None)
+            if func is None:
+                raise ValueError(f"Tool {tool.name} has no sync function to run")
+            try:
+                pickle.dumps(func)
+            except Exception as e:
+                raise ValueError(
+                    f"Tool {tool.name} must be a picklable module-level function "
+                    f"to run in process mode: {e}"
+                )
+            arg_names = set(tool.args)
+
+            async def run_in_process(params: Dict[str, Any]) -> Any:
+                kwargs = {k: v for k, v in params.items() if k in arg_names}
+                return await self.submit("process", func, **kwargs)
+
+            return run_in_process
+
+        if getattr(tool, "coroutine", None) is not None:
+
+            async def run_async(params: Dict[str, Any]) -> Any:
+                with self._tracking("inline"):
+                    return await tool.ainvoke(input=params)
+
+            return run_async
+
+        if mode == "inline":
+
+            async def run_inline(params: Dict[str, Any]) -> Any:
+                with self._tracking("inline"):
+                    return tool.invoke(input=params)
+
+            return run_inline
+
+        async def run_in_thread(params: Dict[str, Any]) -> Any:
+            return await self.submit("thread", tool.invoke, input=params)
+
+        return run_in_thread
+
+    def _create_validated_runner(
+        self, validated_call: Callable[[Dict[str, Any]], Any], mode: str
+    ) -> ToolRunner:
+        if inspect.iscoroutinefunction(validated_call):
+
+            async def run_validated_async(params: Dict[str, Any]) -> Any:
+                with self._tracking("inline"):
+                    return await validated_call(params)
+
+            return run_validated_async
+
+        if mode == "inline":
+
+            async def run_validated_inline(params: Dict[str, Any]) -> Any:
+                with self._tracking("inline"):
+                    return validated_call(params)
+
+            return run_validated_inline
+
+        async def run_validated_in_thread(params: Dict[str, Any]) -> Any:
+            return await self.submit("thread", validated_call, params=params)
+
+        return run_validated_in_thread
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            thread_in_flight = self._in_flight["thread"]
+            process_in_flight = self._in_flight["process"]
+            return {
+                "thread": {
+                    "pool_size": self.max_workers,
+                    "in_flight": thread_in_flight,
+                    "running": self._running_threads,
+                    "queue_depth": max(0, thread_in_flight - self._running_threads),
+                },
+                "process": {
+                    "pool_size": self.max_process_workers,
+                    "in_flight": process_in_flight,
+                    "queue_depth": max(0, process_in_flight - self.max_process_workers),
+                },
+                "inline": {"in_flight": self._in_flight["inline"]},
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pools = [self._thread_pool, self._process_pool]
+            self._thread_pool = None
+            self._process_pool = None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
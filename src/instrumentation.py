@@ -0,0 +1,446 @@
+import bisect
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from executors import ToolRunner
+from streaming import ToolStreamer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Set while an instrumented tool runs, so upstream calls made on its behalf are timed
+current_instrumentation: contextvars.ContextVar[Optional["Instrumentation"]] = (
+    contextvars.ContextVar("kithub_instrumentation", default=None)
+)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total = 0
+        rows = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            rows.append(("+Inf" if bound == float("inf") else repr(bound), total))
+        return rows
+
+
+class ToolStats:
+    def __init__(self, buckets: Sequence[float]):
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.duration = Histogram(buckets)
+
+
+def payload_size(value: Any) -> int:
+    if isinstance(value, bytes):
+        return len(value)
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def observe_upstream(
+    method: str, url: str, status: Optional[int], seconds: float
+) -> None:
+    instrumentation = current_instrumentation.get()
+    if instrumentation is not None:
+        instrumentation.observe_upstream(method, url, status, seconds)
+
+
+class Instrumentation:
+    """
+    Per-tool call metrics plus optional tracing spans.
+
+    ``tracer`` is anything with an OpenTelemetry-style ``start_span(name, attributes)``
+    returning a span with ``set_attribute``, ``record_exception`` and ``end``.
+    Kits created without instrumentation don't wrap their runners at all.
+    """
+
+    def __init__(
+        self,
+        tracer: Optional[Any] = None,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        record_payload_sizes: bool = True,
+    ):
+        self.tracer = tracer
+        self.buckets = tuple(sorted(buckets))
+        self.record_payload_sizes = record_payload_sizes
+        self.tools: Dict[Tuple[str, str], ToolStats] = {}
+        self.upstream_requests: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self.upstream_duration: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, kit: str, tool_name: str, runner: ToolRunner) -> ToolRunner:
+        stats = self.tools.setdefault((kit, tool_name), ToolStats(self.buckets))
+
+        async def run_instrumented(full_params: Dict[str, Any]) -> Any:
+            span = None
+            if self.tracer is not None:
+                span = self.tracer.start_span(
+                    f"kithub.tool {tool_name}",
+                    attributes={"kithub.kit": kit, "kithub.tool": tool_name},
+                )
+            if self.record_payload_sizes:
+                stats.request_bytes += payload_size(
+                    {
+                        k: v
+                        for k, v in full_params.items()
+                        if k not in ("auth_headers", "auth_params")
+                    }
+                )
+            stats.calls += 1
+            stats.in_flight += 1
+            token = current_instrumentation.set(self)
+            start = time.perf_counter()
+            try:
+                result = await runner(full_params)
+            except BaseException as e:
+                stats.errors += 1
+                if span is not None:
+                    span.record_exception(e)
+                    span.set_attribute("error", True)
+                raise
+            finally:
+                stats.duration.observe(time.perf_counter() - start)
+                stats.in_flight -= 1
+                current_instrumentation.reset(token)
+                if span is not None:
+                    span.end()
+            if self.record_payload_sizes:
+                stats.response_bytes += payload_size(result)
+            return result
+
+        return run_instrumented
+
+    def wrap_stream(
+        self, kit: str, tool_name: str, streamer: ToolStreamer
+    ) -> ToolStreamer:
+        """Like ``wrap``, timing the whole stream and counting its chunks' sizes."""
+        stats = self.tools.setdefault((kit, tool_name), ToolStats(self.buckets))
+
+        async def stream_instrumented(full_params: Dict[str, Any]) -> AsyncIterator[Any]:
+            span = None
+            if self.tracer is not None:
+                span = self.tracer.start_span(
+                    f"kithub.stream {tool_name}",
+                    attributes={"kithub.kit": kit, "kithub.tool": tool_name},
+                )
+            if self.record_payload_sizes:
+                stats.request_bytes += payload_size(
+                    {
+                        k: v
+                        for k, v in full_params.items()
+                        if k not in ("auth_headers", "auth_params")
+                    }
+                )
+            stats.calls += 1
+            stats.in_flight += 1
+            start = time.perf_counter()
+            try:
+                async for chunk in streamer(full_params):
+                    if self.record_payload_sizes:
+                        stats.response_bytes += payload_size(chunk)
+                    yield chunk
+            except BaseException as e:
+                if not isinstance(e, GeneratorExit):
+                    stats.errors += 1
+                    if span is not None:
+                        span.record_exception(e)
+                        span.set_attribute("error", True)
+                raise
+            finally:
+                stats.duration.observe(time.perf_counter() - start)
+                stats.in_flight -= 1
+                if span is not None:
+                    span.end()
+
+        return stream_instrumented
+
+    def observe_upstream(
+        self, method: str, url: str, status: Optional[int], seconds: float
+    ) -> None:
+        host = urlsplit(url).netloc or url
+        method = method.upper()
+        # Sync OpenAPI operations report from worker threads
+        with self._lock:
+            self.upstream_requests[(method, host, str(status or "error"))] += 1
+            histogram = self.upstream_duration.get((method, host))
+            if histogram is None:
+                histogram = self.upstream_duration[(method, host)] = Histogram(
+                    self.buckets
+                )
+            histogram.observe(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tools": {
+                f"{kit}/{tool}": {
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "in_flight": stats.in_flight,
+                    "duration_sum": round(stats.duration.sum, 6),
+                    "request_bytes": stats.request_bytes,
+                    "response_bytes": stats.response_bytes,
+                }
+                for (kit, tool), stats in sorted(self.tools.items())
+            },
+            "upstream": {
+                f"{method} {host} {status}": count
+                for (method, host, status), count in sorted(
+                    self.upstream_requests.items()
+                )
+            },
+        }
+
+    def collect(self) -> Iterable["Metric"]:
+        tools = sorted(self.tools.items())
+        yield Metric(
+            "kithub_tool_calls_total",
+            "counter",
+            "Tool calls started.",
+            [({"kit": k, "tool": t}, s.calls) for (k, t), s in tools],
+        )
+        yield Metric(
+            "kithub_tool_errors_total",
+            "counter",
+            "Tool calls that raised.",
+            [({"kit": k, "tool": t}, s.errors) for (k, t), s in tools],
+        )
+        yield Metric(
+            "kithub_tool_in_flight",
+            "gauge",
+            "Tool calls currently running.",
+            [({"kit": k, "tool": t}, s.in_flight) for (k, t), s in tools],
+        )
+        yield Metric.histogram(
+            "kithub_tool_duration_seconds",
+            "Tool call latency.",
+            [({"kit": k, "tool": t}, s.duration) for (k, t), s in tools],
+        )
+        if self.record_payload_sizes:
+            yield Metric(
+                "kithub_tool_request_bytes_total",
+                "counter",
+                "JSON size of tool parameters.",
+                [({"kit": k, "tool": t}, s.request_bytes) for (k, t), s in tools],
+            )
+            yield Metric(
+                "kithub_tool_response_bytes_total",
+                "counter",
+                "JSON size of tool results.",
+                [({"kit": k, "tool": t}, s.response_bytes) for (k, t), s in tools],
+            )
+        with self._lock:
+            requests = sorted(self.upstream_requests.items())
+            durations = sorted(self.upstream_duration.items())
+        if requests:
+            yield Metric(
+                "kithub_upstream_requests_total",
+                "counter",
+                "HTTP requests made by OpenAPI tools.",
+                [
+                    ({"method": m, "host": h, "status": s}, count)
+                    for (m, h, s), count in requests
+                ],
+            )
+            yield Metric.histogram(
+                "kithub_upstream_duration_seconds",
+                "HTTP request latency of OpenAPI tools.",
+                [({"method": m, "host": h}, hist) for (m, h), hist in durations],
+            )
+
+
+class Metric:
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        help: str,
+        samples: List[Tuple[Dict[str, str], float]],
+    ):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.samples = samples
+
+    @classmethod
+    def histogram(
+        cls, name: str, help: str, histograms: List[Tuple[Dict[str, str], Histogram]]
+    ) -> "Metric":
+        samples: List[Tuple[Dict[str, str], float]] = []
+        for labels, histogram in histograms:
+            for bound, count in histogram.cumulative():
+                samples.append(({**labels, "le": bound, "__suffix__": "_bucket"}, count))
+            samples.append(({**labels, "__suffix__": "_sum"}, histogram.sum))
+            samples.append(({**labels, "__suffix__": "_count"}, histogram.count))
+        return cls(name, "histogram", help, samples)
+
+
+def escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_prometheus(metrics: Iterable[Metric]) -> str:
+    # Samples of one metric must be contiguous, even when several kits report it
+    families: Dict[str, Metric] = {}
+    for metric in metrics:
+        if metric.name in families:
+            families[metric.name].samples.extend(metric.samples)
+        else:
+            families[metric.name] = Metric(
+                metric.name, metric.kind, metric.help, list(metric.samples)
+            )
+
+    lines = []
+    for metric in families.values():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, value in metric.samples:
+            labels = dict(labels)
+            name = metric.name + labels.pop("__suffix__", "")
+            label_text = ",".join(f'{k}="{escape_label(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+JOB_OUTCOMES = ("submitted", "rejected", "succeeded", "failed", "cancelled")
+
+
+def collect_kit_metrics(kit: str, router: Any) -> Iterable[Metric]:
+    """Gauges and counters the kit already keeps: executor, cache and coalescing."""
+    executor_stats = router.executor.stats()
+    for gauge in ("in_flight", "queue_depth"):
+        yield Metric(
+            f"kithub_executor_{gauge}",
+            "gauge",
+            f"Executor {gauge.replace('_', ' ')} per pool.",
+            [
+                ({"kit": kit, "pool": pool}, stats[gauge])
+                for pool, stats in executor_stats.items()
+                if gauge in stats
+            ],
+        )
+
+    cache = getattr(router, "cache", None)
+    if cache is not None:
+        cache_stats = cache.stats()
+        for field in ("hits", "misses"):
+            yield Metric(
+                f"kithub_cache_{field}_total",
+                "counter",
+                f"Result cache {field}.",
+                [
+                    ({"kit": kit, "tool": tool}, stats[field])
+                    for tool, stats in cache_stats["tools"].items()
+                ],
+            )
+        yield Metric(
+            "kithub_cache_evictions_total",
+            "counter",
+            "Result cache evictions.",
+            [({"kit": kit}, cache_stats["evictions"])],
+        )
+        if "entries" in cache_stats:
+            yield Metric(
+                "kithub_cache_entries",
+                "gauge",
+                "Result cache entries.",
+                [({"kit": kit}, cache_stats["entries"])],
+            )
+
+    single_flight = getattr(router, "single_flight", None)
+    if single_flight is not None:
+        flight_stats = single_flight.stats()
+        for field in ("executions", "coalesced"):
+            yield Metric(
+                f"kithub_single_flight_{field}_total",
+                "counter",
+                f"Single-flight {field}.",
+                [
+                    ({"kit": kit, "tool": tool}, stats[field])
+                    for tool, stats in flight_stats["tools"].items()
+                ],
+            )
+
+    batcher = getattr(router, "batcher", None)
+    if batcher is not None:
+        batches = sorted(batcher.tools.items())
+        yield Metric.histogram(
+            "kithub_batch_size",
+            "Calls per batch sent to batch-capable tools.",
+            [({"kit": kit, "tool": t}, s.sizes) for t, s in batches],
+        )
+        yield Metric(
+            "kithub_batch_full_total",
+            "counter",
+            "Batches sent because they reached their maximum size.",
+            [({"kit": kit, "tool": t}, s.full) for t, s in batches],
+        )
+
+    jobs = getattr(router, "jobs", None)
+    if jobs is not None:
+        job_stats = jobs.stats()
+        yield Metric(
+            "kithub_jobs_total",
+            "counter",
+            "Background jobs by outcome.",
+            [
+                ({"kit": kit, "status": status}, job_stats[status])
+                for status in JOB_OUTCOMES
+            ],
+        )
+        for gauge in ("queued", "running"):
+            yield Metric(
+                f"kithub_jobs_{gauge}",
+                "gauge",
+                f"Background jobs {gauge}.",
+                [({"kit": kit}, job_stats[gauge])],
+            )
+
+
+def collect_guard_metrics(guards: Iterable[Any]) -> Iterable[Metric]:
+    """Counters and circuit state of upstream guards, each guard listed once."""
+    guards = list(guards)
+    for field in ("retries", "rate_limited", "short_circuited"):
+        yield Metric(
+            f"kithub_upstream_{field}_total",
+            "counter",
+            f"Upstream calls {field.replace('_', ' ')} by the guard.",
+            [({"upstream": guard.name}, guard.counters[field]) for guard in guards],
+        )
+    breakers = [(guard.name, guard.breaker) for guard in guards if guard.breaker]
+    if breakers:
+        yield Metric(
+            "kithub_upstream_circuit_state",
+            "gauge",
+            "Circuit state per upstream: 0 closed, 1 half-open, 2 open.",
+            [
+                ({"upstream": name}, breaker.states.index(breaker.state))
+                for name, breaker in breakers
+            ],
+        )
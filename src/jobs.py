@@ -0,0 +1,317 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+from executors import ToolRunner
+from limits import ToolOverloaded, ToolUnavailable
+from streaming import ByteStream
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATES = ("succeeded", "failed", "cancelled")
+
+
+def job_owner(
+    headers: Mapping[str, str],
+    query_params: Mapping[str, str],
+    auth_header_names: List[str],
+) -> str:
+    """A hash of the caller's credentials, only the same caller may see the job."""
+    if not auth_header_names:
+        return ""
+    # API keys may be sent as query params instead of headers
+    values = [[headers.get(name), query_params.get(name)] for name in auth_header_names]
+    return hashlib.sha256(json.dumps(values).encode()).hexdigest()
+
+
+class JobBackend(ABC):
+    """
+    Stores job records by id; subclass it to share them between processes.
+
+    Records are plain dicts, replaced as a whole on every update and holding the
+    tool's result once the job is done.
+    """
+
+    poll_interval: float = 0.1
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def set(
+        self, job_id: str, record: Dict[str, Any], ttl: Optional[float] = None
+    ) -> None: ...
+
+    async def wait(self, job_id: str, status: str, timeout: float) -> None:
+        """Return once the job has left ``status``, or after ``timeout`` seconds."""
+        deadline = time.monotonic() + timeout
+        while True:
+            record = await self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if record is None or record["status"] != status or remaining <= 0:
+                return
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    def size(self) -> Dict[str, int]:
+        return {}
+
+
+class MemoryJobBackend(JobBackend):
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._waiters: Dict[str, Set[asyncio.Future]] = defaultdict(set)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(job_id)
+        if entry is None:
+            return None
+        expires_at, record = entry
+        if expires_at <= time.monotonic():
+            del self._entries[job_id]
+            return None
+        return record
+
+    async def set(
+        self, job_id: str, record: Dict[str, Any], ttl: Optional[float] = None
+    ) -> None:
+        expires_at = float("inf") if ttl is None else time.monotonic() + ttl
+        self._entries[job_id] = (expires_at, record)
+        self._entries.move_to_end(job_id)
+        if len(self._entries) > self.max_entries:
+            self._evict()
+        for waiter in self._waiters.pop(job_id, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for job_id in list(self._entries):
+            if len(self._entries) <= self.max_entries:
+                return
+            expires_at, record = self._entries[job_id]
+            # Queued and running jobs are never dropped, only expired or finished ones
+            if expires_at <= now or record["status"] in FINISHED_STATES:
+                del self._entries[job_id]
+
+    async def wait(self, job_id: str, status: str, timeout: float) -> None:
+        record = await self.get(job_id)
+        if record is None or record["status"] != status:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[job_id].add(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            waiters = self._waiters.get(job_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[job_id]
+
+    def size(self) -> Dict[str, int]:
+        return {"records": len(self._entries)}
+
+
+class JobManager:
+    """
+    Runs tool calls in the background for clients that poll for their results.
+
+    Submitted calls wait in a queue of at most ``max_queue`` jobs for one of
+    ``workers`` worker tasks, and a full queue turns new jobs away with 429. Finished
+    jobs are kept for ``ttl`` seconds. The queue lives in the process that accepted
+    the job, a shared ``backend`` lets clients poll any process for its record.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[JobBackend] = None,
+        workers: int = 4,
+        max_queue: int = 100,
+        ttl: float = 3600.0,
+        max_wait: float = 30.0,
+        retry_after: float = 1.0,
+    ):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.backend = backend or MemoryJobBackend()
+        self.workers = workers
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self.counters = {
+            "submitted": 0,
+            "rejected": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "cancelled": 0,
+        }
+        self._calls: Dict[str, Tuple[ToolRunner, Dict[str, Any]]] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._owners: Set[int] = set()
+
+    def attach(self, owner: Any) -> None:
+        """Register a kit using the manager, ``shutdown(owner)`` releases it."""
+        self._owners.add(id(owner))
+
+    def _ensure_workers(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._queue is None:
+            # Queues and tasks belong to one loop, jobs still queued move to the new one
+            queue: asyncio.Queue = asyncio.Queue()
+            while self._queue is not None and not self._queue.empty():
+                queue.put_nowait(self._queue.get_nowait())
+            self._queue = queue
+            self._loop = loop
+            self._worker_tasks = [
+                loop.create_task(self._work()) for _ in range(self.workers)
+            ]
+        return self._queue
+
+    async def submit(
+        self,
+        tool_name: str,
+        runner: ToolRunner,
+        full_params: Dict[str, Any],
+        owner: str = "",
+    ) -> Dict[str, Any]:
+        queue = self._ensure_workers()
+        if len(self._calls) >= self.max_queue:
+            self.counters["rejected"] += 1
+            raise ToolOverloaded(
+                f"Job queue is full ({self.max_queue} jobs)", retry_after=self.retry_after
+            )
+        job_id = uuid.uuid4().hex
+        self._calls[job_id] = (runner, full_params)
+        record = {
+            "id": job_id,
+            "tool": tool_name,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "owner": owner,
+        }
+        await self.backend.set(job_id, record)
+        self.counters["submitted"] += 1
+        queue.put_nowait(job_id)
+        return record
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()  # type: ignore
+            call = self._calls.pop(job_id, None)
+            if call is not None:
+                await self._run(job_id, *call)
+
+    async def _run(self, job_id: str, runner: ToolRunner, full_params: Dict[str, Any]):
+        record = await self.backend.get(job_id)
+        if record is None:
+            return
+        record = {**record, "status": "running", "started_at": time.time()}
+        await self.backend.set(job_id, record)
+        task = asyncio.ensure_future(runner(full_params))
+        self._running[job_id] = task
+        try:
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            await self._finish(job_id, record, "cancelled", error="Shut down")
+            raise
+        finally:
+            del self._running[job_id]
+
+        if task.cancelled():
+            await self._finish(job_id, record, "cancelled", error="Cancelled")
+            return
+        error = task.exception()
+        if isinstance(error, ToolUnavailable):
+            await self._finish(
+                job_id, record, "failed", error=str(error), status_code=error.status_code
+            )
+        elif error is not None:
+            logger.error(f"Error executing job of '{record['tool']}'", exc_info=error)
+            await self._finish(
+                job_id, record, "failed", error=str(error), status_code=500
+            )
+        elif isinstance(task.result(), ByteStream):
+            await task.result().aclose()
+            await self._finish(
+                job_id,
+                record,
+                "failed",
+                error=f"Function '{record['tool']}' streams its result "
+                "and can't run as a job",
+                status_code=400,
+            )
+        else:
+            await self._finish(job_id, record, "succeeded", result=task.result())
+
+    async def _finish(
+        self, job_id: str, record: Dict[str, Any], status: str, **fields: Any
+    ) -> Dict[str, Any]:
+        self.counters[status] += 1
+        record = {**record, **fields, "status": status, "finished_at": time.time()}
+        await self.backend.set(job_id, record, self.ttl)
+        return record
+
+    async def get(self, job_id: str, wait: float = 0.0) -> Optional[Dict[str, Any]]:
+        """The job's record, waiting up to ``wait`` seconds for it to finish."""
+        record = await self.backend.get(job_id)
+        deadline = time.monotonic() + min(wait, self.max_wait)
+        while record is not None and record["status"] not in FINISHED_STATES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await self.backend.wait(job_id, record["status"], remaining)
+            record = await self.backend.get(job_id)
+        return record
+
+    async def cancel(self, job_id: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """The job's record after cancelling it, and whether it could be cancelled."""
+        record = await self.backend.get(job_id)
+        if record is None or record["status"] in FINISHED_STATES:
+            return record, False
+        if self._calls.pop(job_id, None) is not None:
+            record = await self._finish(job_id, record, "cancelled", error="Cancelled")
+            return record, True
+        task = self._running.get(job_id)
+        if task is None:
+            # Running in another process
+            return record, False
+        task.cancel()
+        return await self.get(job_id, self.max_wait), True
+
+    def shutdown(self, owner: Any = None) -> None:
+        """Stop the workers once no ``owner`` uses them, or right away without one."""
+        if owner is not None:
+            self._owners.discard(id(owner))
+            if self._owners:
+                return
+        self._owners.clear()
+        for task in self._worker_tasks:
+            task.cancel()
+        self._worker_tasks = []
+        self._loop = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "queued": len(self._calls),
+            "running": len(self._running),
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            **self.backend.size(),
+        }
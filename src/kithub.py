@@ -1,25 +1,58 @@
+import asyncio
+import inspect
 import logging
 import re
 from collections import defaultdict
-from typing import Any, Callable, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
-from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+from fastapi import APIRouter, Body, Depends, FastAPI, HTTPException, Query, Request
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.openapi.utils import get_openapi
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import APIKeyHeader, HTTPBearer
 from langchain_core.tools import BaseTool, StructuredTool, Tool
-from langchain_core.utils.function_calling import convert_to_openai_function
-from pydantic import BaseModel, Field, ValidationError, create_model
+from pydantic import BaseModel, Field, ValidationError
 from pydantic.v1.error_wrappers import ValidationError as ValidationErrorV1
 
-from models import AuthenticatedTool
+from batching import MicroBatcher, create_batch_runner
+from caching import ResultCache
+from catalog import Catalog, merge_catalogs
+from coalescing import SingleFlight
+from executors import ToolExecutor
+from instrumentation import (
+    PROMETHEUS_CONTENT_TYPE,
+    Instrumentation,
+    collect_guard_metrics,
+    collect_kit_metrics,
+    render_prometheus,
+)
+from jobs import JobManager, job_owner
+from limits import ToolLimiter, ToolUnavailable
+from models import AuthenticatedTool, LazyTool, accepted_auth_keys
+from registry import KitRegistry
+from schemas import (
+    SchemaCache,
+    get_python_type,  # noqa: F401, kept importable from kithub
+    shared_schema_cache,
+)
+from serialization import FastJSONResponse, parse_raw
+from streaming import (
+    STREAM_FORMATS,
+    ByteStream,
+    create_streamer,
+    encode_chunk,
+    is_streaming_tool,
+)
+from workers import WorkerPool
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DISPATCH_MODES = ("routes", "table")
+
 tool_types = (AuthenticatedTool, StructuredTool, BaseTool, Tool)
 tool_types_types = Union[AuthenticatedTool, StructuredTool, BaseTool, Tool]
 
@@ -29,98 +62,450 @@ class FunctionRunRequest(BaseModel):
     params: Dict[str, Any]
 
 
-def get_python_type(openapi_type: str) -> Any:
-    type_mapping = {
-        "string": str,
-        "integer": int,
-        "number": float,
-        "boolean": bool,
-        "array": List,
-        "object": Dict,
+def format_validation_errors(
+    exc: Union[ValidationError, ValidationErrorV1, RequestValidationError],
+) -> Dict[str, List[str]]:
+    errors = defaultdict(list)
+    for error in exc.errors():
+        locs = error["loc"]
+        msg = error["msg"]
+        loc_str = ".".join(str(loc) for loc in locs if loc != "body")
+        errors[loc_str].append(msg)
+    return dict(errors)
+
+
+def build_tool_input(params: Dict[str, Any], request: Request) -> Dict[str, Any]:
+    return {
+        **params,
+        "auth_headers": dict(request.headers),
+        "auth_params": dict(request.query_params),
     }
-    return type_mapping.get(openapi_type, Any)
+
+
+def get_auth_dependencies(func: Any) -> Tuple[List[Any], List[str]]:
+    auth_dependencies = []
+    auth_header_names = []
+    for auth in getattr(func, "auth_requirements", None) or []:
+        if auth["type"] == "oauth2":
+            bearer_sec = HTTPBearer()
+            auth_dependencies.append(Depends(bearer_sec))
+            auth_header_names.append("Authorization")
+        elif auth["type"] == "apiKey":
+            api_key_scheme = APIKeyHeader(name=auth["name"])
+            auth_dependencies.append(Depends(api_key_scheme))
+            auth_header_names.append(auth["name"])
+        elif auth["type"] == "http":
+            # The Authorization header is forwarded upstream, it keys caches and jobs
+            if auth.get("scheme") == "bearer":
+                auth_dependencies.append(Depends(HTTPBearer()))
+            auth_header_names.append("Authorization")
+    return auth_dependencies, auth_header_names
+
+
+def reads_undeclared_headers(func: Any) -> bool:
+    """
+    Whether a tool takes ``auth_headers`` without declaring its auth requirements.
+
+    It may then look at any header, so every one of them tells callers apart.
+    """
+    if getattr(func, "auth_requirements", None):
+        return False
+    target = getattr(func, "coroutine", None) or getattr(func, "func", None)
+    return target is not None and "auth_headers" in accepted_auth_keys(target)
+
+
+def relay_stream(stream: ByteStream) -> StreamingResponse:
+    async def body():
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    headers = dict(stream.headers)
+    if stream.media_type:
+        # Set directly, media_type would append a charset to text/* types
+        headers["content-type"] = stream.media_type
+    return StreamingResponse(body(), status_code=stream.status_code, headers=headers)
+
+
+def render_result(result: Any, fast: bool) -> Any:
+    if isinstance(result, ByteStream):
+        return relay_stream(result)
+    if fast:
+        # Skips response model validation and jsonable_encoder entirely
+        return FastJSONResponse({"result": result})
+    return {"result": parse_raw(result)}
+
+
+async def run_tool(func_name: str, runner, full_params: Dict[str, Any], fast: bool):
+    try:
+        result = await runner(full_params)
+        return render_result(result, fast)
+    except (ValidationError, ValidationErrorV1) as e:
+        raise e
+    except ToolUnavailable as e:
+        raise HTTPException(e.status_code, detail=str(e), headers=e.headers)
+    except Exception as e:
+        logger.exception(f"Error executing function '{func_name}'")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def create_endpoint_function(func_name: str, runner, ParamModel, fast: bool = False):
+    async def run_specific_function(request: Request, params: ParamModel):
+        full_params = build_tool_input(params.model_dump(), request)
+        return await run_tool(func_name, runner, full_params, fast)
+
+    return run_specific_function
+
+
+def create_lazy_endpoint_function(func_name: str, resolve_target, fast: bool = False):
+    async def run_lazy_function(
+        request: Request, params: Dict[str, Any] = Body(default={})
+    ):
+        ParamModel, runner, _ = resolve_target(func_name)
+        full_params = build_tool_input(ParamModel(**params).model_dump(), request)
+        return await run_tool(func_name, runner, full_params, fast)
+
+    return run_lazy_function
+
+
+def get_stream_format(request: Request, format: Optional[str]) -> str:
+    if format:
+        return format
+    return "sse" if "text/event-stream" in request.headers.get("accept", "") else "ndjson"
+
+
+async def stream_tool(
+    func_name: str, streamer, full_params: Dict[str, Any], stream_format: str
+) -> StreamingResponse:
+    chunks = streamer(full_params)
+    # Wait for the first chunk so failures before any output get a status
+    try:
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = None
+        chunks = None
+    except (ValidationError, ValidationErrorV1) as e:
+        raise e
+    except ToolUnavailable as e:
+        raise HTTPException(e.status_code, detail=str(e), headers=e.headers)
+    except Exception as e:
+        logger.exception(f"Error executing function '{func_name}'")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def body():
+        if chunks is None:
+            yield encode_chunk({}, stream_format, event="end")
+            return
+        try:
+            yield encode_chunk(first_chunk, stream_format)
+            async for chunk in chunks:
+                yield encode_chunk(chunk, stream_format)
+            yield encode_chunk({}, stream_format, event="end")
+        except Exception as e:
+            logger.exception(f"Error streaming function '{func_name}'")
+            yield encode_chunk({"detail": str(e)}, stream_format, event="error")
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type=STREAM_FORMATS[stream_format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def create_stream_endpoint_function(func_name: str, streamer, ParamModel):
+    async def stream_specific_function(
+        request: Request,
+        params: ParamModel,
+        format: Optional[str] = Query(None, enum=list(STREAM_FORMATS)),
+    ):
+        full_params = build_tool_input(params.model_dump(), request)
+        return await stream_tool(
+            func_name, streamer, full_params, get_stream_format(request, format)
+        )
+
+    return stream_specific_function
+
+
+def create_dispatch_endpoint_functions(
+    resolve_target, resolve_streamer, fast: bool = False
+):
+    """Endpoints serving every tool of a kit through one route, found by name."""
+
+    def find_target(request: Request, function_name: str):
+        target = resolve_target(function_name)
+        if target is None:
+            raise HTTPException(404, detail=f"Function '{function_name}' not found")
+        # What the per-tool routes' security dependencies would have checked
+        if any(name not in request.headers for name in target[2]):
+            raise HTTPException(403, detail="Not authenticated")
+        return target
+
+    async def dispatch_function(
+        request: Request, function_name: str, params: Dict[str, Any] = Body(default={})
+    ):
+        ParamModel, runner, _ = find_target(request, function_name)
+        full_params = build_tool_input(ParamModel(**params).model_dump(), request)
+        return await run_tool(function_name, runner, full_params, fast)
+
+    async def dispatch_stream(
+        request: Request,
+        function_name: str,
+        params: Dict[str, Any] = Body(default={}),
+        format: Optional[str] = Query(None, enum=list(STREAM_FORMATS)),
+    ):
+        ParamModel, _, _ = find_target(request, function_name)
+        streamer = resolve_streamer(function_name)
+        if streamer is None:
+            raise HTTPException(404, detail=f"Function '{function_name}' doesn't stream")
+        full_params = build_tool_input(ParamModel(**params).model_dump(), request)
+        return await stream_tool(
+            function_name, streamer, full_params, get_stream_format(request, format)
+        )
+
+    return dispatch_function, dispatch_stream
 
 
 def create_kit(
-    tools: List[Union[tool_types_types, Callable]], prefix: str = "", **kwargs
+    tools: List[Union[tool_types_types, LazyTool, Callable]],
+    prefix: str = "",
+    execution_mode: str = "thread",
+    max_workers: Optional[int] = None,
+    max_process_workers: Optional[int] = None,
+    executor: Optional[ToolExecutor] = None,
+    batch_concurrency: int = 10,
+    max_batch_size: int = 100,
+    cache: Optional[ResultCache] = None,
+    single_flight: Optional[SingleFlight] = None,
+    instrumentation: Optional[Instrumentation] = None,
+    max_concurrency: Optional[int] = None,
+    max_queue: int = 0,
+    timeout: Optional[float] = None,
+    retry_after: float = 1.0,
+    fast_serialization: bool = False,
+    catalog_max_age: int = 0,
+    dispatch: str = "routes",
+    schema_cache: Optional[SchemaCache] = None,
+    validate_once: bool = True,
+    jobs: Optional[JobManager] = None,
+    workers: Optional[WorkerPool] = None,
+    batcher: Optional[MicroBatcher] = None,
+    **kwargs,
 ) -> APIRouter:
+    if dispatch not in DISPATCH_MODES:
+        raise ValueError(
+            f"Invalid dispatch '{dispatch}', expected one of {DISPATCH_MODES}"
+        )
     router = APIRouter(prefix=prefix, **kwargs)
+    if schema_cache is None:
+        schema_cache = shared_schema_cache
+    if executor is None:
+        executor = ToolExecutor(
+            max_workers=max_workers, max_process_workers=max_process_workers
+        )
+        router.add_event_handler("shutdown", executor.shutdown)
+    router.executor = executor  # type: ignore
+    router.cache = cache  # type: ignore
+    router.single_flight = single_flight  # type: ignore
+    router.instrumentation = instrumentation  # type: ignore
+    router.jobs = jobs  # type: ignore
+    router.workers = workers  # type: ignore
+    router.batcher = batcher  # type: ignore
+    # Pools and job managers may be shared with other kits, e.g. the next version
+    # of this one on reload, and keep running until every kit using them shut down
+    if workers is not None:
+        workers.start(router)
+        router.add_event_handler("startup", lambda: workers.start(router))
+        router.add_event_handler("shutdown", lambda: workers.shutdown(router))
+    if jobs is not None:
+        jobs.attach(router)
+        router.add_event_handler("startup", lambda: jobs.attach(router))
+        router.add_event_handler("shutdown", lambda: jobs.shutdown(router))
+    limiters: Dict[str, ToolLimiter] = {}
+    router.limiters = limiters  # type: ignore
+    upstream_guards = {
+        id(guard): guard
+        for guard in (getattr(func, "upstream_guard", None) for func in tools)
+        if guard is not None
+    }
+    router.upstream_guards = list(upstream_guards.values())  # type: ignore
     functions_list = []
+    function_tags = []
     function_dict: Dict[str, tool_types_types] = {}
+    targets: Dict[str, Any] = {}
+    lazy_tools: Dict[str, LazyTool] = {}
+    deferred: Dict[str, Tuple[Any, Dict[str, Any], List[str]]] = {}
+    streamers: Dict[str, Any] = {}
+    documented_routes: List[Tuple[Any, ...]] = []
     operation_ids = set()
 
+    def create_runner(
+        func_name: str, func: Any, auth_header_names: List[str], validated: bool
+    ):
+        tool_execution_mode = getattr(func, "execution_mode", None) or execution_mode
+        batch_func = getattr(func, "batch_func", None)
+        if workers is not None:
+            runner = workers.create_runner(func_name, validated)
+        elif batcher is not None and batch_func is not None:
+            runner = batcher.wrap(
+                func_name,
+                create_batch_runner(executor, batch_func),
+                auth_header_names,
+                window=getattr(func, "batch_window", None),
+                max_size=getattr(func, "batch_max_size", None),
+            )
+        else:
+            runner = executor.create_runner(func, tool_execution_mode, validated)
+        # Per-tool settings override the kit's, an explicit 0 queue included
+        tool_limits = {
+            name: default if getattr(func, name, None) is None else getattr(func, name)
+            for name, default in (
+                ("max_concurrency", max_concurrency),
+                ("max_queue", max_queue),
+                ("timeout", timeout),
+            )
+        }
+        if tool_limits["max_concurrency"] or tool_limits["timeout"]:
+            limiters[func_name] = ToolLimiter(
+                func_name, retry_after=retry_after, **tool_limits
+            )
+            runner = limiters[func_name].wrap(runner)
+        all_headers = reads_undeclared_headers(func)
+        if single_flight is not None and getattr(func, "coalesce", None):
+            runner = single_flight.wrap(func_name, runner, auth_header_names, all_headers)
+        if cache is not None and getattr(func, "cacheable", None):
+            runner = cache.wrap(
+                func_name,
+                runner,
+                auth_header_names,
+                ttl=getattr(func, "cache_ttl", None),
+                all_headers=all_headers,
+            )
+        if instrumentation is not None:
+            runner = instrumentation.wrap(prefix or "/", func_name, runner)
+        return runner
+
+    def build_target(
+        func_name: str,
+        func: Any,
+        parsed_func: Dict[str, Any],
+        auth_header_names: List[str],
+    ) -> None:
+        validated = validate_once and getattr(func, "validated_call", None) is not None
+        if validated:
+            # Calls are validated once, here, against the model the tool itself uses
+            ParamModel = func.args_schema
+        else:
+            ParamModel = schema_cache.param_model(func_name, parsed_func)
+        runner = create_runner(func_name, func, auth_header_names, validated)
+        targets[func_name] = (ParamModel, runner, auth_header_names)
+
+    def resolve_target(func_name: str):
+        if func_name in targets:
+            return targets[func_name]
+        if func_name in lazy_tools:
+            lazy_tool = lazy_tools.pop(func_name)
+            func = lazy_tool.materialize()
+            _, auth_header_names = get_auth_dependencies(func)
+            function_dict[func_name] = func
+            build_target(
+                func_name, func, schema_cache.openai_function(func), auth_header_names
+            )
+        elif func_name in deferred:
+            build_target(func_name, *deferred.pop(func_name))
+        return targets.get(func_name)
+
+    def create_limited_streamer(func_name: str, func: Any):
+        tool_execution_mode = getattr(func, "execution_mode", None) or execution_mode
+        streamer = create_streamer(executor, func, tool_execution_mode)
+        # Streams share the tool's limits with its plain calls
+        if func_name in limiters:
+            streamer = limiters[func_name].wrap_stream(streamer)
+        if instrumentation is not None:
+            streamer = instrumentation.wrap_stream(prefix or "/", func_name, streamer)
+        return streamer
+
+    def resolve_streamer(func_name: str):
+        if func_name not in streamers:
+            func = function_dict.get(func_name)
+            if resolve_target(func_name) is None or not is_streaming_tool(func):
+                return None
+            streamers[func_name] = create_limited_streamer(func_name, func)
+        return streamers[func_name]
+
+    def add_tool_routes(
+        target: APIRouter,
+        func_name: str,
+        func: Any,
+        auth_dependencies: List[Any],
+        operation_id: str,
+    ) -> None:
+        if isinstance(func, LazyTool):
+            ParamModel = None
+            endpoint_function = create_lazy_endpoint_function(
+                func_name, resolve_target, fast_serialization
+            )
+        else:
+            ParamModel, runner, _ = resolve_target(func_name)
+            # Create an endpoint for this specific function
+            endpoint_function = create_endpoint_function(
+                func_name, runner, ParamModel, fast_serialization
+            )
+
+        target.add_api_route(
+            f"/{func_name}",
+            endpoint_function,
+            methods=["POST"],
+            summary=func.description,
+            dependencies=auth_dependencies,
+            response_model=Dict[str, Any],
+            operation_id=operation_id,
+        )
+
+        # Assign the unique operation ID
+        endpoint_function.__name__ = operation_id
+
+        # Assign the docstring to the endpoint function for better documentation
+        endpoint_function.__doc__ = func.description
+
+        if is_streaming_tool(func):
+            stream_endpoint_function = create_stream_endpoint_function(
+                func_name, create_limited_streamer(func_name, func), ParamModel
+            )
+            target.add_api_route(
+                f"/{func_name}/stream",
+                stream_endpoint_function,
+                methods=["POST"],
+                summary=func.description,
+                dependencies=auth_dependencies,
+                response_class=StreamingResponse,
+                operation_id=f"{operation_id}_stream",
+            )
+            stream_endpoint_function.__name__ = f"{operation_id}_stream"
+            stream_endpoint_function.__doc__ = func.description
+
     for func in tools:
-        if isinstance(func, tool_types):
+        if isinstance(func, (LazyTool, *tool_types)):
             func_name = func.name
         elif callable(func):
             func_name = func.__name__
             if not func.__doc__:
                 raise ValueError(f"Function {func_name} must have a docstring")
+            # Coroutine and async generator functions can only be awaited or iterated
+            if inspect.iscoroutinefunction(func) or inspect.isasyncgenfunction(func):
+                callables = {"coroutine": func}
+            else:
+                callables = {"func": func}
             func = AuthenticatedTool.from_function(
-                name=func_name, func=func, description=func.__doc__
+                name=func_name, description=func.__doc__, **callables
             )
         else:
             raise ValueError(f"Invalid function type: {type(func)}")
 
-        auth_dependencies = []
-        if isinstance(func, AuthenticatedTool):
-            for auth in func.auth_requirements:
-                if auth["type"] == "oauth2":
-                    bearer_sec = HTTPBearer()
-                    auth_dependencies.append(Depends(bearer_sec))
-                elif auth["type"] == "apiKey":
-                    api_key_scheme = APIKeyHeader(name=auth["name"])
-                    auth_dependencies.append(Depends(api_key_scheme))
-
-        parsed_func = convert_to_openai_function(func)
-
-        functions_list.append(parsed_func)
-        function_dict[func_name] = func
-
-        # Create a Pydantic model for the function parameters
-        param_fields = {}
-        for param_name, param_info in (
-            parsed_func.get("parameters", {}).get("properties", {}).items()
-        ):
-            param_type = get_python_type(param_info.get("type", "string"))
-            param_description = param_info.get("description", "")
-            is_required = param_name in parsed_func.get("parameters", {}).get(
-                "required", []
-            )
-
-            if is_required:
-                param_fields[param_name] = (
-                    param_type,
-                    Field(..., description=param_description),
-                )
-            else:
-                param_fields[param_name] = (
-                    Optional[param_type],
-                    Field(None, description=param_description),
-                )
-
-        ParamModel = create_model(f"{func_name}Params", **param_fields)
-
-        def create_endpoint_function(func_name: str, func: tool_types_types, ParamModel):
-            async def run_specific_function(request: Request, params: ParamModel):
-                try:
-                    auth_headers = dict(request.headers)
-                    auth_params = dict(request.query_params)
-
-                    full_params = {
-                        **params.model_dump(),
-                        "auth_headers": auth_headers,
-                        "auth_params": auth_params,
-                    }
-                    result = func.invoke(input=full_params)
-                    return {"result": result}
-                except (ValidationError, ValidationErrorV1) as e:
-                    raise e
-                except Exception as e:
-                    logger.exception(f"Error executing function '{func_name}'")
-                    raise HTTPException(status_code=500, detail=str(e))
-
-            return run_specific_function
+        auth_dependencies, auth_header_names = get_auth_dependencies(func)
 
         # Generate a unique operation ID
         base_operation_id = re.sub(r"[^a-zA-Z0-9_]", "_", func_name.lower())
@@ -131,27 +516,220 @@ def create_kit(
             counter += 1
         operation_ids.add(operation_id)
 
-        # Create an endpoint for this specific function
-        endpoint_function = create_endpoint_function(func_name, func, ParamModel)
+        if isinstance(func, LazyTool):
+            # Models, runner and tool are only built on the first call
+            functions_list.append(func.to_openai_function())
+            function_tags.append(getattr(func, "tags", None))
+            lazy_tools[func_name] = func
+        else:
+            parsed_func = schema_cache.openai_function(func)
+
+            functions_list.append(parsed_func)
+            function_tags.append(func.tags)
+            function_dict[func_name] = func
+
+            if dispatch == "table":
+                # Models and runner are only built on the first call
+                deferred[func_name] = (func, parsed_func, auth_header_names)
+            else:
+                build_target(func_name, func, parsed_func, auth_header_names)
+
+        route_args = (func_name, func, auth_dependencies, operation_id)
+        if dispatch == "table":
+            # Per-tool routes are only built for the OpenAPI docs
+            documented_routes.append(route_args)
+        else:
+            add_tool_routes(router, *route_args)
+
+    lazy_tool_count = len(lazy_tools)
+    schema_cache.save()
+    router.catalog = Catalog(  # type: ignore
+        functions_list, function_tags, max_age=catalog_max_age
+    )
+
+    @router.get("", response_model=List[Dict[str, Any]])
+    async def get_functions(
+        request: Request,
+        name_prefix: Optional[str] = Query(None, alias="prefix"),
+        tag: Optional[List[str]] = Query(None),
+    ):
+        return router.catalog.response(request.headers, name_prefix, tag)
+
+    @router.post("/_batch", response_model=List[Dict[str, Any]])
+    async def run_batch(request: Request, calls: List[FunctionRunRequest]):
+        if len(calls) > max_batch_size:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch size {len(calls)} exceeds the limit of {max_batch_size}",
+            )
+        semaphore = asyncio.Semaphore(batch_concurrency)
+
+        async def run_call(call: FunctionRunRequest) -> Dict[str, Any]:
+            target = resolve_target(call.function_name)
+            if target is None:
+                return {
+                    "error": f"Function '{call.function_name}' not found",
+                    "status_code": 404,
+                }
+            ParamModel, runner, auth_header_names = target
+            if any(name not in request.headers for name in auth_header_names):
+                return {"error": "Not authenticated", "status_code": 403}
+            try:
+                params = ParamModel(**call.params)
+                async with semaphore:
+                    result = await runner(build_tool_input(params.model_dump(), request))
+                if isinstance(result, ByteStream):
+                    await result.aclose()
+                    return {
+                        "error": f"Function '{call.function_name}' streams its result "
+                        "and can't be batched",
+                        "status_code": 400,
+                    }
+                return {"result": result if fast_serialization else parse_raw(result)}
+            except (ValidationError, ValidationErrorV1) as e:
+                return {
+                    "error": "Validation error",
+                    "errors": format_validation_errors(e),
+                    "status_code": 422,
+                }
+            except ToolUnavailable as e:
+                return {
+                    "error": str(e),
+                    "status_code": e.status_code,
+                    "retry_after": e.retry_after,
+                }
+            except Exception as e:
+                logger.exception(f"Error executing function '{call.function_name}'")
+                return {"error": str(e), "status_code": 500}
+
+        results = await asyncio.gather(*(run_call(call) for call in calls))
+        return FastJSONResponse(results) if fast_serialization else results
+
+    if jobs is not None:
+
+        def render_job(record: Dict[str, Any], status_code: int = 200, **kwargs) -> Any:
+            view = {key: value for key, value in record.items() if key != "owner"}
+            if fast_serialization:
+                return FastJSONResponse(view, status_code=status_code, **kwargs)
+            if "result" in view:
+                view["result"] = parse_raw(view["result"])
+            return JSONResponse(jsonable_encoder(view), status_code=status_code, **kwargs)
+
+        async def find_job(request: Request, job_id: str) -> Dict[str, Any]:
+            record = await jobs.backend.get(job_id)
+            target = record and resolve_target(record["tool"])
+            auth_header_names = target[2] if target else []
+            if record is None or record["owner"] != job_owner(
+                request.headers, request.query_params, auth_header_names
+            ):
+                raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+            return record
+
+        @router.post("/_jobs", status_code=202, response_model=Dict[str, Any])
+        async def submit_job(request: Request, call: FunctionRunRequest):
+            target = resolve_target(call.function_name)
+            if target is None:
+                raise HTTPException(
+                    status_code=404, detail=f"Function '{call.function_name}' not found"
+                )
+            ParamModel, runner, auth_header_names = target
+            if any(name not in request.headers for name in auth_header_names):
+                raise HTTPException(status_code=403, detail="Not authenticated")
+            params = ParamModel(**call.params)
+            try:
+                record = await jobs.submit(
+                    call.function_name,
+                    runner,
+                    build_tool_input(params.model_dump(), request),
+                    job_owner(
+                        request.headers, request.query_params, auth_header_names
+                    ),
+                )
+            except ToolUnavailable as e:
+                raise HTTPException(e.status_code, detail=str(e), headers=e.headers)
+            return render_job(
+                record,
+                status_code=202,
+                headers={"Location": f"{router.prefix}/_jobs/{record['id']}"},
+            )
+
+        @router.get("/_jobs/{job_id}", response_model=Dict[str, Any])
+        async def get_job(request: Request, job_id: str, wait: float = Query(0, ge=0)):
+            record = await find_job(request, job_id)
+            if wait:
+                record = await jobs.get(job_id, wait) or record
+            return render_job(record)
+
+        @router.delete("/_jobs/{job_id}", response_model=Dict[str, Any])
+        async def cancel_job(request: Request, job_id: str):
+            await find_job(request, job_id)
+            record, cancelled = await jobs.cancel(job_id)
+            if record is None:
+                raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+            if not cancelled:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Job '{job_id}' is {record['status']} and can't be cancelled",
+                )
+            return render_job(record)
+
+    @router.get("/_stats", include_in_schema=False)
+    async def get_stats():
+        stats: Dict[str, Any] = {"executor": executor.stats()}
+        if lazy_tool_count:
+            stats["lazy_tools"] = {
+                "pending": len(lazy_tools),
+                "materialized": lazy_tool_count - len(lazy_tools),
+            }
+        if cache is not None:
+            stats["cache"] = cache.stats()
+        if single_flight is not None:
+            stats["single_flight"] = single_flight.stats()
+        if instrumentation is not None:
+            stats["instrumentation"] = instrumentation.stats()
+        if upstream_guards:
+            stats["upstreams"] = {
+                guard.name: guard.stats() for guard in upstream_guards.values()
+            }
+        if jobs is not None:
+            stats["jobs"] = jobs.stats()
+        if workers is not None:
+            stats["workers"] = workers.stats()
+        if batcher is not None:
+            stats["batching"] = batcher.stats()
+        if limiters:
+            stats["limits"] = {
+                name: limiter.stats() for name, limiter in limiters.items()
+            }
+        return stats
+
+    if dispatch == "table":
+        dispatch_function, dispatch_stream = create_dispatch_endpoint_functions(
+            resolve_target, resolve_streamer, fast_serialization
+        )
+        # Registered last so the kit's own routes above take precedence
         router.add_api_route(
-            f"/{func_name}",
-            endpoint_function,
+            "/{function_name}",
+            dispatch_function,
             methods=["POST"],
-            summary=func.description,
-            dependencies=auth_dependencies,
             response_model=Dict[str, Any],
-            operation_id=operation_id,
+            include_in_schema=False,
+        )
+        router.add_api_route(
+            "/{function_name}/stream",
+            dispatch_stream,
+            methods=["POST"],
+            response_class=StreamingResponse,
+            include_in_schema=False,
         )
 
-        # Assign the unique operation ID
-        endpoint_function.__name__ = operation_id
-
-        # Assign the docstring to the endpoint function for better documentation
-        endpoint_function.__doc__ = func.description
+        def schema_router() -> APIRouter:
+            docs = APIRouter(prefix=prefix, **kwargs)
+            for route_args in documented_routes:
+                add_tool_routes(docs, *route_args)
+            return docs
 
-    @router.get("", response_model=List[Dict[str, Any]])
-    async def get_functions():
-        return functions_list
+        router.schema_router = schema_router  # type: ignore
 
     return router
 
@@ -162,9 +740,16 @@ def create_kithub(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    metrics_path: Optional[str] = "/metrics",
+    catalog_path: Optional[str] = "/_catalog",
+    catalog_max_age: int = 0,
+    reload_interval: Optional[float] = 1.0,
+    drain_timeout: float = 30.0,
     **kwargs,
 ) -> FastAPI:
     app = FastAPI(**kwargs)
+    registry = KitRegistry(app, drain_timeout, reload_interval)
+    app.registry = registry  # type: ignore
 
     app.add_middleware(
         CORSMiddleware,
@@ -181,21 +766,83 @@ def create_kithub(
         request: Request,
         exc: Union[ValidationError, ValidationErrorV1, RequestValidationError],
     ):
-        errors = defaultdict(list)
-        for error in exc.errors():
-            locs = error["loc"]
-            msg = error["msg"]
-            loc_str = ".".join(str(loc) for loc in locs if loc != "body")
-            errors[loc_str].append(msg)
-
         return JSONResponse(
             status_code=422,
             content=jsonable_encoder(
-                {"detail": "Validation error", "errors": dict(errors)}
+                {"detail": "Validation error", "errors": format_validation_errors(exc)}
             ),
         )
 
     for router in kits:
-        app.include_router(router)
+        registry.add(router)
+
+    def openapi() -> Dict[str, Any]:
+        if not app.openapi_schema:
+            app.openapi_schema = get_openapi(
+                title=app.title,
+                version=app.version,
+                openapi_version=app.openapi_version,
+                summary=app.summary,
+                description=app.description,
+                terms_of_service=app.terms_of_service,
+                contact=app.contact,
+                license_info=app.license_info,
+                routes=registry.documented_routes(),
+                webhooks=app.webhooks.routes,
+                tags=app.openapi_tags,
+                servers=app.servers,
+                separate_input_output_schemas=app.separate_input_output_schemas,
+            )
+        return app.openapi_schema
+
+    app.openapi = openapi  # type: ignore
+
+    if catalog_path:
+        hub_catalog: Dict[str, Any] = {"sources": None, "catalog": None}
+
+        @app.get(catalog_path, response_model=Dict[str, List[Dict[str, Any]]])
+        async def get_catalog(
+            request: Request,
+            name_prefix: Optional[str] = Query(None, alias="prefix"),
+            tag: Optional[List[str]] = Query(None),
+        ):
+            sources = [
+                (router.prefix or "/", router.catalog)
+                for router in registry.kits
+                if hasattr(router, "catalog")
+            ]
+            # Merged again only once a kit's catalog was swapped
+            if hub_catalog["sources"] != sources:
+                hub_catalog["catalog"] = merge_catalogs(sources, catalog_max_age)
+                hub_catalog["sources"] = sources
+            return hub_catalog["catalog"].response(request.headers, name_prefix, tag)
+
+    def instrumentations() -> Dict[int, Instrumentation]:
+        return {
+            id(router.instrumentation): router.instrumentation
+            for router in registry.kits
+            if getattr(router, "instrumentation", None) is not None
+        }
+
+    if metrics_path:
+        # Registered up front, instrumented kits may be added after the hub is created
+        @app.get(metrics_path, include_in_schema=False)
+        async def get_metrics():
+            if not instrumentations():
+                raise HTTPException(status_code=404, detail="Not Found")
+            metrics = []
+            for instrumentation in instrumentations().values():
+                metrics.extend(instrumentation.collect())
+            guards: Dict[int, Any] = {}
+            for router in registry.kits:
+                if hasattr(router, "executor"):
+                    metrics.extend(collect_kit_metrics(router.prefix or "/", router))
+                # A guard shared by several kits is reported once
+                for guard in getattr(router, "upstream_guards", None) or []:
+                    guards[id(guard)] = guard
+            metrics.extend(collect_guard_metrics(guards.values()))
+            return PlainTextResponse(
+                render_prometheus(metrics), media_type=PROMETHEUS_CONTENT_TYPE
+            )
 
     return app
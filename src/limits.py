@@ -0,0 +1,222 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Deque, Dict, Optional, Set
+
+from executors import ToolRunner
+from streaming import ToolStreamer
+
+
+class ToolUnavailable(Exception):
+    """A call rejected or abandoned by a tool's limits, mapped to an HTTP status."""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> Optional[Dict[str, str]]:
+        if self.retry_after is None:
+            return None
+        return {"Retry-After": str(max(1, round(self.retry_after)))}
+
+
+class ToolOverloaded(ToolUnavailable):
+    status_code = 429
+
+
+class ToolQueueTimeout(ToolUnavailable):
+    status_code = 503
+
+
+class ToolTimeout(ToolUnavailable):
+    status_code = 504
+
+
+class ToolLimiter:
+    """
+    Caps how many calls of one tool run at once, how many may wait and for how long.
+
+    Calls over ``max_concurrency`` wait in a FIFO queue of at most ``max_queue``
+    entries, anything beyond that is rejected straight away. ``timeout`` is the
+    deadline for the whole call, waiting included, and cancels the call when hit. A
+    timed out call keeps its slot until it has actually stopped.
+    """
+
+    def __init__(
+        self,
+        tool_name: str,
+        max_concurrency: Optional[int] = None,
+        max_queue: int = 0,
+        timeout: Optional[float] = None,
+        retry_after: float = 1.0,
+    ):
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError(f"max_concurrency for {tool_name} must be at least 1")
+        self.tool_name = tool_name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._granted: Set[asyncio.Future] = set()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self) -> Optional[asyncio.Future]:
+        with self._lock:
+            if self.max_concurrency is None or (
+                self.active < self.max_concurrency and not self._waiters
+            ):
+                self.active += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise ToolOverloaded(
+                    f"Tool '{self.tool_name}' is at capacity", self.retry_after
+                )
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            return waiter
+
+    def _release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    # Hand the slot over, ``active`` stays the same
+                    self._granted.add(waiter)
+                    waiter.get_loop().call_soon_threadsafe(_grant, waiter)
+                    return
+            self.active -= 1
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                return
+            if waiter not in self._granted:
+                return  # skipped by a release once it had given up
+            self._granted.discard(waiter)
+        # The slot was granted while we gave up, pass it on
+        self._release()
+
+    async def _acquire(self, deadline: Optional[float]) -> "_Slot":
+        waiter = self._try_acquire()
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(
+                    waiter, None if deadline is None else deadline - time.monotonic()
+                )
+            except asyncio.TimeoutError:
+                self._abandon(waiter)
+                self.timeouts += 1
+                raise ToolQueueTimeout(
+                    f"Tool '{self.tool_name}' did not start within {self.timeout}s",
+                    self.retry_after,
+                )
+            except BaseException:
+                self._abandon(waiter)
+                raise
+            with self._lock:
+                self._granted.discard(waiter)
+        return _Slot(self)
+
+    async def _await(
+        self, slot: "_Slot", deadline: Optional[float], awaitable: Awaitable[Any]
+    ) -> Any:
+        if deadline is None:
+            return await awaitable
+        task = asyncio.ensure_future(awaitable)
+        try:
+            await asyncio.wait({task}, timeout=max(0.0, deadline - time.monotonic()))
+        except BaseException:
+            slot.release_after(task)
+            raise
+        if not task.done():
+            slot.release_after(task)
+            self.timeouts += 1
+            raise ToolTimeout(f"Tool '{self.tool_name}' timed out after {self.timeout}s")
+        return task.result()
+
+    def _deadline(self) -> Optional[float]:
+        return None if self.timeout is None else time.monotonic() + self.timeout
+
+    def wrap(self, runner: ToolRunner) -> ToolRunner:
+        async def run_limited(full_params: Dict[str, Any]) -> Any:
+            deadline = self._deadline()
+            slot = await self._acquire(deadline)
+            try:
+                return await self._await(slot, deadline, runner(full_params))
+            finally:
+                slot.release()
+
+        return run_limited
+
+    def wrap_stream(self, streamer: ToolStreamer) -> ToolStreamer:
+        """Like ``wrap``, holding the slot until the stream ends, ``timeout`` included."""
+
+        async def stream_limited(full_params: Dict[str, Any]) -> AsyncIterator[Any]:
+            deadline = self._deadline()
+            slot = await self._acquire(deadline)
+            chunks = streamer(full_params)
+            try:
+                while True:
+                    try:
+                        chunk = await self._await(slot, deadline, chunks.__anext__())
+                    except StopAsyncIteration:
+                        return
+                    yield chunk
+            finally:
+                if slot.task is None:
+                    await chunks.aclose()
+                slot.release()
+
+        return stream_limited
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "timeout": self.timeout,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+class _Slot:
+    """One call's hold on a limiter slot, given back exactly once."""
+
+    def __init__(self, limiter: ToolLimiter):
+        self.limiter = limiter
+        self.task: Optional["asyncio.Future[Any]"] = None
+        self.released = False
+
+    def release(self) -> None:
+        if self.task is None and not self.released:
+            self.released = True
+            self.limiter._release()
+
+    def release_after(self, task: "asyncio.Future[Any]") -> None:
+        # Sync tools keep running in their thread, the slot is theirs until they stop
+        def release(task: "asyncio.Future[Any]") -> None:
+            if not task.cancelled():
+                task.exception()  # the caller got its error already
+            self.task = None
+            self.release()
+
+        self.task = task
+        task.cancel()
+        task.add_done_callback(release)
+
+
+def _grant(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
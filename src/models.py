@@ -1,16 +1,76 @@
-from typing import Any, Callable, Dict, List, Optional
+import inspect
+import weakref
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional, Union
 
 from langchain_core.tools import StructuredTool
 from pydantic import Field
 
+AUTH_INPUT_KEYS = ("auth_headers", "auth_params")
+
+
+# Weak keys, so functions of a reloaded kit don't stay alive through this cache
+_auth_keys_cache: "weakref.WeakKeyDictionary[Callable, FrozenSet[str]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def accepted_auth_keys(func: Callable) -> FrozenSet[str]:
+    try:
+        return _auth_keys_cache[func]
+    except (KeyError, TypeError):
+        pass
+    try:
+        parameters = inspect.signature(func).parameters.values()
+    except (TypeError, ValueError):
+        return frozenset()
+    if any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters):
+        keys = frozenset(AUTH_INPUT_KEYS)
+    else:
+        keys = frozenset(p.name for p in parameters if p.name in AUTH_INPUT_KEYS)
+    try:
+        _auth_keys_cache[func] = keys
+    except TypeError:
+        pass
+    return keys
+
 
 class AuthenticatedTool(StructuredTool):
     auth_requirements: List[Dict[str, Any]] = Field(default=[])
+    execution_mode: Optional[str] = None
+    cacheable: Optional[bool] = None
+    cache_ttl: Optional[float] = None
+    coalesce: Optional[bool] = None
+    streaming: Optional[bool] = None
+    max_concurrency: Optional[int] = None
+    max_queue: Optional[int] = None
+    timeout: Optional[float] = None
+    upstream_guard: Optional[Any] = None
+    # Takes the params dict of a call already validated against a pydantic v2
+    # ``args_schema``, credentials included, skipping the tool's own validation
+    validated_call: Optional[Callable[[Dict[str, Any]], Any]] = None
+    # Takes the params of many calls in a list and returns their results in order,
+    # kits with a MicroBatcher send concurrent calls through it
+    batch_func: Optional[Callable[..., Any]] = None
+    batch_window: Optional[float] = None
+    batch_max_size: Optional[int] = None
+
+    def _parse_input(self, tool_input: Union[str, Dict]) -> Union[str, Dict[str, Any]]:
+        parsed = super()._parse_input(tool_input)
+        if not isinstance(tool_input, dict) or not isinstance(parsed, dict):
+            return parsed
+        # The args schema drops the caller's credentials, hand them back if wanted
+        target = self.coroutine or self.func
+        for key in accepted_auth_keys(target) if target else ():
+            if key in tool_input:
+                parsed[key] = tool_input[key]
+        return parsed
 
     @classmethod
     def from_function(
         cls,
-        func: Callable,
+        func: Optional[Callable] = None,
+        coroutine: Optional[Callable[..., Awaitable[Any]]] = None,
         name: Optional[str] = None,
         description: Optional[str] = None,
         return_direct: bool = False,
@@ -21,6 +81,7 @@ class AuthenticatedTool(StructuredTool):
     ) -> "AuthenticatedTool":
         tool = super().from_function(
             func=func,
+            coroutine=coroutine,
             name=name,
             description=description,
             return_direct=return_direct,
@@ -30,6 +91,7 @@ class AuthenticatedTool(StructuredTool):
         )
         return cls(
             func=tool.func,
+            coroutine=tool.coroutine,
             name=tool.name,
             description=tool.description,
             return_direct=tool.return_direct,
@@ -37,3 +99,22 @@ class AuthenticatedTool(StructuredTool):
             auth_requirements=auth_requirements or [],
             **kwargs,
         )
+
+
+class LazyTool(ABC):
+    """
+    Placeholder for a tool that is expensive to build.
+
+    Kits register it by name and only call ``materialize`` on first use, the catalog
+    entry comes from ``to_openai_function`` without building the tool.
+    """
+
+    name: str
+    description: str
+    auth_requirements: List[Dict[str, Any]]
+
+    @abstractmethod
+    def materialize(self) -> StructuredTool: ...
+
+    @abstractmethod
+    def to_openai_function(self) -> Dict[str, Any]: ...
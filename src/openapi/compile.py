@@ -0,0 +1,29 @@
+"""
+Precompile OpenAPI specs so workers skip YAML parsing and $ref resolution.
+
+    python -m openapi.compile specs/*.yaml --cache-dir .kithub_cache
+"""
+
+import argparse
+import time
+
+from openapi.openapi_tools import load_compiled_spec
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("specs", nargs="+", help="OpenAPI spec files to compile")
+    parser.add_argument("--cache-dir", required=True)
+    args = parser.parse_args()
+
+    for spec_file in args.specs:
+        start = time.perf_counter()
+        compiled = load_compiled_spec(spec_file, args.cache_dir)
+        elapsed = time.perf_counter() - start
+        print(  # noqa: T201
+            f"{spec_file}: {len(compiled['operations'])} operations in {elapsed:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
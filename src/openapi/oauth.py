@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urljoin
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+TokenKey = Tuple[str, str, Tuple[str, ...]]
+
+
+class TokenError(Exception):
+    """A token request was refused or failed."""
+
+
+class OAuthToken:
+    def __init__(self, access_token: str, expires_in: float, refresh_margin: float):
+        self.access_token = access_token
+        self.expires_at = time.monotonic() + expires_in
+        # Short-lived tokens are still used for the first half of their lifetime
+        self.refresh_at = self.expires_at - min(refresh_margin, expires_in / 2)
+
+
+class TokenManager:
+    """
+    OAuth2 client-credentials tokens, cached per (token_url, client_id, scopes).
+
+    A token is used until ``refresh_margin`` seconds before it expires. From then on
+    callers still get it while a background fetch replaces it, and only when no valid
+    token is left do they wait. Either way a single fetch per key runs at a time,
+    shared by every caller, sync or async.
+    """
+
+    def __init__(
+        self,
+        refresh_margin: float = 60.0,
+        default_expires_in: float = 3600.0,
+        timeout: float = 10.0,
+    ):
+        self.refresh_margin = refresh_margin
+        self.default_expires_in = default_expires_in
+        self.timeout = timeout
+        self.counters = {
+            "hits": 0,
+            "waits": 0,
+            "fetches": 0,
+            "background_refreshes": 0,
+            "errors": 0,
+        }
+        self._tokens: Dict[TokenKey, OAuthToken] = {}
+        self._fetching: Dict[TokenKey, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(
+        token_url: str, client_id: str, scopes: Optional[Sequence[str]]
+    ) -> TokenKey:
+        return token_url, client_id, tuple(sorted(set(scopes or ())))
+
+    def _lookup(
+        self, key: TokenKey, client_secret: str
+    ) -> Tuple[Optional[str], Optional[Future]]:
+        """The cached token while it is valid, otherwise the fetch to wait for."""
+        with self._lock:
+            token = self._tokens.get(key)
+            now = time.monotonic()
+            if token is not None and now < token.expires_at:
+                self.counters["hits"] += 1
+                if now >= token.refresh_at and key not in self._fetching:
+                    self.counters["background_refreshes"] += 1
+                    self._start_fetch(key, client_secret)
+                return token.access_token, None
+            self.counters["waits"] += 1
+            return None, self._fetching.get(key) or self._start_fetch(key, client_secret)
+
+    def _start_fetch(self, key: TokenKey, client_secret: str) -> Future:
+        future: Future = Future()
+        self._fetching[key] = future
+        threading.Thread(
+            target=self._fetch,
+            args=(key, client_secret, future),
+            name="kithub-oauth",
+            daemon=True,
+        ).start()
+        return future
+
+    def _fetch(self, key: TokenKey, client_secret: str, future: Future) -> None:
+        token_url, client_id, scopes = key
+        data = {
+            "grant_type": "client_credentials",
+            "client_id": client_id,
+            "client_secret": client_secret,
+        }
+        if scopes:
+            data["scope"] = " ".join(scopes)
+        try:
+            response = requests.post(token_url, data=data, timeout=self.timeout)
+            if response.status_code != 200:
+                raise TokenError(
+                    f"Failed to retrieve token from {token_url}: {response.text[:200]}"
+                )
+            body = response.json()
+            token = OAuthToken(
+                body["access_token"],
+                float(body.get("expires_in") or self.default_expires_in),
+                self.refresh_margin,
+            )
+        except Exception as e:
+            error = e if isinstance(e, TokenError) else TokenError(
+                f"Failed to retrieve token from {token_url}: {e}"
+            )
+            with self._lock:
+                self.counters["errors"] += 1
+                del self._fetching[key]
+            logger.warning(str(error))
+            future.set_exception(error)
+            return
+        with self._lock:
+            self.counters["fetches"] += 1
+            self._tokens[key] = token
+            del self._fetching[key]
+        future.set_result(token.access_token)
+
+    def token(
+        self,
+        token_url: str,
+        client_id: str,
+        client_secret: str,
+        scopes: Optional[Sequence[str]] = None,
+    ) -> str:
+        key = self._key(token_url, client_id, scopes)
+        access_token, fetch = self._lookup(key, client_secret)
+        if access_token is not None:
+            return access_token
+        return fetch.result()  # type: ignore
+
+    async def atoken(
+        self,
+        token_url: str,
+        client_id: str,
+        client_secret: str,
+        scopes: Optional[Sequence[str]] = None,
+    ) -> str:
+        key = self._key(token_url, client_id, scopes)
+        access_token, fetch = self._lookup(key, client_secret)
+        if access_token is not None:
+            return access_token
+        # Shielded, a cancelled caller mustn't cancel the fetch others wait for
+        return await asyncio.shield(asyncio.wrap_future(fetch))  # type: ignore
+
+    def invalidate(
+        self, token_url: str, client_id: str, scopes: Optional[Sequence[str]] = None
+    ) -> None:
+        with self._lock:
+            self._tokens.pop(self._key(token_url, client_id, scopes), None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.counters, "tokens": len(self._tokens)}
+
+
+shared_token_manager = TokenManager()
+
+
+class ClientCredentials:
+    """
+    A client's credentials for the OAuth2 client-credentials grant.
+
+    Passed to ``create_llm_tools_from_openapi`` per security scheme name, they let
+    tools fetch their own bearer tokens instead of forwarding the caller's. The token
+    URL and scopes default to the scheme's ``clientCredentials`` flow and the scopes
+    the operation requires.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        scopes: Optional[List[str]] = None,
+        token_url: Optional[str] = None,
+        manager: Optional[TokenManager] = None,
+    ):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scopes = scopes
+        self.token_url = token_url
+        self.manager = manager or shared_token_manager
+
+
+class BearerToken:
+    """The server-side token of an operation, for one token URL and set of scopes."""
+
+    def __init__(self, credentials: ClientCredentials, token_url: str, scopes: List[str]):
+        self.credentials = credentials
+        self.token_url = token_url
+        self.scopes = scopes
+
+    def get(self) -> str:
+        credentials = self.credentials
+        return credentials.manager.token(
+            self.token_url, credentials.client_id, credentials.client_secret, self.scopes
+        )
+
+    async def aget(self) -> str:
+        credentials = self.credentials
+        return await credentials.manager.atoken(
+            self.token_url, credentials.client_id, credentials.client_secret, self.scopes
+        )
+
+    def invalidate(self) -> None:
+        self.credentials.manager.invalidate(
+            self.token_url, self.credentials.client_id, self.scopes
+        )
+
+
+def split_auth_requirements(
+    auth_requirements: List[Dict[str, Any]],
+    credentials: Optional[Dict[str, ClientCredentials]],
+    base_url: str = "",
+) -> Tuple[List[Dict[str, Any]], List[BearerToken]]:
+    """Requirements still forwarded from the caller, and the tokens fetched instead."""
+    if not credentials:
+        return auth_requirements, []
+    forwarded, tokens = [], []
+    for auth_req in auth_requirements:
+        client = credentials.get(auth_req["scheme"])
+        if auth_req["type"] != "oauth2" or client is None:
+            forwarded.append(auth_req)
+            continue
+        flow = auth_req.get("flows", {}).get("clientCredentials") or {}
+        token_url = client.token_url or flow.get("tokenUrl")
+        if not token_url:
+            raise ValueError(
+                f"Security scheme '{auth_req['scheme']}' has no clientCredentials flow, "
+                "pass a token_url with its credentials"
+            )
+        scopes = client.scopes if client.scopes is not None else auth_req["scopes"]
+        # Token URLs may be relative to the spec's server
+        tokens.append(BearerToken(client, urljoin(base_url, token_url), scopes))
+    return forwarded, tokens
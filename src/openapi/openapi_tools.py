@@ -1,13 +1,27 @@
-from typing import Any, Dict, List, Optional, Type
+import glob
+import hashlib
+import json
+import os
+from fnmatch import fnmatch
+from typing import Annotated, Any, Dict, List, Optional, Tuple, Type, Union
 
 import yaml
 from jsonschema import validate
 from jsonschema.exceptions import ValidationError
 from langchain_core.tools import StructuredTool
-from pydantic.v1 import BaseModel, Field, create_model
+from pydantic import BaseModel, Field, create_model
 
-from models import AuthenticatedTool
-from openapi.utils import create_api_operation
+from models import AuthenticatedTool, LazyTool
+from openapi.oauth import ClientCredentials, split_auth_requirements
+from openapi.resilience import UpstreamGuard
+from openapi.resolver import ParamLocation, RefResolver, SchemaModelBuilder, nullable
+from openapi.transport import HTTPEngine
+from openapi.utils import (
+    create_api_operation,
+    create_async_api_operation,
+    create_proxy_api_operation,
+)
+from serialization import write_atomic
 
 
 def string_to_bool(obj):
@@ -23,27 +37,15 @@ def string_to_bool(obj):
     return obj
 
 
-def get_type_annotation(param_schema: Dict[str, Any]) -> Any:
-    type_mapping = {
-        "string": str,
-        "integer": int,
-        "number": float,
-        "boolean": bool,
-        "array": List[Any],
-        "object": Dict[str, Any],
-    }
-    return type_mapping.get(param_schema.get("type", "string"), Any)
+OPENAPI_TYPES = ("string", "integer", "number", "boolean", "array", "object")
 
 
 def resolve_schema_ref(spec: Dict[str, Any], ref: str) -> Dict[str, Any]:
-    parts = ref.split("/")
-    current = spec
-    for part in parts[1:]:  # Skip the first '#' part
-        if part in current:
-            current = current[part]
-        else:
-            raise ValueError(f"Unable to resolve reference: {ref}")
-    return current
+    return RefResolver(spec).resolve({"$ref": ref})[0]
+
+
+def load_document(content: Union[str, bytes]) -> Any:
+    return string_to_bool(yaml.safe_load(content))
 
 
 def extract_authentication(spec: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
@@ -76,21 +78,22 @@ def extract_authentication(spec: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
     return parsed_schemes
 
 
-def extract_parameters(operation: Dict, spec: Dict[str, Any]) -> List[Dict]:
+def extract_parameters(
+    operation: Dict, spec: Dict[str, Any], resolver: Optional[RefResolver] = None
+) -> List[Dict]:
+    resolver = resolver or RefResolver(spec, load_document=load_document)
     all_params = []
 
     def process_param(param):
-        if "$ref" in param:
-            param = resolve_schema_ref(spec, param["$ref"])
+        param, base = resolver.resolve(param)
         param_schema = param.get("schema", {})
-        if "$ref" in param_schema:
-            param_schema = resolve_schema_ref(spec, param_schema["$ref"])
-        description = param.get("description", param_schema.get("description", ""))
+        resolved_schema, _ = resolver.resolve(param_schema, base)
+        description = param.get("description", resolved_schema.get("description", ""))
         return {
             "name": param.get("name"),
             "description": description,
             "required": param.get("required", False),
-            "schema": param_schema,
+            "schema": resolver.collect(param_schema, base),
             "in": param.get("in"),
         }
 
@@ -100,25 +103,21 @@ def extract_parameters(operation: Dict, spec: Dict[str, Any]) -> List[Dict]:
     # Extract body parameters
     request_body = operation.get("requestBody", {})
     if request_body:
-        if "$ref" in request_body:
-            request_body = resolve_schema_ref(spec, request_body["$ref"])
+        request_body, base = resolver.resolve(request_body)
         content = request_body.get("content", {})
         for content_schema in content.values():
-            schema = content_schema.get("schema", {})
-            if "$ref" in schema:
-                schema = resolve_schema_ref(spec, schema["$ref"])
+            schema, schema_base = resolver.resolve(content_schema.get("schema", {}), base)
             if "properties" in schema:
                 for prop_name, prop_schema in schema["properties"].items():
-                    if "$ref" in prop_schema:
-                        prop_schema = resolve_schema_ref(spec, prop_schema["$ref"])
+                    resolved_prop, _ = resolver.resolve(prop_schema, schema_base)
                     all_params.append(
                         {
                             "name": prop_name,
-                            "description": prop_schema.get(
+                            "description": resolved_prop.get(
                                 "description", "No description"
                             ),
                             "required": prop_name in schema.get("required", []),
-                            "schema": prop_schema,
+                            "schema": resolver.collect(prop_schema, schema_base),
                             "in": "body",
                         }
                     )
@@ -127,24 +126,29 @@ def extract_parameters(operation: Dict, spec: Dict[str, Any]) -> List[Dict]:
 
 
 def create_pydantic_model(
-    params: List[Dict[str, Any]], model_name: str
+    params: List[Dict[str, Any]],
+    model_name: str,
+    builder: Optional[SchemaModelBuilder] = None,
 ) -> Type[BaseModel]:
+    builder = builder or SchemaModelBuilder()
     fields = {}
     for i, param in enumerate(params):
-        field_type = get_type_annotation(param["schema"])
-        default = ... if param["required"] else None
         name = param["name"] or f"param_{i}"  # Use a generic name if missing
+        field_type = builder.type_for(param["schema"], f"{model_name}_{name}")
+        default = ... if param["required"] else None
         fields[name] = (
-            Optional[field_type],
-            Field(default=default, description=param["description"]),
+            Annotated[nullable(field_type), ParamLocation(param["in"])],
+            Field(default=default, description=param["description"] or None),
         )
 
     return create_model(model_name, **fields)
 
 
-def create_llm_tools_from_openapi(openapi_file: str) -> List[StructuredTool]:
-    with open(openapi_file, "r") as file:
-        spec_dict = yaml.safe_load(file)
+COMPILED_SPEC_VERSION = "3"
+
+
+def parse_openapi_spec(content: Union[str, bytes]) -> Dict[str, Any]:
+    spec_dict = yaml.safe_load(content)
 
     spec_dict = string_to_bool(spec_dict)
 
@@ -153,55 +157,453 @@ def create_llm_tools_from_openapi(openapi_file: str) -> List[StructuredTool]:
     except ValidationError as e:
         raise ValueError(f"Invalid OpenAPI spec: {e}")
 
-    if isinstance(spec_dict, dict):
-        auth_schemes = extract_authentication(spec_dict)
-        base_url = spec_dict.get("servers", [{}])[0].get("url", "")
-    else:
+    if not isinstance(spec_dict, dict):
         raise ValueError("Invalid OpenAPI spec")
+    return spec_dict
 
-    tools = []
 
-    for path, path_item in spec_dict.get("paths", {}).items():  # type: ignore
+def load_openapi_spec(openapi_file: str) -> Dict[str, Any]:
+    with open(openapi_file, "r") as file:
+        return parse_openapi_spec(file.read())
+
+
+def extract_auth_requirements(
+    operation: Dict[str, Any], auth_schemes: Dict[str, Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    operation_auth = operation.get("security", [])
+    auth_requirements = []
+    for auth in operation_auth:
+        for scheme, scopes in auth.items():
+            if scheme in auth_schemes:
+                auth_req = {
+                    "scheme": scheme,
+                    "type": auth_schemes[scheme]["type"],
+                    "scopes": scopes,
+                }
+                if auth_schemes[scheme]["type"] == "oauth2":
+                    auth_req["flows"] = auth_schemes[scheme]["flows"]
+                elif auth_schemes[scheme]["type"] == "apiKey":
+                    auth_req["in"] = auth_schemes[scheme]["in"]
+                    auth_req["name"] = auth_schemes[scheme]["name"]
+                elif auth_schemes[scheme]["type"] == "http":
+                    auth_req["scheme"] = auth_schemes[scheme]["scheme"]
+                auth_requirements.append(auth_req)
+    return auth_requirements
+
+
+def compile_spec(
+    spec_dict: Dict[str, Any], spec_file: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Reduce a parsed spec to what tool building needs, with every $ref resolved.
+
+    Referenced schemas are kept once in ``schemas`` and the result only holds plain
+    data so it can be cached on disk by ``load_compiled_spec``.
+    """
+    auth_schemes = extract_authentication(spec_dict)
+    resolver = RefResolver(spec_dict, spec_file, load_document=load_document)
+    operations = []
+    for path, path_item in spec_dict.get("paths", {}).items():
         for method, operation in path_item.items():
             if not isinstance(operation, dict):
                 continue
 
-            all_params = extract_parameters(operation, spec_dict)  # type: ignore
-            model_name = f"{method.capitalize()}{path.replace('/', '_')}Model"
-            RequestModel = create_pydantic_model(all_params, model_name)
-
             description = operation.get("summary") or operation.get("description", "")
             func_name = f"{path.replace('/', '_').replace('{', '').replace('}', '')}"
             if func_name.startswith("_"):
                 func_name = func_name[1:]
 
-            operation_auth = operation.get("security", [])
-            auth_requirements = []
-            for auth in operation_auth:
-                for scheme, scopes in auth.items():
-                    if scheme in auth_schemes:
-                        auth_req = {
-                            "scheme": scheme,
-                            "type": auth_schemes[scheme]["type"],
-                            "scopes": scopes,
-                        }
-                        if auth_schemes[scheme]["type"] == "oauth2":
-                            auth_req["flows"] = auth_schemes[scheme]["flows"]
-                        elif auth_schemes[scheme]["type"] == "apiKey":
-                            auth_req["in"] = auth_schemes[scheme]["in"]
-                            auth_req["name"] = auth_schemes[scheme]["name"]
-                        elif auth_schemes[scheme]["type"] == "http":
-                            auth_req["scheme"] = auth_schemes[scheme]["scheme"]
-                        auth_requirements.append(auth_req)
-
-            tool = AuthenticatedTool.from_function(
-                func=create_api_operation(
-                    method, path, RequestModel, auth_requirements, base_url
-                ),
-                name=func_name,
-                description=description.strip(),
-                args_schema=RequestModel,
-                auth_requirements=auth_requirements,
+            operations.append(
+                {
+                    "name": func_name,
+                    "method": method,
+                    "path": path,
+                    "description": description.strip(),
+                    "tags": operation.get("tags", []),
+                    "params": extract_parameters(operation, spec_dict, resolver),
+                    "auth_requirements": extract_auth_requirements(
+                        operation, auth_schemes
+                    ),
+                }
+            )
+
+    return {
+        "base_url": spec_dict.get("servers", [{}])[0].get("url", ""),
+        "auth_schemes": auth_schemes,
+        "operations": operations,
+        "schemas": resolver.schemas,
+        "dependencies": resolver.dependencies(),
+    }
+
+
+def has_changed_dependencies(dependencies: Dict[str, str]) -> bool:
+    for path, digest in dependencies.items():
+        try:
+            with open(path, "rb") as file:
+                if hashlib.sha256(file.read()).hexdigest() != digest:
+                    return True
+        except OSError:
+            return True
+    return False
+
+
+def load_compiled_spec(openapi_file: str, cache_dir: str) -> Dict[str, Any]:
+    with open(openapi_file, "rb") as file:
+        content = file.read()
+
+    digest = hashlib.sha256(f"{COMPILED_SPEC_VERSION}:".encode() + content).hexdigest()
+    stem = os.path.splitext(os.path.basename(openapi_file))[0]
+    # Specs with the same file name in different directories can share a cache_dir
+    source = hashlib.sha256(os.path.realpath(openapi_file).encode()).hexdigest()[:8]
+    prefix = f"{stem}-{source}-"
+    cache_file = os.path.join(cache_dir, f"{prefix}{digest[:16]}.json")
+
+    # Plain JSON, a cache_dir others can write to must not be able to run code here
+    try:
+        with open(cache_file, "rb") as file:
+            cached = json.load(file)
+        if cached["digest"] == digest and not has_changed_dependencies(
+            cached["compiled"]["dependencies"]
+        ):
+            return cached["compiled"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    compiled = compile_spec(parse_openapi_spec(content), openapi_file)
+    encoded = json.dumps({"digest": digest, "compiled": compiled}, default=str)
+    write_atomic(cache_file, encoded.encode())
+
+    # Drop entries compiled from older versions of the same spec
+    stale_pattern = os.path.join(glob.escape(cache_dir), f"{glob.escape(prefix)}*.json")
+    for stale_file in glob.glob(stale_pattern):
+        if stale_file != cache_file:
+            try:
+                os.remove(stale_file)
+            except OSError:
+                pass
+
+    # Served as it reads back from the cache, dates in examples become strings
+    return json.loads(encoded)["compiled"]
+
+
+def filter_operations(
+    operations: List[Dict[str, Any]],
+    tags: Optional[List[str]] = None,
+    paths: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    return [
+        operation
+        for operation in operations
+        if (not paths or any(fnmatch(operation["path"], pattern) for pattern in paths))
+        and (not tags or set(tags) & set(operation["tags"]))
+    ]
+
+
+def operation_fingerprint(operation: Dict[str, Any], compiled: Dict[str, Any]) -> str:
+    """Hash of everything an operation's tool is built from, referenced schemas too."""
+    schemas = compiled["schemas"]
+    referenced: Dict[str, Any] = {}
+    pending: List[Any] = [operation["params"]]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if isinstance(ref, str) and ref in schemas and ref not in referenced:
+                referenced[ref] = schemas[ref]
+                pending.append(schemas[ref])
+            pending.extend(node.values())
+        elif isinstance(node, list):
+            pending.extend(node)
+    payload = json.dumps(
+        [compiled["base_url"], operation, referenced], sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def create_tool_from_operation(
+    operation: Dict[str, Any],
+    base_url: str,
+    engine: Optional[HTTPEngine] = None,
+    builder: Optional[SchemaModelBuilder] = None,
+    guard: Optional[UpstreamGuard] = None,
+    raw_responses: bool = False,
+    proxy: bool = False,
+    credentials: Optional[Dict[str, ClientCredentials]] = None,
+) -> AuthenticatedTool:
+    method, path = operation["method"], operation["path"]
+    model_name = f"{method.capitalize()}{path.replace('/', '_')}Model"
+    RequestModel = create_pydantic_model(operation["params"], model_name, builder)
+    auth_requirements, tokens = split_auth_requirements(
+        operation["auth_requirements"], credentials, base_url
+    )
+
+    if proxy:
+        if engine is None:
+            raise ValueError(f"Proxy mode for {operation['name']} needs an HTTPEngine")
+        api_operation = create_proxy_api_operation(
+            method,
+            path,
+            RequestModel,
+            auth_requirements,
+            base_url,
+            engine,
+            guard,
+            tokens=tokens,
+        )
+    elif engine is None:
+        api_operation = create_api_operation(
+            method,
+            path,
+            RequestModel,
+            auth_requirements,
+            base_url,
+            guard=guard,
+            raw=raw_responses,
+            tokens=tokens,
+        )
+    else:
+        api_operation = create_async_api_operation(
+            method,
+            path,
+            RequestModel,
+            auth_requirements,
+            base_url,
+            engine,
+            guard=guard,
+            raw=raw_responses,
+            tokens=tokens,
+        )
+
+    return AuthenticatedTool.from_function(
+        **{"func" if engine is None else "coroutine": api_operation},
+        name=operation["name"],
+        description=operation["description"],
+        args_schema=RequestModel,
+        validated_call=api_operation.validated_call,
+        auth_requirements=auth_requirements,
+        tags=operation["tags"],
+        # Relayed bodies are read once, they can't be cached
+        cacheable=method.lower() in ("get", "head") and not proxy,
+        upstream_guard=guard,
+    )
+
+
+class LazyOpenAPITool(LazyTool):
+    def __init__(
+        self,
+        operation: Dict[str, Any],
+        base_url: str,
+        engine: Optional[HTTPEngine] = None,
+        builder: Optional[SchemaModelBuilder] = None,
+        guard: Optional[UpstreamGuard] = None,
+        raw_responses: bool = False,
+        proxy: bool = False,
+        credentials: Optional[Dict[str, ClientCredentials]] = None,
+    ):
+        self.name = operation["name"]
+        self.description = operation["description"]
+        self.method = operation["method"]
+        self.path = operation["path"]
+        self.tags = operation["tags"]
+        self.auth_requirements, _ = split_auth_requirements(
+            operation["auth_requirements"], credentials, base_url
+        )
+        self.cacheable = self.method.lower() in ("get", "head") and not proxy
+        self.upstream_guard = guard
+        self.raw_responses = raw_responses
+        self.proxy = proxy
+        self.credentials = credentials
+        self._operation = operation
+        self._base_url = base_url
+        self._engine = engine
+        self._builder = builder or SchemaModelBuilder()
+        self._tool: Optional[AuthenticatedTool] = None
+
+    def materialize(self) -> AuthenticatedTool:
+        if self._tool is None:
+            self._tool = create_tool_from_operation(
+                self._operation,
+                self._base_url,
+                self._engine,
+                self._builder,
+                self.upstream_guard,
+                self.raw_responses,
+                self.proxy,
+                self.credentials,
             )
-            tools.append(tool)
-    return tools
+        return self._tool
+
+    def to_openai_function(self) -> Dict[str, Any]:
+        properties = {}
+        required = []
+        for i, param in enumerate(self._operation["params"]):
+            name = param["name"] or f"param_{i}"
+            prop: Dict[str, Any] = {
+                "description": param["description"],
+                "in": param["in"],
+            }
+            param_type = self._builder.resolve(param["schema"]).get("type", "string")
+            if param_type in OPENAPI_TYPES:
+                prop["type"] = param_type
+                if param_type == "array":
+                    prop["items"] = {}
+            properties[name] = prop
+            if param["required"]:
+                required.append(name)
+
+        parameters: Dict[str, Any] = {"type": "object", "properties": properties}
+        if required:
+            parameters["required"] = required
+        return {
+            "name": self.name,
+            "description": self.description,
+            "parameters": parameters,
+        }
+
+
+def create_llm_tools_from_openapi(
+    openapi_file: str,
+    engine: Optional[HTTPEngine] = None,
+    lazy: bool = False,
+    tags: Optional[List[str]] = None,
+    paths: Optional[List[str]] = None,
+    cache_dir: Optional[str] = None,
+    guard: Optional[UpstreamGuard] = None,
+    raw_responses: bool = False,
+    proxy: bool = False,
+    credentials: Optional[Dict[str, ClientCredentials]] = None,
+) -> List[Union[StructuredTool, LazyOpenAPITool]]:
+    if cache_dir is None:
+        compiled = compile_spec(load_openapi_spec(openapi_file), openapi_file)
+    else:
+        compiled = load_compiled_spec(openapi_file, cache_dir)
+    base_url = compiled["base_url"]
+    # One builder per spec so operations sharing a component share its model
+    builder = SchemaModelBuilder(compiled["schemas"])
+    if guard is not None and not guard.name:
+        guard.name = base_url
+    if proxy and engine is None:
+        engine = HTTPEngine()
+
+    operations = filter_operations(compiled["operations"], tags=tags, paths=paths)
+    if lazy:
+        return [
+            LazyOpenAPITool(
+                operation,
+                base_url,
+                engine,
+                builder,
+                guard,
+                raw_responses,
+                proxy,
+                credentials,
+            )
+            for operation in operations
+        ]
+    return [
+        create_tool_from_operation(
+            operation, base_url, engine, builder, guard, raw_responses, proxy, credentials
+        )
+        for operation in operations
+    ]
+
+
+class OpenAPIToolset:
+    """
+    The tools of a spec file, reloaded when the file or a file it references changes.
+
+    ``load`` takes the same options as ``create_llm_tools_from_openapi`` but only
+    builds tools for operations that are new or changed since the previous load,
+    the others keep their tool and its models.
+    """
+
+    def __init__(
+        self,
+        openapi_file: str,
+        engine: Optional[HTTPEngine] = None,
+        lazy: bool = False,
+        tags: Optional[List[str]] = None,
+        paths: Optional[List[str]] = None,
+        cache_dir: Optional[str] = None,
+        guard: Optional[UpstreamGuard] = None,
+        raw_responses: bool = False,
+        proxy: bool = False,
+        credentials: Optional[Dict[str, ClientCredentials]] = None,
+    ):
+        self.openapi_file = openapi_file
+        self.engine = HTTPEngine() if proxy and engine is None else engine
+        self.lazy = lazy
+        self.tags = tags
+        self.paths = paths
+        self.cache_dir = cache_dir
+        self.guard = guard
+        self.raw_responses = raw_responses
+        self.proxy = proxy
+        self.credentials = credentials
+        self.tools: List[Union[StructuredTool, LazyOpenAPITool]] = []
+        self.built = 0
+        self.reused = 0
+        self._tools_by_fingerprint: Dict[str, Any] = {}
+        self._stamps: Dict[str, Tuple[int, int]] = {}
+
+    @staticmethod
+    def _stamp(path: str) -> Tuple[int, int]:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def changed(self) -> bool:
+        if not self._stamps:
+            return True
+        for path, stamp in self._stamps.items():
+            try:
+                if self._stamp(path) != stamp:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def load(self) -> List[Union[StructuredTool, LazyOpenAPITool]]:
+        # Taken first, a broken edit is retried after the next one rather than forever
+        self._stamps = {self.openapi_file: self._stamp(self.openapi_file)}
+        if self.cache_dir is None:
+            compiled = compile_spec(
+                load_openapi_spec(self.openapi_file), self.openapi_file
+            )
+        else:
+            compiled = load_compiled_spec(self.openapi_file, self.cache_dir)
+        for path in compiled["dependencies"]:
+            self._stamps[path] = self._stamp(path)
+
+        base_url = compiled["base_url"]
+        builder = SchemaModelBuilder(compiled["schemas"])
+        if self.guard is not None and not self.guard.name:
+            self.guard.name = base_url
+        create_tool = LazyOpenAPITool if self.lazy else create_tool_from_operation
+
+        tools = {}
+        built = reused = 0
+        for operation in filter_operations(
+            compiled["operations"], tags=self.tags, paths=self.paths
+        ):
+            fingerprint = operation_fingerprint(operation, compiled)
+            tool = self._tools_by_fingerprint.get(fingerprint)
+            if tool is None:
+                tool = create_tool(
+                    operation,
+                    base_url,
+                    self.engine,
+                    builder,
+                    self.guard,
+                    self.raw_responses,
+                    self.proxy,
+                    self.credentials,
+                )
+                built += 1
+            else:
+                reused += 1
+            tools[fingerprint] = tool
+
+        self._tools_by_fingerprint = tools
+        self.tools = list(tools.values())
+        self.built, self.reused = built, reused
+        return self.tools
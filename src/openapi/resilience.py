@@ -0,0 +1,289 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+def result_status(result: Any) -> Optional[int]:
+    """HTTP status of an operation result, ``None`` when the request never completed."""
+    if isinstance(result, dict) and "error" in result and "status_code" in result:
+        return result["status_code"]
+    # Relayed bodies carry the upstream status
+    return getattr(result, "status_code", 200)
+
+
+def is_failure(status: Optional[int]) -> bool:
+    return status is None or status == 429 or status >= 500
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Take a token, returning how long to wait for it or ``None`` if too long."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream whose recent calls mostly failed or were too slow.
+
+    After ``reset_timeout`` the circuit half-opens and lets ``half_open_calls``
+    probes through, closing again only if they all succeed.
+    """
+
+    states = ("closed", "half_open", "open")
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        min_calls: int = 10,
+        window: float = 30.0,
+        slow_call_seconds: Optional[float] = None,
+        reset_timeout: float = 30.0,
+        half_open_calls: int = 1,
+    ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.opened = 0
+        self._state = "closed"
+        self._opened_at = 0.0
+        self._calls: Deque[Tuple[float, bool]] = deque()
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if (
+            self._state == "open"
+            and time.monotonic() >= self._opened_at + self.reset_timeout
+        ):
+            self._state = "half_open"
+            self._probes = 0
+            self._probe_successes = 0
+        return self._state
+
+    def _open(self) -> None:
+        self._state = "open"
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+        self.opened += 1
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == "closed":
+                return True
+            if state == "half_open" and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+            return False
+
+    def release(self) -> None:
+        """Give back the probe slot ``allow`` took for a call that wasn't sent."""
+        with self._lock:
+            if self._state == "half_open" and self._probes > 0:
+                self._probes -= 1
+
+    def record(self, failed: bool, seconds: float) -> None:
+        if self.slow_call_seconds is not None and seconds >= self.slow_call_seconds:
+            failed = True
+        with self._lock:
+            state = self._current_state()
+            if state == "half_open":
+                if failed:
+                    self._open()
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self._state = "closed"
+                return
+            if state == "open":
+                return
+
+            now = time.monotonic()
+            self._calls.append((now, failed))
+            while self._calls and self._calls[0][0] < now - self.window:
+                self._calls.popleft()
+            failures = sum(1 for _, call_failed in self._calls if call_failed)
+            if (
+                len(self._calls) >= self.min_calls
+                and failures / len(self._calls) >= self.failure_rate
+            ):
+                self._open()
+
+
+class UpstreamGuard:
+    """
+    Rate limiting, circuit breaking and retries shared by every operation of a spec.
+
+    Rejected calls come back as the same error dicts as failed requests, with status
+    429 when the rate limit would make the call wait longer than ``max_wait`` and 503
+    while the circuit is open. Only idempotent methods are retried, with full-jitter
+    exponential backoff.
+    """
+
+    def __init__(
+        self,
+        rate_limit: Optional[float] = None,
+        burst: Optional[float] = None,
+        max_wait: float = 1.0,
+        breaker: Optional[CircuitBreaker] = None,
+        max_retries: int = 0,
+        backoff: float = 0.1,
+        max_backoff: float = 2.0,
+        retry_statuses: Tuple[int, ...] = RETRY_STATUSES,
+    ):
+        self.bucket = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.max_wait = max_wait
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = retry_statuses
+        self.name = ""
+        self.counters = {
+            "calls": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "short_circuited": 0,
+        }
+
+    def _admit(self) -> Tuple[Optional[Dict[str, Any]], float]:
+        """Return a rejection, or how long to wait before sending."""
+        # Checked first, so calls the open circuit turns away don't use up tokens
+        if self.breaker is not None and not self.breaker.allow():
+            self.counters["short_circuited"] += 1
+            return (
+                {
+                    "error": f"Circuit open for upstream {self.name}",
+                    "status_code": 503,
+                    "response_text": None,
+                },
+                0.0,
+            )
+        wait = 0.0
+        if self.bucket is not None:
+            reserved = self.bucket.reserve(self.max_wait)
+            if reserved is None:
+                if self.breaker is not None:
+                    # A half-open probe slot must always lead to a recorded call
+                    self.breaker.release()
+                self.counters["rate_limited"] += 1
+                return (
+                    {
+                        "error": f"Rate limit exceeded for upstream {self.name}",
+                        "status_code": 429,
+                        "response_text": None,
+                    },
+                    0.0,
+                )
+            wait = reserved
+        return None, wait
+
+    def _after_attempt(
+        self, method: str, attempt: int, result: Any, seconds: float
+    ) -> Optional[float]:
+        """Record the outcome, returning the backoff before a retry or ``None``."""
+        status = result_status(result)
+        if self.breaker is not None:
+            self.breaker.record(is_failure(status), seconds)
+        if (
+            attempt < self.max_retries
+            and method.upper() in IDEMPOTENT_METHODS
+            and (status is None or status in self.retry_statuses)
+        ):
+            self.counters["retries"] += 1
+            return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+        return None
+
+    def _record_crash(self, seconds: float) -> None:
+        if self.breaker is not None:
+            self.breaker.record(True, seconds)
+
+    def call(self, method: str, send: Callable[[], Any]) -> Any:
+        self.counters["calls"] += 1
+        attempt = 0
+        while True:
+            rejection, wait = self._admit()
+            if rejection is not None:
+                return rejection
+            if wait:
+                time.sleep(wait)
+            start = time.perf_counter()
+            try:
+                result = send()
+            except BaseException:
+                self._record_crash(time.perf_counter() - start)
+                raise
+            delay = self._after_attempt(
+                method, attempt, result, time.perf_counter() - start
+            )
+            if delay is None:
+                return result
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, method: str, send: Callable[[], Awaitable[Any]]) -> Any:
+        self.counters["calls"] += 1
+        attempt = 0
+        while True:
+            rejection, wait = self._admit()
+            if rejection is not None:
+                return rejection
+            if wait:
+                await asyncio.sleep(wait)
+            start = time.perf_counter()
+            try:
+                result = await send()
+            except BaseException:
+                self._record_crash(time.perf_counter() - start)
+                raise
+            delay = self._after_attempt(
+                method, attempt, result, time.perf_counter() - start
+            )
+            if delay is None:
+                return result
+            aclose = getattr(result, "aclose", None)
+            if aclose is not None:
+                await aclose()  # an unread relayed body still holds its connection
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self.counters)
+        if self.breaker is not None:
+            stats["circuit"] = self.breaker.state
+            stats["circuit_opened"] = self.breaker.opened
+        if self.bucket is not None:
+            stats["tokens"] = round(self.bucket.tokens, 3)
+        return stats
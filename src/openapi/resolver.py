@@ -0,0 +1,249 @@
+import hashlib
+import os
+import re
+from typing import Any, Callable, Dict, ForwardRef, List, Optional, Set, Tuple, Union
+from urllib.parse import unquote
+
+import yaml
+from pydantic import Field, create_model
+from pydantic.json_schema import SkipJsonSchema
+
+PRIMITIVE_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": float,
+    "boolean": bool,
+}
+
+
+def nullable(field_type: Any) -> Any:
+    """``Optional[field_type]`` without the ``null`` alternative in its JSON schema."""
+    return Union[field_type, SkipJsonSchema[None]]
+
+
+class ParamLocation:
+    """
+    Field metadata recording where an operation parameter is sent.
+
+    Shown as ``in`` in the field's JSON schema. Unlike ``json_schema_extra`` it is
+    kept by the models langchain derives from a tool's ``args_schema``.
+    """
+
+    def __init__(self, location: str):
+        self.location = location
+
+    def __get_pydantic_json_schema__(self, core_schema: Any, handler: Any) -> Any:
+        schema = handler(core_schema)
+        schema["in"] = self.location
+        return schema
+
+
+def unescape_pointer_part(part: str) -> str:
+    return unquote(part).replace("~1", "/").replace("~0", "~")
+
+
+class RefResolver:
+    """
+    Resolves ``$ref`` pointers once, including refs into other files on local disk.
+
+    Every ref is rewritten to a canonical ``<file>#<pointer>`` key and the referenced
+    schema is stored in ``schemas`` with its own nested refs canonicalized too, so the
+    table can be pickled and used without the original documents.
+    """
+
+    def __init__(
+        self,
+        spec: Dict[str, Any],
+        spec_file: Optional[str] = None,
+        load_document: Callable[[str], Any] = yaml.safe_load,
+    ):
+        self.root = os.path.abspath(spec_file) if spec_file else ""
+        self.load_document = load_document
+        self.documents: Dict[str, Any] = {self.root: spec}
+        self.schemas: Dict[str, Any] = {}
+        self._resolved: Dict[str, Any] = {}
+
+    def canonical_ref(self, ref: str, base: str) -> str:
+        file_part, _, pointer = ref.partition("#")
+        if file_part:
+            base_dir = os.path.dirname(base) if base else os.getcwd()
+            document = os.path.abspath(os.path.join(base_dir, file_part))
+        else:
+            document = base
+        return f"{document}#{pointer}"
+
+    def _document(self, path: str) -> Any:
+        if path not in self.documents:
+            with open(path, "r") as file:
+                self.documents[path] = self.load_document(file.read())
+        return self.documents[path]
+
+    def resolve_key(self, key: str) -> Any:
+        if key not in self._resolved:
+            document, _, pointer = key.partition("#")
+            current = self._document(document)
+            for part in pointer.split("/")[1:]:
+                part = unescape_pointer_part(part)
+                try:
+                    current = current[int(part) if isinstance(current, list) else part]
+                except (KeyError, IndexError, ValueError, TypeError):
+                    raise ValueError(f"Unable to resolve reference: {key}")
+            self._resolved[key] = current
+        return self._resolved[key]
+
+    def resolve(self, obj: Any, base: Optional[str] = None) -> Tuple[Any, str]:
+        """Follow ``$ref`` chains on ``obj``, returning the target and its document."""
+        base = self.root if base is None else base
+        seen: Set[str] = set()
+        while isinstance(obj, dict) and "$ref" in obj:
+            key = self.canonical_ref(obj["$ref"], base)
+            if key in seen:
+                raise ValueError(f"Circular reference: {obj['$ref']}")
+            seen.add(key)
+            obj = self.resolve_key(key)
+            base = key.partition("#")[0]
+        return obj, base
+
+    def collect(self, schema: Any, base: Optional[str] = None) -> Any:
+        """Canonicalize the refs in ``schema`` and register every schema they reach."""
+        base = self.root if base is None else base
+        if isinstance(schema, list):
+            return [self.collect(item, base) for item in schema]
+        if not isinstance(schema, dict):
+            return schema
+        if "$ref" in schema:
+            key = self.canonical_ref(schema["$ref"], base)
+            if key not in self.schemas:
+                self.schemas[key] = None  # placeholder, stops recursive schemas
+                self.schemas[key] = self.collect(
+                    self.resolve_key(key), key.partition("#")[0]
+                )
+            return {"$ref": key}
+        return {k: self.collect(v, base) for k, v in schema.items()}
+
+    def dependencies(self) -> Dict[str, str]:
+        """Hash every external document so cached compilations notice edits."""
+        dependencies = {}
+        for path in self.documents:
+            if path and path != self.root:
+                with open(path, "rb") as file:
+                    dependencies[path] = hashlib.sha256(file.read()).hexdigest()
+        return dependencies
+
+
+class SchemaModelBuilder:
+    """
+    Builds pydantic types for schemas collected by ``RefResolver``.
+
+    Models for referenced components are built once and shared by every operation,
+    recursive components are wired up through forward references.
+    """
+
+    def __init__(self, schemas: Optional[Dict[str, Any]] = None):
+        self.schemas = schemas or {}
+        self._types: Dict[str, Any] = {}
+        self._models: Dict[str, Any] = {}
+        self._building: Dict[str, str] = {}
+        self._pending: List[Any] = []
+
+    def resolve(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+        seen: Set[str] = set()
+        while "$ref" in schema and schema["$ref"] not in seen:
+            seen.add(schema["$ref"])
+            schema = self.schemas.get(schema["$ref"]) or {}
+        return schema
+
+    def _model_name(self, key: str) -> str:
+        name = re.sub(r"[^a-zA-Z0-9_]", "_", key.rsplit("/", 1)[-1]) or "Model"
+        if name[0].isdigit():
+            name = f"Model_{name}"
+        candidate, counter = name, 1
+        while candidate in self._models:
+            candidate = f"{name}_{counter}"
+            counter += 1
+        return candidate
+
+    def type_for(self, schema: Optional[Dict[str, Any]], name: str = "Model") -> Any:
+        annotation = self._type_for(schema or {}, name)
+        self._finalize()
+        return annotation
+
+    def _type_for(self, schema: Dict[str, Any], name: str) -> Any:
+        if "$ref" in schema:
+            return self._type_for_ref(schema["$ref"])
+
+        for combinator in ("oneOf", "anyOf"):
+            if combinator in schema:
+                options = tuple(
+                    self._type_for(option, f"{name}_{i}")
+                    for i, option in enumerate(schema[combinator])
+                )
+                return Union[options] if options else Any  # type: ignore
+
+        if "allOf" in schema:
+            merged: Dict[str, Any] = {"type": "object", "properties": {}, "required": []}
+            for part in schema["allOf"]:
+                part = self.resolve(part)
+                merged["properties"].update(part.get("properties", {}))
+                merged["required"].extend(part.get("required", []))
+            return self._type_for(merged, name)
+
+        schema_type = schema.get("type")
+        if schema_type in PRIMITIVE_TYPES:
+            return PRIMITIVE_TYPES[schema_type]
+        if schema_type == "array":
+            return List[self._type_for(schema.get("items", {}), f"{name}Item")]  # type: ignore
+        if schema_type == "object" or "properties" in schema:
+            if schema.get("properties"):
+                return self._create_model(name, schema)
+            additional = schema.get("additionalProperties")
+            if isinstance(additional, dict) and additional:
+                return Dict[str, self._type_for(additional, f"{name}Value")]  # type: ignore
+            return Dict[str, Any]
+        return Any
+
+    def _type_for_ref(self, key: str) -> Any:
+        if key in self._types:
+            return self._types[key]
+        if key in self._building:
+            # Recursive schema, resolved by model_rebuild once the model exists
+            return ForwardRef(self._building[key])
+
+        schema = self.schemas.get(key) or {}
+        if schema.get("properties") or "allOf" in schema:
+            name = self._model_name(key)
+            self._building[key] = name
+            self._models[name] = None
+            try:
+                self._types[key] = self._type_for(schema, name)
+            finally:
+                del self._building[key]
+            self._models[name] = self._types[key]
+        else:
+            self._types[key] = self._type_for(schema, self._model_name(key))
+        return self._types[key]
+
+    def _create_model(self, name: str, schema: Dict[str, Any]) -> Any:
+        required = set(schema.get("required", []))
+        fields = {}
+        for prop_name, prop_schema in schema["properties"].items():
+            field_type = self._type_for(prop_schema, f"{name}_{prop_name}")
+            description = self.resolve(prop_schema).get("description")
+            if prop_name in required:
+                fields[prop_name] = (field_type, Field(..., description=description))
+            else:
+                fields[prop_name] = (
+                    nullable(field_type),
+                    Field(None, description=description),
+                )
+        model = create_model(name, **fields)  # type: ignore
+        self._pending.append(model)
+        return model
+
+    def _finalize(self) -> None:
+        if self._building:
+            return
+        namespace = {name: model for name, model in self._models.items() if model}
+        for model in self._pending:
+            model.model_rebuild(_types_namespace=namespace)
+        self._pending = []
@@ -0,0 +1,166 @@
+import asyncio
+import time
+import weakref
+from typing import Any, Dict, Optional
+
+from instrumentation import observe_upstream
+from serialization import RawJSON
+from streaming import ByteStream
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+
+# Upstream headers worth keeping when relaying a body, the rest are hop-specific
+PASSTHROUGH_HEADERS = (
+    "content-length",
+    "content-encoding",
+    "content-disposition",
+    "content-language",
+    "cache-control",
+    "etag",
+    "last-modified",
+)
+
+
+class UpstreamStream(ByteStream):
+    def __init__(self, response: "httpx.Response"):
+        self.response = response
+        self.status_code = response.status_code
+        self.media_type = response.headers.get("content-type")
+        self.headers = {
+            name: response.headers[name]
+            for name in PASSTHROUGH_HEADERS
+            if name in response.headers
+        }
+
+    async def __aiter__(self):
+        # Raw chunks, still compressed if the upstream compressed them
+        async for chunk in self.response.aiter_raw():
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self.response.aclose()
+
+
+class HTTPEngine:
+    """
+    Shared keep-alive connection pools for OpenAPI tools, one client per base_url.
+
+    Clients are bound to the event loop that created them, so each running loop gets
+    its own set of pools.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 5.0,
+        timeout: float = 30.0,
+        connect_timeout: Optional[float] = None,
+        http2: bool = False,
+        **client_kwargs: Any,
+    ):
+        if httpx is None:
+            raise ImportError(
+                "HTTPEngine requires httpx, install it with `pip install kithub[async]`"
+            )
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout or timeout)
+        self.http2 = http2
+        self.client_kwargs = client_kwargs
+        self._clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def client(self, base_url: str) -> "httpx.AsyncClient":
+        clients = self._clients.setdefault(asyncio.get_running_loop(), {})
+        client = clients.get(base_url)
+        if client is None:
+            client = httpx.AsyncClient(
+                base_url=base_url,
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+                **self.client_kwargs,
+            )
+            clients[base_url] = client
+        return client
+
+    async def request(
+        self,
+        base_url: str,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, Any]] = None,
+        data: Optional[Any] = None,
+        json: Optional[Any] = None,
+        raw: bool = False,
+    ) -> Any:
+        start = time.perf_counter()
+        status = None
+        try:
+            response = await self.client(base_url).request(
+                method,
+                path,
+                params={k: v for k, v in (params or {}).items() if v is not None},
+                headers={k: v for k, v in (headers or {}).items() if v is not None},
+                data=data,
+                json=json,
+            )
+            status = response.status_code
+            response.raise_for_status()
+            if raw and "json" in response.headers.get("content-type", ""):
+                return RawJSON(response.content)
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            return {
+                "error": str(e),
+                "status_code": e.response.status_code,
+                "response_text": e.response.text,
+            }
+        except httpx.HTTPError as e:
+            return {"error": str(e), "status_code": None, "response_text": None}
+        finally:
+            observe_upstream(method, base_url, status, time.perf_counter() - start)
+
+    async def stream(
+        self,
+        base_url: str,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, Any]] = None,
+        data: Optional[Any] = None,
+        json: Optional[Any] = None,
+    ) -> Any:
+        """Send the request and return as soon as the response headers arrive."""
+        client = self.client(base_url)
+        start = time.perf_counter()
+        status = None
+        try:
+            request = client.build_request(
+                method,
+                path,
+                params={k: v for k, v in (params or {}).items() if v is not None},
+                headers={k: v for k, v in (headers or {}).items() if v is not None},
+                data=data,
+                json=json,
+            )
+            response = await client.send(request, stream=True)
+            status = response.status_code
+            return UpstreamStream(response)
+        except httpx.HTTPError as e:
+            return {"error": str(e), "status_code": None, "response_text": None}
+        finally:
+            observe_upstream(method, base_url, status, time.perf_counter() - start)
+
+    async def aclose(self) -> None:
+        clients = self._clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.aclose()
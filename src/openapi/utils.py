@@ -1,80 +1,323 @@
+import re
+import time
 from typing import List, Optional
-from urllib.parse import urljoin
+from urllib.parse import quote
 
 import requests
+from pydantic import ValidationError
 
+from instrumentation import observe_upstream
+from openapi.oauth import TokenError, shared_token_manager
+from openapi.resilience import result_status
+from openapi.resolver import ParamLocation
+from serialization import RawJSON
 
-def create_api_operation(method, path, RequestModel, auth_requirements, base_url):
-    def api_operation(**kwargs):
-        nonlocal path  # This allows us to modify the path if needed
-        validated_data = RequestModel(**kwargs)
+PATH_PARAM_PATTERN = re.compile(r"\{([^}]+)\}")
+
+
+def field_location(field):
+    for meta in field.metadata:
+        if isinstance(meta, ParamLocation):
+            return meta.location
+    return None
+
+
+class RequestPlan:
+    """
+    Everything about an operation's request that doesn't depend on the call.
+
+    Field locations, the path template and the auth injection steps are worked out
+    once when the tool is created, so ``build`` only assembles values. ``tokens`` are
+    bearer tokens fetched server-side, added by ``authorize`` once the request is
+    built.
+    """
+
+    def __init__(self, method, path, RequestModel, auth_requirements, tokens=()):
+        self.RequestModel = RequestModel
+        self.method = method.upper()
+        self.sends_json = method.lower() in ("post", "put", "patch")
+        self.locations = {
+            name: field_location(field) or "body"
+            for name, field in RequestModel.model_fields.items()
+        }
+        self.required = {
+            name
+            for name, field in RequestModel.model_fields.items()
+            if field.is_required()
+        }
+        # Literal segments at even indexes, parameter names at odd indexes
+        self.path_segments = PATH_PARAM_PATTERN.split(path)
+        self.auth_steps = compile_auth_steps(auth_requirements)
+        self.tokens = list(tokens)
+
+    def authorize(self, request):
+        """Add the server-side tokens, returning an error result if one can't be had."""
+        try:
+            for token in self.tokens:
+                request["headers"]["Authorization"] = f"Bearer {token.get()}"
+        except TokenError as e:
+            return {"error": str(e), "status_code": None, "response_text": None}
+        return None
+
+    async def aauthorize(self, request):
+        try:
+            for token in self.tokens:
+                request["headers"]["Authorization"] = f"Bearer {await token.aget()}"
+        except TokenError as e:
+            return {"error": str(e), "status_code": None, "response_text": None}
+        return None
+
+    def check_response(self, result):
+        if self.tokens and result_status(result) == 401:
+            # Revoked or rotated before it expired, the next call fetches a new one
+            for token in self.tokens:
+                token.invalidate()
+        return result
+
+    def format_path(self, path_values):
+        segments = self.path_segments
+        if len(segments) == 1:
+            return segments[0]
+        return "".join(
+            segment
+            if i % 2 == 0
+            else quote(str(path_values[segment]), safe="")
+            for i, segment in enumerate(segments)
+        )
+
+    def build(self, kwargs, validated=False):
+        """
+        Assemble the request for a call.
+
+        With ``validated`` the values were already checked against ``RequestModel``
+        and dumped to plain data by the caller, so they're used as they are.
+        """
+        if validated:
+            # The caller's dump fills unset optional params with None, never send those
+            values = {
+                k: v for k, v in kwargs.items() if v is not None or k in self.required
+            }
+        else:
+            values = self.RequestModel(**kwargs).model_dump(exclude_unset=True)
         headers = {}
         params = {}
+        path_values = {}
         data = None
         json_data = None
-        auth = None
-
-        # Process authentication
-        for auth_req in auth_requirements:
-            if auth_req["type"] == "apiKey":
-                if auth_req["in"] == "header":
-                    headers[auth_req["name"]] = kwargs.get("auth_headers", {}).get(
-                        auth_req["name"]
-                    )
-                elif auth_req["in"] == "query":
-                    params[auth_req["name"]] = kwargs.get("auth_params", {}).get(
-                        auth_req["name"]
-                    )
-            elif auth_req["type"] == "oauth2":
-                token = kwargs.get("auth_headers", {}).get("Authorization")
-                if token:
-                    headers["Authorization"] = token
-            elif auth_req["type"] == "http" and auth_req["scheme"] == "bearer":
-                token = kwargs.get("auth_headers", {}).get("Authorization")
-                if token:
-                    headers["Authorization"] = f"Bearer {token}"
-
-        # Process parameters
-        for param_name, param_value in validated_data.dict(exclude_unset=True).items():
-            param_info = RequestModel.__fields__[param_name]
-            param_location = param_info.field_info.extra.get("in", "body")
+
+        auth_headers = kwargs.get("auth_headers") or {}
+        auth_params = kwargs.get("auth_params") or {}
+        for target, name, source, source_name, prefix in self.auth_steps:
+            value = (auth_headers if source == "header" else auth_params).get(source_name)
+            if value is None:
+                continue
+            if prefix and not value.lower().startswith(prefix.lower()):
+                value = prefix + value
+            if target == "header":
+                headers[name] = value
+            else:
+                params[name] = value
+
+        locations = self.locations
+        for param_name, param_value in values.items():
+            param_location = locations.get(param_name)
+            if param_location is None:
+                continue  # the caller's credentials, handled above
 
             if param_location == "query":
                 params[param_name] = param_value
             elif param_location == "header":
                 headers[param_name] = str(param_value)
             elif param_location == "path":
-                path = path.replace(f"{{{param_name}}}", str(param_value))
+                path_values[param_name] = param_value
             else:  # Assume body parameter if not specified
                 if data is None:
                     data = {}
                 data[param_name] = param_value
 
-        if data and method.lower() in ["post", "put", "patch"]:
+        # Never send a literal ``{param}``, every path parameter needs a value
+        missing = [
+            {"type": "missing", "loc": (name,), "input": kwargs}
+            for name in self.path_segments[1::2]
+            if path_values.get(name) is None
+        ]
+        if missing:
+            raise ValidationError.from_exception_data(self.RequestModel.__name__, missing)
+
+        if data and self.sends_json:
             json_data = data
             data = None
 
-        url = urljoin(base_url, path)
+        return {
+            "method": self.method,
+            "path": self.format_path(path_values),
+            "params": params,
+            "headers": headers,
+            "data": data,
+            "json": json_data,
+        }
 
-        try:
-            response = requests.request(
-                method=method.upper(),
-                url=url,
-                params=params,
-                headers=headers,
-                data=data,
-                json=json_data,
-                auth=auth,
+
+def compile_auth_steps(auth_requirements):
+    # (target, name, source, source_name, prefix); request headers arrive lowercased
+    steps = []
+    for auth_req in auth_requirements:
+        if auth_req["type"] == "apiKey":
+            if auth_req["in"] == "header":
+                steps.append(
+                    ("header", auth_req["name"], "header", auth_req["name"].lower(), "")
+                )
+            elif auth_req["in"] == "query":
+                steps.append(("query", auth_req["name"], "query", auth_req["name"], ""))
+        elif auth_req["type"] == "oauth2":
+            steps.append(("header", "Authorization", "header", "authorization", ""))
+        elif auth_req["type"] == "http" and auth_req["scheme"] == "bearer":
+            steps.append(
+                ("header", "Authorization", "header", "authorization", "Bearer ")
             )
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            return {
-                "error": str(e),
-                "status_code": e.response.status_code if e.response else None,
-                "response_text": e.response.text if e.response else None,
-            }
+    return steps
+
+
+def create_api_operation(
+    method,
+    path,
+    RequestModel,
+    auth_requirements,
+    base_url,
+    guard=None,
+    raw=False,
+    tokens=(),
+):
+    plan = RequestPlan(method, path, RequestModel, auth_requirements, tokens)
+
+    def send(request):
+        if plan.tokens:
+            error = plan.authorize(request)
+            if error is not None:
+                return error
+        if guard is None:
+            result = send_request(base_url, request, raw)
+        else:
+            result = guard.call(
+                request["method"], lambda: send_request(base_url, request, raw)
+            )
+        return plan.check_response(result)
+
+    def api_operation(**kwargs):
+        return send(plan.build(kwargs))
+
+    def validated_call(params):
+        return send(plan.build(params, True))
+
+    # For kits that validated the call against RequestModel already
+    api_operation.validated_call = validated_call
+    return api_operation
+
+
+def is_json_response(response) -> bool:
+    return "json" in response.headers.get("content-type", "")
+
+
+def send_request(base_url, request, raw=False):
+    # Appended like httpx does, urljoin would drop a base path such as ``/v1``
+    url = base_url.rstrip("/") + "/" + request["path"].lstrip("/")
+
+    start = time.perf_counter()
+    status = None
+    try:
+        response = requests.request(
+            method=request["method"],
+            url=url,
+            params=request["params"],
+            headers=request["headers"],
+            data=request["data"],
+            json=request["json"],
+        )
+        status = response.status_code
+        response.raise_for_status()
+        if raw and is_json_response(response):
+            # Hand the body on undecoded, fast kits embed it as is
+            return RawJSON(response.content)
+        return response.json()
+    except requests.RequestException as e:
+        # A failed Response is falsy, compare with None instead
+        return {
+            "error": str(e),
+            "status_code": e.response.status_code if e.response is not None else None,
+            "response_text": e.response.text if e.response is not None else None,
+        }
+    finally:
+        observe_upstream(request["method"], url, status, time.perf_counter() - start)
+
+
+def create_async_api_operation(
+    method,
+    path,
+    RequestModel,
+    auth_requirements,
+    base_url,
+    engine,
+    guard=None,
+    raw=False,
+    tokens=(),
+):
+    plan = RequestPlan(method, path, RequestModel, auth_requirements, tokens)
+
+    async def send(request):
+        if plan.tokens:
+            error = await plan.aauthorize(request)
+            if error is not None:
+                return error
+        if guard is None:
+            result = await engine.request(base_url, **request, raw=raw)
+        else:
+            result = await guard.acall(
+                request["method"], lambda: engine.request(base_url, **request, raw=raw)
+            )
+        return plan.check_response(result)
+
+    async def api_operation(**kwargs):
+        return await send(plan.build(kwargs))
+
+    async def validated_call(params):
+        return await send(plan.build(params, True))
+
+    api_operation.validated_call = validated_call
+    return api_operation
+
+
+def create_proxy_api_operation(
+    method,
+    path,
+    RequestModel,
+    auth_requirements,
+    base_url,
+    engine,
+    guard=None,
+    tokens=(),
+):
+    plan = RequestPlan(method, path, RequestModel, auth_requirements, tokens)
+
+    async def send(request):
+        if plan.tokens:
+            error = await plan.aauthorize(request)
+            if error is not None:
+                return error
+        if guard is None:
+            result = await engine.stream(base_url, **request)
+        else:
+            result = await guard.acall(
+                request["method"], lambda: engine.stream(base_url, **request)
+            )
+        return plan.check_response(result)
+
+    async def api_operation(**kwargs):
+        return await send(plan.build(kwargs))
+
+    async def validated_call(params):
+        return await send(plan.build(params, True))
 
+    api_operation.validated_call = validated_call
     return api_operation
 
 
@@ -85,7 +328,9 @@ def get_bearer_token(
     grant_type: str,
     scopes: Optional[List[str]] = None,
 ) -> str:
-    import requests
+    if grant_type == "client_credentials":
+        # Cached until shortly before it expires, shared with the generated tools
+        return shared_token_manager.token(token_url, client_id, client_secret, scopes)
 
     data = {
         "grant_type": grant_type,
@@ -0,0 +1,253 @@
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from fastapi import APIRouter, FastAPI
+
+logger = logging.getLogger(__name__)
+
+
+async def _run_handlers(handlers: List[Callable[[], Any]]) -> None:
+    for handler in handlers:
+        result = handler()
+        if inspect.isawaitable(result):
+            await result
+
+
+def _idle(kit: APIRouter) -> bool:
+    workers = getattr(kit, "workers", None)
+    if workers is not None and workers.in_flight:
+        return False
+    executor = getattr(kit, "executor", None)
+    if executor is None:
+        return True
+    return not any(mode["in_flight"] for mode in executor.stats().values())
+
+
+class KitRegistry:
+    """
+    The kits of a hub, which can be added, replaced or removed while it serves.
+
+    A change installs the new set of routes in a single assignment, so every request
+    sees either the old or the new kit. Requests already routed finish on the old
+    kit, whose shutdown handlers run once its executor is idle or ``drain_timeout``
+    has passed.
+    """
+
+    def __init__(
+        self,
+        app: FastAPI,
+        drain_timeout: float = 30.0,
+        reload_interval: Optional[float] = 1.0,
+    ):
+        self.app = app
+        self.drain_timeout = drain_timeout
+        self.reload_interval = reload_interval
+        self.reloads = 0
+        self.reload_errors = 0
+        self._kits: Dict[str, APIRouter] = {}
+        self._routes: Dict[str, List[Any]] = {}
+        self._watched: Dict[str, Any] = {}
+        self._retiring: Set[asyncio.Task] = set()
+        self._watch_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        app.router.add_event_handler("startup", self._startup)
+        app.router.add_event_handler("shutdown", self._shutdown)
+
+    @property
+    def kits(self) -> List[APIRouter]:
+        return list(self._kits.values())
+
+    def get(self, prefix: str) -> Optional[APIRouter]:
+        return self._kits.get(prefix)
+
+    def _build_routes(self, kit: APIRouter) -> List[Any]:
+        staging = APIRouter(
+            dependencies=list(self.app.router.dependencies),
+            default_response_class=self.app.router.default_response_class,
+        )
+        staging.include_router(kit)
+        return staging.routes
+
+    def documented_routes(self) -> List[Any]:
+        """The app's routes as its OpenAPI docs list them, per tool for every kit."""
+        routes = list(self.app.router.routes)
+        for kit in self._kits.values():
+            schema_router = getattr(kit, "schema_router", None)
+            if schema_router is not None:
+                routes.extend(self._build_routes(schema_router()))
+        return routes
+
+    def _install(self, prefix: str, kit: Optional[APIRouter]) -> Optional[APIRouter]:
+        with self._lock:
+            return self._swap(prefix, kit)
+
+    def _swap(self, prefix: str, kit: Optional[APIRouter]) -> Optional[APIRouter]:
+        old_routes = self._routes.pop(prefix, [])
+        new_routes = self._build_routes(kit) if kit is not None else []
+        routes = list(self.app.router.routes)
+        # Keep the kit's position so routing precedence doesn't change on reload
+        position = len(routes)
+        if old_routes:
+            stale = {id(route) for route in old_routes}
+            position = next(i for i, route in enumerate(routes) if id(route) in stale)
+            routes = [route for route in routes if id(route) not in stale]
+        routes[position:position] = new_routes
+        self.app.router.routes = routes
+        self.app.openapi_schema = None
+
+        old_kit = self._kits.pop(prefix, None)
+        if kit is not None:
+            self._kits[prefix] = kit
+            self._routes[prefix] = new_routes
+            # Kits added before startup run their startup handlers with the app's
+            self.app.router.on_startup.extend(kit.on_startup)
+            self.app.router.on_shutdown.extend(kit.on_shutdown)
+            if self._loop is not None:
+                self._spawn(_run_handlers(kit.on_startup))
+        if old_kit is not None:
+            for handlers, app_handlers in (
+                (old_kit.on_startup, self.app.router.on_startup),
+                (old_kit.on_shutdown, self.app.router.on_shutdown),
+            ):
+                for handler in handlers:
+                    if handler in app_handlers:
+                        app_handlers.remove(handler)
+            self._retire(old_kit)
+        return old_kit
+
+    def add(self, kit: APIRouter) -> None:
+        if kit.prefix in self._kits:
+            raise ValueError(f"A kit is already registered at '{kit.prefix}'")
+        self._install(kit.prefix, kit)
+
+    def replace(self, kit: APIRouter) -> Optional[APIRouter]:
+        """Install ``kit`` in place of the kit with the same prefix, returning that."""
+        return self._install(kit.prefix, kit)
+
+    def remove(self, prefix: str) -> APIRouter:
+        if prefix not in self._kits:
+            raise KeyError(f"No kit registered at '{prefix}'")
+        self._watched.pop(prefix, None)
+        return self._install(prefix, None)  # type: ignore
+
+    def _spawn(self, coroutine: Any) -> None:
+        loop = self._loop
+        if loop is None:
+            raise RuntimeError("The hub hasn't started")
+
+        def start() -> None:
+            task = loop.create_task(coroutine)
+            self._retiring.add(task)
+            task.add_done_callback(self._retiring.discard)
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            start()
+        else:
+            loop.call_soon_threadsafe(start)
+
+    def _retire(self, kit: APIRouter) -> None:
+        if self._loop is None:
+            # The hub hasn't started, so nothing ran on the kit and nothing to wait for
+            for handler in kit.on_shutdown:
+                if not inspect.iscoroutinefunction(handler):
+                    handler()
+            return
+        self._spawn(self._drain(kit))
+
+    async def _drain(self, kit: APIRouter) -> None:
+        deadline = time.monotonic() + self.drain_timeout
+        while not _idle(kit) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await _run_handlers(kit.on_shutdown)
+
+    async def drained(self) -> None:
+        """Wait until every replaced or removed kit has shut down."""
+        while self._retiring:
+            await asyncio.gather(*list(self._retiring), return_exceptions=True)
+
+    def watch(
+        self,
+        prefix: str,
+        toolset: Any,
+        **kit_options: Any,
+    ) -> APIRouter:
+        """
+        Serve ``toolset`` at ``prefix`` and rebuild the kit whenever it changes.
+
+        ``toolset`` needs ``load()`` returning the tools and ``changed()``, like
+        ``OpenAPIToolset``. The kit is rebuilt with ``create_kit(tools, prefix,
+        **kit_options)`` by ``refresh``, which runs every ``reload_interval``
+        seconds while the hub is up.
+        """
+        from kithub import create_kit
+
+        def build() -> APIRouter:
+            return create_kit(toolset.load(), prefix=prefix, **kit_options)
+
+        kit = build()
+        self._install(prefix, kit)
+        self._watched[prefix] = (toolset, build)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.start_watching)
+        return kit
+
+    async def refresh(self) -> List[str]:
+        """Rebuild the watched kits whose sources changed, returning their prefixes."""
+        reloaded = []
+        for prefix, (toolset, build) in list(self._watched.items()):
+            if not toolset.changed():
+                continue
+            try:
+                # Parsing and model building stay off the event loop
+                kit = await asyncio.to_thread(build)
+            except Exception:
+                self.reload_errors += 1
+                logger.exception(f"Reloading the kit at '{prefix}' failed")
+                continue
+            if self._watched.get(prefix, (None,))[0] is not toolset:
+                continue  # removed while it was being rebuilt
+            self._install(prefix, kit)
+            self.reloads += 1
+            reloaded.append(prefix)
+            logger.info(f"Reloaded the kit at '{prefix}'")
+        return reloaded
+
+    async def _watch(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self.refresh()
+
+    def start_watching(self) -> None:
+        if self._watch_task is None and self._watched and self.reload_interval:
+            self._watch_task = asyncio.get_running_loop().create_task(
+                self._watch(self.reload_interval)
+            )
+
+    async def _startup(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self.start_watching()
+
+    async def _shutdown(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+        await self.drained()
+        self._loop = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kits": list(self._kits),
+            "watched": list(self._watched),
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "retiring": len(self._retiring),
+        }
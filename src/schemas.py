@@ -0,0 +1,162 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
+
+import langchain_core
+from langchain_core.utils.function_calling import convert_to_openai_function
+from pydantic import BaseModel, Field, create_model
+
+from serialization import write_atomic
+
+PRIMITIVE_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": float,
+    "boolean": bool,
+}
+
+
+def get_python_type(schema: Union[str, Dict[str, Any]], name: str = "Model") -> Any:
+    """Python type for a JSON schema, keeping item, value and nested object types."""
+    if isinstance(schema, str):
+        schema = {"type": schema}
+    for combinator in ("anyOf", "oneOf"):
+        if combinator in schema:
+            options = tuple(
+                get_python_type(option, f"{name}_{i}")
+                for i, option in enumerate(schema[combinator])
+            )
+            return Union[options] if options else Any  # type: ignore
+
+    schema_type = schema.get("type")
+    if schema_type in PRIMITIVE_TYPES:
+        return PRIMITIVE_TYPES[schema_type]
+    if schema_type == "array":
+        item_type = get_python_type(schema.get("items") or {}, f"{name}Item")
+        return List[item_type]  # type: ignore
+    if schema_type == "object":
+        if schema.get("properties"):
+            return create_fields_model(name, schema)
+        additional = schema.get("additionalProperties")
+        if isinstance(additional, dict) and additional:
+            value_type = get_python_type(additional, f"{name}Value")
+            return Dict[str, value_type]  # type: ignore
+        return Dict[str, Any]
+    return Any
+
+
+def create_fields_model(name: str, schema: Dict[str, Any]) -> Type[BaseModel]:
+    fields: Dict[str, Any] = {}
+    required = schema.get("required", [])
+    for field_name, field_schema in schema.get("properties", {}).items():
+        field_type = get_python_type(field_schema, f"{name}_{field_name}")
+        description = field_schema.get("description", "")
+        if field_name in required:
+            fields[field_name] = (field_type, Field(..., description=description))
+        else:
+            fields[field_name] = (
+                Optional[field_type],
+                Field(None, description=description),
+            )
+    return create_model(name, **fields)
+
+
+def create_param_model(func_name: str, parsed_func: Dict[str, Any]) -> Type[BaseModel]:
+    # Create a Pydantic model for the function parameters
+    return create_fields_model(f"{func_name}Params", parsed_func.get("parameters", {}))
+
+
+def tool_fingerprint(tool: Any) -> str:
+    """Hash of everything ``convert_to_openai_function`` reads from a tool."""
+    args_schema = getattr(tool, "args_schema", None)
+    if args_schema is None:
+        schema = tool.args
+    elif hasattr(args_schema, "model_json_schema"):
+        schema = args_schema.model_json_schema()
+    else:
+        schema = args_schema.schema()
+    payload = json.dumps(
+        [langchain_core.__version__, tool.name, tool.description, schema],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class SchemaCache:
+    """
+    Converted OpenAI functions and parameter models shared by tools with the same schema.
+
+    Tools are keyed on a fingerprint of their name, description and argument schema,
+    so a tool mounted in several kits, or rebuilt on reload, is only converted once.
+    With ``path`` the converted functions are also kept in a JSON file, letting new
+    processes skip the conversion.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 10_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._functions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._models: "OrderedDict[Tuple[str, str], Type[BaseModel]]" = OrderedDict()
+        self._dirty = False
+        self._lock = threading.Lock()
+        if path is not None:
+            try:
+                with open(path, "r") as file:
+                    self._functions.update(json.load(file))
+            except (OSError, ValueError):
+                pass
+
+    def _remember(self, entries: "OrderedDict", key: Any, value: Any) -> None:
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def openai_function(self, tool: Any) -> Dict[str, Any]:
+        fingerprint = tool_fingerprint(tool)
+        parsed_func = self._functions.get(fingerprint)
+        if parsed_func is not None:
+            self.hits += 1
+            return parsed_func
+        self.misses += 1
+        parsed_func = convert_to_openai_function(tool)
+        self._remember(self._functions, fingerprint, parsed_func)
+        self._dirty = True
+        return parsed_func
+
+    def param_model(self, func_name: str, parsed_func: Dict[str, Any]) -> Type[BaseModel]:
+        key = (
+            func_name,
+            json.dumps(parsed_func.get("parameters", {}), sort_keys=True, default=str),
+        )
+        model = self._models.get(key)
+        if model is None:
+            model = create_param_model(func_name, parsed_func)
+            self._remember(self._models, key, model)
+        return model
+
+    def save(self) -> None:
+        """Write new converted functions to ``path``, if there were any."""
+        if self.path is None or not self._dirty:
+            return
+        with self._lock:
+            functions = dict(self._functions)
+            self._dirty = False
+        write_atomic(self.path, json.dumps(functions).encode())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "functions": len(self._functions),
+            "models": len(self._models),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+shared_schema_cache = SchemaCache()
@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class RawJSON(bytes):
+    """
+    An already encoded JSON document, such as an upstream response body.
+
+    Fast kits splice it into their response untouched, everything else decodes it
+    with ``parse`` first.
+    """
+
+    def parse(self) -> Any:
+        if orjson is not None:
+            return orjson.loads(memoryview(self))
+        return json.loads(self)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, RawJSON):
+        if orjson is not None and hasattr(orjson, "Fragment"):
+            return orjson.Fragment(bytes(value))
+        return value.parse()
+    # Models, dataclasses, datetimes and the rest of what FastAPI knows how to encode
+    return jsonable_encoder(value)
+
+
+def dumps(value: Any) -> bytes:
+    if isinstance(value, dict) and len(value) == 1 and isinstance(
+        value.get("result"), RawJSON
+    ):
+        # The common passthrough case needs no encoder at all
+        return b'{"result":' + value["result"] + b"}"
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+
+def parse_raw(value: Any) -> Any:
+    return value.parse() if isinstance(value, RawJSON) else value
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Write ``data`` to ``path`` so concurrent readers never see a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_file, path)
+    except BaseException:
+        os.unlink(tmp_file)
+        raise
@@ -0,0 +1,121 @@
+import functools
+import inspect
+import json
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+from executors import ToolExecutor
+
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+ToolStreamer = Callable[[Dict[str, Any]], AsyncIterator[Any]]
+
+_DONE = object()
+
+
+class ByteStream(ABC):
+    """
+    A tool result that is an HTTP body to relay as is rather than a JSON value.
+
+    Kits answer with ``status_code``, ``media_type`` and ``headers`` and stream the
+    chunks straight through, closing the stream once the client is done.
+    """
+
+    status_code: int = 200
+    media_type: Optional[str] = None
+    headers: Dict[str, str] = {}
+
+    @abstractmethod
+    def __aiter__(self) -> AsyncIterator[bytes]: ...
+
+    async def aclose(self) -> None:
+        pass
+
+
+def is_streaming_tool(tool: Any) -> bool:
+    streaming = getattr(tool, "streaming", None)
+    if streaming is not None:
+        return streaming
+    return inspect.isgeneratorfunction(
+        getattr(tool, "func", None)
+    ) or inspect.isasyncgenfunction(getattr(tool, "coroutine", None))
+
+
+async def _iterate_async(chunks: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def _iterate_sync(
+    executor: ToolExecutor, chunks: Iterator[Any], mode: str
+) -> AsyncIterator[Any]:
+    # Pull one chunk at a time so a slow client holds back the producer
+    pull = functools.partial(next, chunks, _DONE)
+    try:
+        while True:
+            if mode == "inline":
+                chunk = pull()
+            else:
+                chunk = await executor.submit("thread", pull)
+            if chunk is _DONE:
+                return
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                pass  # still running in a worker thread, garbage collection closes it
+
+
+def create_streamer(
+    executor: ToolExecutor, tool: Any, mode: str = "thread"
+) -> ToolStreamer:
+    coroutine = getattr(tool, "coroutine", None)
+    arg_names = set(tool.args)
+
+    if inspect.isasyncgenfunction(coroutine):
+
+        async def stream_async_generator(params: Dict[str, Any]) -> AsyncIterator[Any]:
+            kwargs = {k: v for k, v in params.items() if k in arg_names}
+            async for chunk in _iterate_async(coroutine(**kwargs)):
+                yield chunk
+
+        return stream_async_generator
+
+    # Generators can't travel back from a worker process, iterate them in a thread
+    runner = executor.create_runner(tool, "thread" if mode == "process" else mode)
+
+    async def stream_result(params: Dict[str, Any]) -> AsyncIterator[Any]:
+        result = await runner(params)
+        if inspect.isasyncgen(result):
+            chunks = _iterate_async(result)
+        elif isinstance(result, Iterator):
+            chunks = _iterate_sync(executor, result, mode)
+        else:
+            yield result
+            return
+        async for chunk in chunks:
+            yield chunk
+
+    return stream_result
+
+
+def encode_chunk(chunk: Any, stream_format: str, event: str = "chunk") -> bytes:
+    if stream_format == "sse":
+        data = json.dumps(jsonable_encoder(chunk))
+        if event == "chunk":
+            return f"data: {data}\n\n".encode()
+        return f"event: {event}\ndata: {data}\n\n".encode()
+    return (json.dumps(jsonable_encoder({event: chunk})) + "\n").encode()
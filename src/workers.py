@@ -0,0 +1,490 @@
+"""
+Tool worker processes, serving a kit's tools over a Unix socket.
+
+The hub starts them through ``WorkerPool``; each runs::
+
+    python -m workers --socket /tmp/kithub-workers-x/worker-0.sock --tools app.tools:tools
+"""
+
+import argparse
+import asyncio
+import importlib
+import itertools
+import logging
+import os
+import pickle
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from executors import ToolExecutor, ToolRunner
+from limits import ToolUnavailable
+from models import AuthenticatedTool, LazyTool
+from streaming import ByteStream
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct("!I")
+PING = None
+
+
+class WorkerUnavailable(ToolUnavailable):
+    status_code = 503
+
+
+def encode_frame(message: Tuple[Any, ...]) -> bytes:
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    return HEADER.pack(len(data)) + data
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[Any, ...]:
+    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return pickle.loads(await reader.readexactly(size))
+
+
+def encode_error(call_id: int, error: Exception) -> bytes:
+    try:
+        # Exceptions that pickle but can't be rebuilt would break the hub's reader
+        pickle.loads(pickle.dumps(error))
+        return encode_frame((call_id, False, error))
+    except Exception:
+        error = RuntimeError(f"{type(error).__name__}: {error}")
+        return encode_frame((call_id, False, error))
+
+
+def load_tools(spec: str) -> List[Any]:
+    """The tools at ``module:attribute``, a list of them or a function returning one."""
+    module_name, _, attribute = spec.partition(":")
+    if not attribute:
+        raise ValueError(f"Invalid tools '{spec}', expected 'module:attribute'")
+    tools = getattr(importlib.import_module(module_name), attribute)
+    return list(tools() if callable(tools) else tools)
+
+
+def tool_name(tool: Any) -> str:
+    return getattr(tool, "name", None) or tool.__name__
+
+
+class ToolServer:
+    """The worker side: runs the calls sent over its socket, any number at a time."""
+
+    def __init__(self, tools: List[Any], mode: str, max_workers: Optional[int] = None):
+        self.tools = {tool_name(tool): tool for tool in tools}
+        self.mode = mode
+        self.executor = ToolExecutor(max_workers=max_workers)
+        self._runners: Dict[Tuple[str, bool], ToolRunner] = {}
+
+    def _runner(self, name: str, validated: bool) -> ToolRunner:
+        runner = self._runners.get((name, validated))
+        if runner is None:
+            tool = self.tools[name]
+            if isinstance(tool, LazyTool):
+                tool = self.tools[name] = tool.materialize()
+            elif not hasattr(tool, "invoke"):
+                # Plain functions are wrapped the way create_kit wraps them
+                tool = self.tools[name] = AuthenticatedTool.from_function(
+                    name=name, func=tool, description=tool.__doc__
+                )
+            mode = getattr(tool, "execution_mode", None) or self.mode
+            runner = self._runners[name, validated] = self.executor.create_runner(
+                tool, mode, validated
+            )
+        return runner
+
+    async def _answer(
+        self,
+        writer: asyncio.StreamWriter,
+        call_id: int,
+        name: Optional[str],
+        validated: bool,
+        params: Any,
+    ) -> None:
+        try:
+            if name is PING:
+                frame = encode_frame((call_id, True, "pong"))
+            else:
+                result = await self._runner(name, validated)(params)
+                if isinstance(result, ByteStream):
+                    await result.aclose()
+                    raise ValueError(
+                        f"Function '{name}' streams its result and can't run in a worker"
+                    )
+                frame = encode_frame((call_id, True, result))
+        except Exception as e:
+            frame = encode_error(call_id, e)
+        if not writer.is_closing():
+            writer.write(frame)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        calls = set()
+        try:
+            while True:
+                message = await read_frame(reader)
+                call = asyncio.ensure_future(self._answer(writer, *message))
+                calls.add(call)
+                call.add_done_callback(calls.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path: str) -> None:
+        parent = os.getppid()
+        server = await asyncio.start_unix_server(self.handle, path=socket_path)
+        os.chmod(socket_path, 0o600)
+        async with server:
+            # Workers don't outlive the hub that started them
+            while os.getppid() == parent:
+                await asyncio.sleep(1)
+        self.executor.shutdown()
+
+
+class WorkerConnection:
+    """A connection to one worker carrying many calls, on the loop that opened it."""
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        generation: int,
+        retry_after: float,
+    ):
+        self.loop = asyncio.get_running_loop()
+        self.writer = writer
+        self.generation = generation
+        self.retry_after = retry_after
+        self.closed = False
+        self.pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+        self._reader = self.loop.create_task(self._read(reader))
+
+    async def call(self, name: str, validated: bool, params: Dict[str, Any]) -> Any:
+        if self.closed:
+            raise WorkerUnavailable("Tool worker went away", retry_after=self.retry_after)
+        call_id = next(self._ids)
+        future = self.loop.create_future()
+        self.pending[call_id] = future
+        try:
+            self.writer.write(encode_frame((call_id, name, validated, params)))
+            ok, value = await future
+        finally:
+            self.pending.pop(call_id, None)
+        if not ok:
+            raise value
+        return value
+
+    async def _read(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                call_id, ok, value = await read_frame(reader)
+                future = self.pending.get(call_id)
+                if future is not None and not future.done():
+                    future.set_result((ok, value))
+        except Exception:
+            pass
+        finally:
+            self.closed = True
+            self.writer.close()
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(
+                        WorkerUnavailable(
+                            "Tool worker went away", retry_after=self.retry_after
+                        )
+                    )
+
+
+class WorkerProcess:
+    def __init__(self, index: int, socket_path: str):
+        self.index = index
+        self.socket_path = socket_path
+        self.process: Optional[subprocess.Popen] = None
+        self.generation = 0
+        self.healthy = False
+        self.failed_checks = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.restarts = 0
+        self.connection: Optional[WorkerConnection] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pid": self.process.pid if self.process else None,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "restarts": self.restarts,
+        }
+
+
+class WorkerPool:
+    """
+    Runs a kit's tools in separate worker processes, reached over Unix sockets.
+
+    Every worker imports its own copy of the tools from ``tools`` (``module:attribute``)
+    while the hub imports them only for their routes and catalog. Calls go to the
+    healthy worker with the fewest calls in flight. A worker that exits or fails
+    ``unhealthy_after`` health checks in a row is restarted, and the calls it was
+    running fail with 503.
+
+    Kits sharing a pool each start it as its ``owner``, and it runs until the last of
+    them shuts it down.
+    """
+
+    def __init__(
+        self,
+        tools: str,
+        workers: int = 2,
+        execution_mode: str = "thread",
+        max_workers: Optional[int] = None,
+        health_interval: float = 5.0,
+        health_timeout: float = 5.0,
+        unhealthy_after: int = 3,
+        start_timeout: float = 60.0,
+        retry_after: float = 1.0,
+    ):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.tools_spec = tools
+        self.workers = workers
+        self.execution_mode = execution_mode
+        self.max_workers = max_workers
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.unhealthy_after = unhealthy_after
+        self.start_timeout = start_timeout
+        self.retry_after = retry_after
+        self._tools: Optional[List[Any]] = None
+        self._processes: List[WorkerProcess] = []
+        self._socket_dir: Optional[str] = None
+        self._next = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+        self._owners: Set[int] = set()
+
+    @property
+    def tools(self) -> List[Any]:
+        if self._tools is None:
+            self._tools = load_tools(self.tools_spec)
+        return self._tools
+
+    @property
+    def in_flight(self) -> int:
+        return sum(process.in_flight for process in self._processes)
+
+    def start(self, owner: Any = None) -> None:
+        with self._lock:
+            self._owners.add(id(owner))
+            if self._processes:
+                return
+            # Every run gets its own event, a stopping health thread never sees it clear
+            self._stop = threading.Event()
+            self._socket_dir = tempfile.mkdtemp(prefix="kithub-workers-")
+            processes = [
+                WorkerProcess(i, os.path.join(self._socket_dir, f"worker-{i}.sock"))
+                for i in range(self.workers)
+            ]
+            for process in processes:
+                self._spawn(process)
+            try:
+                for process in processes:
+                    self._wait_ready(process)
+            except Exception:
+                self._stop_processes(processes)
+                raise
+            self._processes = processes
+            self._health_thread = threading.Thread(
+                target=self._check_health,
+                args=(self._stop,),
+                name="kithub-workers-health",
+                daemon=True,
+            )
+            self._health_thread.start()
+
+    def _spawn(self, process: WorkerProcess) -> None:
+        if os.path.exists(process.socket_path):
+            os.unlink(process.socket_path)
+        command = [
+            sys.executable,
+            "-m",
+            "workers",
+            "--socket",
+            process.socket_path,
+            "--tools",
+            self.tools_spec,
+            "--mode",
+            self.execution_mode,
+        ]
+        if self.max_workers:
+            command += ["--max-workers", str(self.max_workers)]
+        # Workers import the tools from the same paths as the hub
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, sys.path))}
+        process.process = subprocess.Popen(command, env=env)
+        process.generation += 1
+
+    def _wait_ready(self, process: WorkerProcess) -> None:
+        deadline = time.monotonic() + self.start_timeout
+        while not self._ping(process):
+            code = process.process.poll()  # type: ignore
+            if code is not None:
+                raise RuntimeError(f"Tool worker {process.index} exited with code {code}")
+            if time.monotonic() > deadline:
+                process.process.kill()  # type: ignore
+                raise RuntimeError(
+                    f"Tool worker {process.index} didn't start in {self.start_timeout}s"
+                )
+            time.sleep(0.05)
+        process.failed_checks = 0
+        process.healthy = True
+
+    def _ping(self, process: WorkerProcess) -> bool:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.health_timeout)
+                sock.connect(process.socket_path)
+                sock.sendall(encode_frame((0, PING, False, None)))
+                reply = sock.makefile("rb")
+                (size,) = HEADER.unpack(reply.read(HEADER.size))
+                return pickle.loads(reply.read(size)) == (0, True, "pong")
+        except (OSError, struct.error, pickle.UnpicklingError, EOFError):
+            return False
+
+    def _check_health(self, stop: threading.Event) -> None:
+        while not stop.wait(self.health_interval):
+            for process in list(self._processes):
+                if stop.is_set():
+                    return
+                alive = process.process.poll() is None  # type: ignore
+                if alive and self._ping(process):
+                    process.failed_checks = 0
+                    continue
+                process.failed_checks += 1
+                if not alive or process.failed_checks >= self.unhealthy_after:
+                    self._restart(process, stop)
+
+    def _restart(self, process: WorkerProcess, stop: threading.Event) -> None:
+        process.healthy = False
+        logger.warning(f"Restarting tool worker {process.index} of {self.tools_spec}")
+        if process.process.poll() is None:  # type: ignore
+            process.process.kill()  # type: ignore
+        process.process.wait()  # type: ignore
+        with self._lock:
+            if stop.is_set():
+                return
+            self._spawn(process)
+        try:
+            self._wait_ready(process)
+        except RuntimeError:
+            # Stays out of rotation, the next health check tries again
+            logger.exception(f"Tool worker {process.index} failed to restart")
+            return
+        process.restarts += 1
+
+    def _pick(self) -> WorkerProcess:
+        processes = self._processes
+        self._next = (self._next + 1) % max(1, len(processes))
+        # Rotated so ties don't always go to the first worker
+        healthy = [
+            process
+            for process in processes[self._next :] + processes[: self._next]
+            if process.healthy
+        ]
+        if not healthy:
+            raise WorkerUnavailable(
+                "No healthy tool worker", retry_after=self.retry_after
+            )
+        return min(healthy, key=lambda process: process.in_flight)
+
+    async def _connect(self, process: WorkerProcess) -> WorkerConnection:
+        connection = process.connection
+        if (
+            connection is not None
+            and not connection.closed
+            and connection.loop is asyncio.get_running_loop()
+            and connection.generation == process.generation
+        ):
+            return connection
+        generation = process.generation
+        try:
+            reader, writer = await asyncio.open_unix_connection(process.socket_path)
+        except OSError as e:
+            raise WorkerUnavailable(
+                f"Tool worker {process.index} is unreachable: {e}",
+                retry_after=self.retry_after,
+            )
+        connection = WorkerConnection(reader, writer, generation, self.retry_after)
+        process.connection = connection
+        return connection
+
+    def create_runner(self, name: str, validated: bool = False) -> ToolRunner:
+        async def run_in_worker(params: Dict[str, Any]) -> Any:
+            process = self._pick()
+            process.in_flight += 1
+            process.calls += 1
+            try:
+                connection = await self._connect(process)
+                return await connection.call(name, validated, params)
+            finally:
+                process.in_flight -= 1
+
+        return run_in_worker
+
+    def _stop_processes(self, processes: List[WorkerProcess]) -> None:
+        for process in processes:
+            process.healthy = False
+            if process.process is not None and process.process.poll() is None:
+                process.process.terminate()
+        for process in processes:
+            if process.process is None:
+                continue
+            try:
+                process.process.wait(5)
+            except subprocess.TimeoutExpired:
+                process.process.kill()
+                process.process.wait()
+
+    def shutdown(self, owner: Any = None) -> None:
+        """Stop the workers once no ``owner`` needs them, or right away without one."""
+        with self._lock:
+            if owner is not None:
+                self._owners.discard(id(owner))
+                if self._owners:
+                    return
+            self._owners.clear()
+            self._stop.set()
+            health_thread, self._health_thread = self._health_thread, None
+            processes, self._processes = self._processes, []
+            self._stop_processes(processes)
+            if self._socket_dir is not None:
+                shutil.rmtree(self._socket_dir, ignore_errors=True)
+                self._socket_dir = None
+        if health_thread is not None and health_thread is not threading.current_thread():
+            health_thread.join(self.health_timeout + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tools": self.tools_spec,
+            "workers": [process.stats() for process in self._processes],
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve KitHub tools over a socket")
+    parser.add_argument("--socket", required=True)
+    parser.add_argument("--tools", required=True, help="module:attribute")
+    parser.add_argument("--mode", default="thread")
+    parser.add_argument("--max-workers", type=int)
+    args = parser.parse_args()
+    server = ToolServer(load_tools(args.tools), args.mode, args.max_workers)
+    asyncio.run(server.serve(args.socket))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import os
+
 from langchain_core.tools import tool
 
 from kithub import create_kit, create_kithub
@@ -20,6 +22,24 @@ def example_tool_with_args(x: int, y: int):
     return f"The sum of {x} and {y} is {x + y}"
 
 
+def square(x: int):
+    """Square a number."""
+    return x * x
+
+
+def worker_pid():
+    """Report the process running the tool."""
+    return os.getpid()
+
+
+def crash():
+    """Exit the process running the tool."""
+    os._exit(1)
+
+
+worker_tools = [worker_pid, crash, example_tool_with_args]
+
+
 def get_app():
     # Register endpoints
     kit = create_kit(
@@ -0,0 +1,83 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+StubResponse = Tuple[int, Dict[str, str], bytes]
+
+
+def json_response(body: Any, status: int = 200) -> StubResponse:
+    return status, {"Content-Type": "application/json"}, json.dumps(body).encode()
+
+
+def echo(request: Dict[str, Any]) -> StubResponse:
+    return json_response(
+        {
+            "method": request["method"],
+            "path": request["path"],
+            "query": request["query"],
+            "json": request["json"],
+        }
+    )
+
+
+class StubServer:
+    """Local stand-in for an upstream API, served from a background thread."""
+
+    def __init__(self, handler: Callable[[Dict[str, Any]], StubResponse] = echo):
+        self.handler = handler
+        self.requests: List[Dict[str, Any]] = []
+        self.client_ports: set = set()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]  # type: ignore
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "StubServer":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                url = urlsplit(self.path)
+                request = {
+                    "method": self.command,
+                    "path": url.path,
+                    "query": {k: v[0] for k, v in parse_qs(url.query).items()},
+                    "headers": dict(self.headers),
+                    "body": body,
+                    "json": None,
+                }
+                if body and "json" in self.headers.get("Content-Type", ""):
+                    request["json"] = json.loads(body)
+                stub.requests.append(request)
+                stub.client_ports.add(self.client_address[1])
+
+                status, headers, payload = stub.handler(request)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
@@ -1,6 +1,9 @@
+from typing import get_args
+
 from openapi.openapi_tools import create_llm_tools_from_openapi
 import pytest
 from fastapi.testclient import TestClient
+from pydantic import ValidationError
 from tests.example_tools import (
     example_function, example_tool, example_tool_with_args, get_app
 )
@@ -162,3 +165,1724 @@ def test_openapi():
     response1 = client.get(f"/{openapi_schema_title}")
     assert response1.status_code == 200
     assert any(func["name"] == "removebg" for func in response1.json())
+
+
+def test_sync_tool_runs_off_event_loop():
+    import threading
+
+    def current_thread_name():
+        """Return the name of the thread running the tool."""
+        return threading.current_thread().name
+
+    router = create_kit(prefix="/test", tools=[current_thread_name], max_workers=2)
+    client = TestClient(create_kithub([router]))
+
+    response = client.post("/test/current_thread_name", json={})
+    assert response.status_code == 200
+    assert response.json()["result"].startswith("kithub-tool")
+
+    stats = client.get("/test/_stats").json()["executor"]
+    assert stats["thread"]["pool_size"] == 2
+    assert stats["thread"]["in_flight"] == 0
+
+
+def test_async_tool_is_awaited_natively():
+    from langchain_core.tools import StructuredTool
+
+    async def add(x: int, y: int):
+        """Add two numbers asynchronously."""
+        return x + y
+
+    async_tool = StructuredTool.from_function(coroutine=add, name="add")
+    router = create_kit(prefix="/test", tools=[async_tool])
+    client = TestClient(create_kithub([router]))
+
+    response = client.post("/test/add", json={"x": 2, "y": 3})
+    assert response.status_code == 200
+    assert response.json() == {"result": 5}
+
+
+def test_process_execution_mode():
+    from models import AuthenticatedTool
+    from tests.example_tools import square
+
+    square_tool = AuthenticatedTool.from_function(
+        func=square, description=square.__doc__, execution_mode="process"
+    )
+    router = create_kit(prefix="/test", tools=[square_tool], max_process_workers=1)
+    client = TestClient(create_kithub([router]))
+
+    response = client.post("/test/square", json={"x": 4})
+    assert response.status_code == 200
+    assert response.json() == {"result": 16}
+    router.executor.shutdown()
+
+
+def test_process_execution_mode_requires_picklable_function():
+    def local_tool():
+        """Tool defined in a local scope."""
+        return "local"
+
+    with pytest.raises(ValueError, match="picklable"):
+        create_kit(prefix="/test", tools=[local_tool], execution_mode="process")
+
+
+def write_spec(tmp_path, base_url):
+    import yaml
+
+    spec = {
+        "openapi": "3.0.0",
+        "servers": [{"url": base_url}],
+        "info": {"title": "Items API", "version": "1.0.0"},
+        "paths": {
+            "/items/{item_id}": {
+                "get": {
+                    "summary": "Get an item",
+                    "tags": ["Items"],
+                    "parameters": [
+                        {
+                            "name": "item_id",
+                            "in": "path",
+                            "required": True,
+                            "schema": {"type": "integer"},
+                        },
+                        {"name": "verbose", "in": "query", "schema": {"type": "string"}},
+                    ],
+                }
+            },
+            "/items": {
+                "post": {
+                    "summary": "Create an item",
+                    "tags": ["Admin"],
+                    "requestBody": {
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "type": "object",
+                                    "required": ["name"],
+                                    "properties": {"name": {"type": "string"}},
+                                }
+                            }
+                        }
+                    },
+                }
+            },
+        },
+    }
+    spec_file = tmp_path / "items.yaml"
+    spec_file.write_text(yaml.safe_dump(spec))
+    return str(spec_file)
+
+
+def test_openapi_http_engine_reuses_connections(tmp_path):
+    from openapi.transport import HTTPEngine
+    from tests.stub_server import StubServer
+
+    with StubServer() as upstream:
+        engine = HTTPEngine(max_connections=1)
+        llm_tools = create_llm_tools_from_openapi(
+            write_spec(tmp_path, upstream.url), engine=engine
+        )
+        assert all(tool.coroutine is not None for tool in llm_tools)
+
+        app = create_kithub([create_kit(prefix="/items", tools=llm_tools)])
+        with TestClient(app) as client:
+            for item_id in (1, 2, 3):
+                response = client.post(
+                    "/items/items_item_id", json={"item_id": item_id, "verbose": "yes"}
+                )
+                assert response.status_code == 200
+                assert response.json()["result"]["path"] == f"/items/{item_id}"
+                assert response.json()["result"]["query"] == {"verbose": "yes"}
+
+            response = client.post("/items/items", json={"name": "widget"})
+            assert response.json()["result"]["json"] == {"name": "widget"}
+
+        assert len(upstream.requests) == 4
+        assert len(upstream.client_ports) == 1
+
+
+def test_batch_endpoint(client):
+    response = client.post(
+        "/example/_batch",
+        json=[
+            {"function_name": "example_tool_with_args", "params": {"x": 1, "y": 2}},
+            {"function_name": "example_function", "params": {}},
+            {"function_name": "example_tool_with_args", "params": {"x": "nope", "y": 2}},
+            {"function_name": "nonexistent_function", "params": {}},
+        ],
+    )
+    assert response.status_code == 200
+    results = response.json()
+    assert results[0] == {"result": "The sum of 1 and 2 is 3"}
+    assert results[1] == {"result": "This is example function 1"}
+    assert results[2]["status_code"] == 422
+    assert "x" in results[2]["errors"]
+    assert results[3]["status_code"] == 404
+
+
+def test_batch_endpoint_size_limit():
+    router = create_kit(prefix="/test", tools=[example_function], max_batch_size=1)
+    client = TestClient(create_kithub([router]))
+    call = {"function_name": "example_function", "params": {}}
+
+    response = client.post("/test/_batch", json=[call, call])
+    assert response.status_code == 413
+
+
+def test_cached_tool_results():
+    from caching import ResultCache
+    from models import AuthenticatedTool
+
+    calls = []
+
+    def lookup(key: str):
+        """Look up a value."""
+        calls.append(key)
+        return key.upper()
+
+    cache = ResultCache(ttl=60)
+    lookup_tool = AuthenticatedTool.from_function(
+        func=lookup, description=lookup.__doc__, cacheable=True
+    )
+    router = create_kit(prefix="/test", tools=[lookup_tool], cache=cache)
+    client = TestClient(create_kithub([router]))
+
+    for _ in range(3):
+        response = client.post("/test/lookup", json={"key": "a"})
+        assert response.json() == {"result": "A"}
+    client.post("/test/lookup", json={"key": "b"})
+
+    assert calls == ["a", "b"]
+    stats = client.get("/test/_stats").json()["cache"]
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+
+
+def test_cached_tools_reading_headers_are_keyed_per_caller():
+    from caching import ResultCache
+    from models import AuthenticatedTool
+
+    def whoami(auth_headers=None):
+        """Tell who is calling."""
+        return auth_headers.get("x-user")
+
+    tool = AuthenticatedTool.from_function(
+        func=whoami, description=whoami.__doc__, cacheable=True
+    )
+    router = create_kit(prefix="/me", tools=[tool], cache=ResultCache(ttl=60))
+    client = TestClient(create_kithub([router]))
+    for user in ("alice", "bob", "alice"):
+        response = client.post("/me/whoami", json={}, headers={"X-User": user})
+        assert response.json() == {"result": user}
+    assert router.cache.stats()["hits"] == 1
+
+
+def test_memory_cache_backend_eviction():
+    import asyncio
+
+    from caching import MemoryCacheBackend
+
+    async def scenario():
+        backend = MemoryCacheBackend(max_entries=2)
+        await backend.set("a", b"1", ttl=60)
+        await backend.set("b", b"2", ttl=60)
+        assert await backend.get("a") == b"1"
+        await backend.set("c", b"3", ttl=60)
+        assert await backend.get("b") is None
+        assert await backend.get("a") == b"1"
+
+        await backend.set("expired", b"4", ttl=0)
+        assert await backend.get("expired") is None
+
+        sized = MemoryCacheBackend(max_bytes=4)
+        await sized.set("x", b"12", ttl=60)
+        await sized.set("y", b"345", ttl=60)
+        assert await sized.get("x") is None
+        assert sized.size() == {"entries": 1, "bytes": 3}
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_cache_backend_is_shared(tmp_path):
+    import asyncio
+
+    from caching import ResultCache, SQLiteCacheBackend
+
+    path = str(tmp_path / "cache.db")
+    calls = []
+
+    async def runner(params):
+        calls.append(params)
+        return {"value": params["x"]}
+
+    async def scenario():
+        first = ResultCache(SQLiteCacheBackend(path)).wrap("tool", runner)
+        second = ResultCache(SQLiteCacheBackend(path)).wrap("tool", runner)
+        assert await first({"x": 1, "auth_headers": {"user-agent": "a"}}) == {"value": 1}
+        assert await second({"x": 1, "auth_headers": {"user-agent": "b"}}) == {"value": 1}
+
+    asyncio.run(scenario())
+    assert len(calls) == 1
+
+
+def test_openapi_get_operations_are_cacheable(tmp_path):
+    llm_tools = create_llm_tools_from_openapi(write_spec(tmp_path, "http://localhost"))
+    cacheable = {tool.name: tool.cacheable for tool in llm_tools}
+    assert cacheable == {"items_item_id": True, "items": False}
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    import time
+
+    from coalescing import SingleFlight
+    from models import AuthenticatedTool
+
+    calls = []
+
+    def slow_lookup(key: str):
+        """Slowly look up a value."""
+        calls.append(key)
+        time.sleep(0.2)
+        return key.upper()
+
+    single_flight = SingleFlight()
+    lookup_tool = AuthenticatedTool.from_function(
+        func=slow_lookup, description=slow_lookup.__doc__, coalesce=True
+    )
+    router = create_kit(prefix="/test", tools=[lookup_tool], single_flight=single_flight)
+    client = TestClient(create_kithub([router]))
+
+    call = {"function_name": "slow_lookup", "params": {"key": "a"}}
+    response = client.post("/test/_batch", json=[call] * 5)
+    assert response.json() == [{"result": "A"}] * 5
+    assert calls == ["a"]
+
+    client.post("/test/slow_lookup", json={"key": "a"})
+    assert calls == ["a", "a"]
+
+    stats = client.get("/test/_stats").json()["single_flight"]
+    assert stats["executions"] == 2
+    assert stats["coalesced"] == 4
+    assert stats["in_flight"] == 0
+
+
+def test_streaming_tool_ndjson_and_sse():
+    import json
+
+    def count_to(n: int):
+        """Count from one to n."""
+        for i in range(1, n + 1):
+            yield i
+
+    router = create_kit(prefix="/test", tools=[count_to])
+    client = TestClient(create_kithub([router]))
+
+    response = client.post("/test/count_to/stream", json={"n": 3})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [{"chunk": 1}, {"chunk": 2}, {"chunk": 3}, {"end": {}}]
+
+    response = client.post(
+        "/test/count_to/stream",
+        json={"n": 2},
+        headers={"Accept": "text/event-stream"},
+    )
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == "data: 1\n\ndata: 2\n\nevent: end\ndata: {}\n\n"
+
+
+def test_streaming_async_generator_tool_errors():
+    from models import AuthenticatedTool
+
+    async def fail_midway():
+        """Yield one chunk and then fail."""
+        yield "partial"
+        raise RuntimeError("upstream went away")
+
+    async def fail_immediately():
+        """Fail before producing anything."""
+        raise RuntimeError("no data")
+        yield
+
+    tools = [
+        AuthenticatedTool.from_function(
+            coroutine=fail, name=fail.__name__, description=fail.__doc__
+        )
+        for fail in (fail_midway, fail_immediately)
+    ]
+    router = create_kit(prefix="/test", tools=tools)
+    client = TestClient(create_kithub([router]))
+
+    response = client.post("/test/fail_midway/stream?format=ndjson", json={})
+    assert response.status_code == 200
+    assert '{"chunk": "partial"}' in response.text
+    assert "upstream went away" in response.text
+
+    response = client.post("/test/fail_immediately/stream", json={})
+    assert response.status_code == 500
+    assert "no data" in response.json()["detail"]
+
+
+def test_non_streaming_tool_has_no_stream_route(client):
+    response = client.post("/example/example_tool/stream", json={})
+    assert response.status_code == 404
+
+
+def test_lazy_openapi_tools(tmp_path):
+    from openapi.openapi_tools import LazyOpenAPITool
+    from tests.stub_server import StubServer
+
+    with StubServer() as upstream:
+        llm_tools = create_llm_tools_from_openapi(
+            write_spec(tmp_path, upstream.url), lazy=True
+        )
+        assert all(isinstance(tool, LazyOpenAPITool) for tool in llm_tools)
+
+        router = create_kit(prefix="/items", tools=llm_tools)
+        client = TestClient(create_kithub([router]))
+
+        catalog = {func["name"]: func for func in client.get("/items").json()}
+        assert catalog["items"]["parameters"]["required"] == ["name"]
+        assert client.get("/items/_stats").json()["lazy_tools"] == {
+            "pending": 2,
+            "materialized": 0,
+        }
+
+        response = client.post("/items/items_item_id", json={"item_id": 7})
+        assert response.status_code == 200
+        assert response.json()["result"]["path"] == "/items/7"
+
+        response = client.post("/items/items_item_id", json={"item_id": "seven"})
+        assert response.status_code == 422
+
+        assert client.get("/items/_stats").json()["lazy_tools"] == {
+            "pending": 1,
+            "materialized": 1,
+        }
+
+
+def test_openapi_operation_filters(tmp_path):
+    spec_file = write_spec(tmp_path, "http://localhost")
+
+    by_path = create_llm_tools_from_openapi(spec_file, lazy=True, paths=["/items/*"])
+    assert [tool.name for tool in by_path] == ["items_item_id"]
+
+    by_tag = create_llm_tools_from_openapi(spec_file, tags=["Admin"])
+    assert [tool.name for tool in by_tag] == ["items"]
+
+
+def test_compiled_spec_cache(tmp_path, monkeypatch):
+    import json
+
+    from openapi import openapi_tools
+
+    spec_file = write_spec(tmp_path, "http://localhost")
+    cache_dir = tmp_path / "cache"
+
+    tools = create_llm_tools_from_openapi(spec_file, cache_dir=str(cache_dir))
+    cached_files = list(cache_dir.glob("items-*.json"))
+    assert len(cached_files) == 1
+
+    def fail_parse(content):
+        raise AssertionError("spec should be loaded from the compiled cache")
+
+    monkeypatch.setattr(openapi_tools, "parse_openapi_spec", fail_parse)
+    cached_tools = create_llm_tools_from_openapi(spec_file, cache_dir=str(cache_dir))
+    assert [tool.name for tool in cached_tools] == [tool.name for tool in tools]
+    monkeypatch.undo()
+
+    # Entries are plain JSON, one that doesn't match the spec's hash is rebuilt
+    cached = json.loads(cached_files[0].read_text())
+    cached["digest"] = "0" * 64
+    cached_files[0].write_text(json.dumps(cached))
+    create_llm_tools_from_openapi(spec_file, cache_dir=str(cache_dir))
+    assert json.loads(cached_files[0].read_text())["digest"] != "0" * 64
+
+    with open(spec_file, "a") as file:
+        file.write("x-changed: true\n")
+    create_llm_tools_from_openapi(spec_file, cache_dir=str(cache_dir))
+    assert list(cache_dir.glob("items-*.json")) != cached_files
+    assert len(list(cache_dir.glob("items-*.json"))) == 1
+
+    # A spec with the same file name elsewhere keeps its own entry
+    (tmp_path / "other").mkdir()
+    other_file = write_spec(tmp_path / "other", "http://localhost")
+    create_llm_tools_from_openapi(other_file, cache_dir=str(cache_dir))
+    create_llm_tools_from_openapi(spec_file, cache_dir=str(cache_dir))
+    assert len(list(cache_dir.glob("items-*.json"))) == 2
+
+
+def test_nested_and_recursive_schema_refs(tmp_path):
+    import yaml
+
+    (tmp_path / "common.yaml").write_text(
+        yaml.safe_dump(
+            {
+                "components": {
+                    "schemas": {
+                        "Tag": {
+                            "type": "object",
+                            "required": ["label"],
+                            "properties": {"label": {"type": "string"}},
+                        }
+                    }
+                }
+            }
+        )
+    )
+    node_ref = {"$ref": "#/components/schemas/Tree~1Node"}
+    body = {"content": {"application/json": {"schema": node_ref}}}
+    spec = {
+        "openapi": "3.0.0",
+        "servers": [{"url": "http://localhost"}],
+        "info": {"title": "Trees", "version": "1.0.0"},
+        "paths": {
+            "/trees": {"post": {"summary": "Create a tree", "requestBody": body}},
+            "/forests": {"put": {"summary": "Replace a tree", "requestBody": body}},
+        },
+        "components": {
+            "schemas": {
+                "Tree/Node": {
+                    "type": "object",
+                    "required": ["name"],
+                    "properties": {
+                        "name": {"type": "string"},
+                        "tag": {"$ref": "common.yaml#/components/schemas/Tag"},
+                        "children": {"type": "array", "items": node_ref},
+                    },
+                }
+            }
+        },
+    }
+    spec_file = tmp_path / "trees.yaml"
+    spec_file.write_text(yaml.safe_dump(spec))
+
+    trees, forests = create_llm_tools_from_openapi(str(spec_file))
+
+    def children_model(tool):
+        # Optional[List[Model]], with null kept out of the JSON schema
+        children = get_args(tool.args_schema.model_fields["children"].annotation)[0]
+        return get_args(children)[0]
+
+    tree_model = children_model(trees)
+    assert tree_model is children_model(forests)
+
+    tree_model.model_validate(
+        {"name": "root", "tag": {"label": "a"}, "children": [{"name": "leaf"}]}
+    )
+    with pytest.raises(ValidationError):
+        tree_model.model_validate(
+            {"name": "root", "children": [{"tag": {"label": "b"}}]}
+        )
+    with pytest.raises(ValidationError):
+        tree_model.model_validate({"name": "root", "tag": {}})
+
+    client = TestClient(create_kithub([create_kit(prefix="/trees", tools=[trees])]))
+    assert client.get("/trees").status_code == 200
+
+
+def test_openapi_request_plan_forwards_auth_and_quotes_path(tmp_path):
+    import yaml
+
+    from tests.stub_server import StubServer
+
+    with StubServer() as upstream:
+        spec = {
+            "openapi": "3.0.0",
+            "servers": [{"url": upstream.url}],
+            "info": {"title": "Files", "version": "1.0.0"},
+            "paths": {
+                "/files/{name}": {
+                    "get": {
+                        "summary": "Read a file",
+                        "security": [{"ApiKeyAuth": []}],
+                        "parameters": [
+                            {
+                                "name": "name",
+                                "in": "path",
+                                "required": True,
+                                "schema": {"type": "string"},
+                            },
+                            {
+                                "name": "lines",
+                                "in": "query",
+                                "schema": {"type": "integer"},
+                            },
+                            {
+                                "name": "trace_id",
+                                "in": "header",
+                                "schema": {"type": "string"},
+                            },
+                        ],
+                    }
+                }
+            },
+            "components": {
+                "securitySchemes": {
+                    "ApiKeyAuth": {"type": "apiKey", "in": "header", "name": "X-API-Key"}
+                }
+            },
+        }
+        spec_file = tmp_path / "files.yaml"
+        spec_file.write_text(yaml.safe_dump(spec))
+
+        tools = create_llm_tools_from_openapi(str(spec_file))
+        client = TestClient(create_kithub([create_kit(prefix="/files", tools=tools)]))
+        response = client.post(
+            "/files/files_name",
+            json={"name": "a b/c", "lines": 3, "trace_id": "t-1"},
+            headers={"X-API-Key": "secret"},
+        )
+        assert response.status_code == 200
+        assert response.json()["result"]["path"] == "/files/a%20b%2Fc"
+        assert response.json()["result"]["query"] == {"lines": "3"}
+
+        forwarded = upstream.requests[-1]["headers"]
+        assert forwarded["X-API-Key"] == "secret"
+        assert forwarded["trace_id"] == "t-1"
+
+        # Optional params left out are not sent as "None"
+        response = client.post(
+            "/files/files_name", json={"name": "a"}, headers={"X-API-Key": "secret"}
+        )
+        assert response.json()["result"]["query"] == {}
+        assert "trace_id" not in upstream.requests[-1]["headers"]
+
+
+def test_bearer_credentials_key_cached_results_and_jobs(tmp_path):
+    import yaml
+
+    from caching import ResultCache
+    from jobs import JobManager
+    from tests.stub_server import StubServer, json_response
+
+    def whoami(request):
+        return json_response({"user": request["headers"]["Authorization"]})
+
+    with StubServer(whoami) as upstream:
+        spec = {
+            "openapi": "3.0.0",
+            "servers": [{"url": upstream.url}],
+            "info": {"title": "Me", "version": "1.0.0"},
+            "paths": {
+                "/me": {"get": {"summary": "Who am I", "security": [{"BearerAuth": []}]}}
+            },
+            "components": {
+                "securitySchemes": {"BearerAuth": {"type": "http", "scheme": "bearer"}}
+            },
+        }
+        spec_file = tmp_path / "me.yaml"
+        spec_file.write_text(yaml.safe_dump(spec))
+
+        tools = create_llm_tools_from_openapi(str(spec_file))
+        kit = create_kit(
+            prefix="/me", tools=tools, cache=ResultCache(ttl=60), jobs=JobManager()
+        )
+        client = TestClient(create_kithub([kit]))
+        alice = {"Authorization": "Bearer alice"}
+        bob = {"Authorization": "Bearer bob"}
+        for headers in (alice, bob, alice):
+            response = client.post("/me/me", json={}, headers=headers)
+            assert response.json()["result"]["user"] == headers["Authorization"]
+        assert len(upstream.requests) == 2
+
+        job = client.post(
+            "/me/_jobs", json={"function_name": "me", "params": {}}, headers=alice
+        ).json()
+        assert client.get(f"/me/_jobs/{job['id']}", headers=bob).status_code == 404
+        assert client.get(f"/me/_jobs/{job['id']}", headers=alice).status_code == 200
+
+
+def test_instrumentation_metrics_and_spans(tmp_path):
+    from caching import ResultCache
+    from instrumentation import Instrumentation
+    from models import AuthenticatedTool
+    from tests.stub_server import StubServer
+
+    class Span:
+        def __init__(self, name, attributes):
+            self.name = name
+            self.attributes = dict(attributes)
+            self.exceptions = []
+            self.ended = False
+
+        def set_attribute(self, key, value):
+            self.attributes[key] = value
+
+        def record_exception(self, exc):
+            self.exceptions.append(exc)
+
+        def end(self):
+            self.ended = True
+
+    class Tracer:
+        def __init__(self):
+            self.spans = []
+
+        def start_span(self, name, attributes=None):
+            self.spans.append(Span(name, attributes or {}))
+            return self.spans[-1]
+
+    def divide(x: int, y: int):
+        """Divide two numbers."""
+        return x / y
+
+    tracer = Tracer()
+    instrumentation = Instrumentation(tracer=tracer)
+    divide_tool = AuthenticatedTool.from_function(
+        func=divide, description=divide.__doc__, cacheable=True
+    )
+
+    with StubServer() as upstream:
+        items = create_llm_tools_from_openapi(write_spec(tmp_path, upstream.url))
+        client = TestClient(
+            create_kithub(
+                [
+                    create_kit(
+                        prefix="/math",
+                        tools=[divide_tool],
+                        cache=ResultCache(),
+                        instrumentation=instrumentation,
+                    ),
+                    create_kit(
+                        prefix="/items", tools=items, instrumentation=instrumentation
+                    ),
+                ]
+            )
+        )
+        assert client.post("/math/divide", json={"x": 6, "y": 3}).status_code == 200
+        assert client.post("/math/divide", json={"x": 6, "y": 3}).status_code == 200
+        assert client.post("/math/divide", json={"x": 1, "y": 0}).status_code == 500
+        assert client.post("/items/items_item_id", json={"item_id": 1}).status_code == 200
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    metrics = response.text
+    assert 'kithub_tool_calls_total{kit="/math",tool="divide"} 3' in metrics
+    assert 'kithub_tool_errors_total{kit="/math",tool="divide"} 1' in metrics
+    assert 'kithub_tool_duration_seconds_count{kit="/math",tool="divide"} 3' in metrics
+    assert 'kithub_cache_hits_total{kit="/math",tool="divide"} 1' in metrics
+    assert 'kithub_upstream_requests_total{method="GET",host="127.0.0.1' in metrics
+    assert metrics.count("# TYPE kithub_executor_in_flight gauge") == 1
+
+    assert [span.name for span in tracer.spans].count("kithub.tool divide") == 3
+    assert all(span.ended for span in tracer.spans)
+    assert isinstance(tracer.spans[2].exceptions[0], ZeroDivisionError)
+
+    # Hubs serve metrics once an instrumented kit is added
+    hub = create_kithub([create_kit(prefix="/math", tools=[divide])])
+    plain = TestClient(hub)
+    assert plain.get("/metrics").status_code == 404
+    hub.registry.add(
+        create_kit(prefix="/more", tools=[divide], instrumentation=Instrumentation())
+    )
+    assert plain.post("/more/divide", json={"x": 1, "y": 1}).status_code == 200
+    assert 'tool="divide"' in plain.get("/metrics").text
+
+
+def test_tool_limits_shed_load_and_time_out():
+    import asyncio
+    import threading
+
+    from limits import ToolLimiter, ToolOverloaded, ToolQueueTimeout
+    from models import AuthenticatedTool
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        """Block until released."""
+        started.set()
+        release.wait(5)
+        return "done"
+
+    async def nap(seconds: float):
+        """Sleep for a while."""
+        await asyncio.sleep(seconds)
+        return "awake"
+
+    hold_tool = AuthenticatedTool.from_function(
+        func=hold, description=hold.__doc__, max_concurrency=1, max_queue=0
+    )
+    nap_tool = AuthenticatedTool.from_function(
+        coroutine=nap, name="nap", description=nap.__doc__, timeout=0.05
+    )
+    router = create_kit(prefix="/limits", tools=[hold_tool, nap_tool], retry_after=3)
+    client = TestClient(create_kithub([router]))
+
+    first = threading.Thread(
+        target=client.post, args=("/limits/hold",), kwargs={"json": {}}
+    )
+    first.start()
+    assert started.wait(5)
+    response = client.post("/limits/hold", json={})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+    release.set()
+    first.join(5)
+
+    assert client.post("/limits/nap", json={"seconds": 0}).json() == {"result": "awake"}
+    assert client.post("/limits/nap", json={"seconds": 1}).status_code == 504
+    stats = client.get("/limits/_stats").json()["limits"]
+    assert stats["hold"]["rejected"] == 1
+    assert stats["nap"]["timeouts"] == 1
+
+    async def queue_then_time_out():
+        limiter = ToolLimiter("slow", max_concurrency=1, max_queue=1, timeout=0.1)
+        runner = limiter.wrap(lambda params: asyncio.sleep(0.3))
+        results = await asyncio.gather(
+            *(runner({}) for _ in range(3)), return_exceptions=True
+        )
+        return limiter, results
+
+    limiter, results = asyncio.run(queue_then_time_out())
+    assert [type(result) for result in results[1:]] == [ToolQueueTimeout, ToolOverloaded]
+    assert limiter.stats()["active"] == 0
+    assert limiter.stats()["queued"] == 0
+
+
+def test_timed_out_calls_keep_their_slot_and_streams_are_limited():
+    import threading
+    import time
+
+    from instrumentation import Instrumentation
+    from models import AuthenticatedTool
+
+    release = threading.Event()
+
+    def block():
+        """Block until released."""
+        release.wait(5)
+        return "done"
+
+    def count_to(n: int):
+        """Count from one to n."""
+        yield from range(1, n + 1)
+
+    block_tool = AuthenticatedTool.from_function(
+        func=block, description=block.__doc__, max_concurrency=1, timeout=0.1
+    )
+    count_tool = AuthenticatedTool.from_function(
+        func=count_to, description=count_to.__doc__, max_concurrency=1
+    )
+    instrumentation = Instrumentation()
+    router = create_kit(
+        prefix="/l", tools=[block_tool, count_tool], instrumentation=instrumentation
+    )
+    with TestClient(create_kithub([router])) as client:
+        assert client.post("/l/block", json={}).status_code == 504
+        # The thread still runs, so its slot stays taken
+        assert client.post("/l/block", json={}).status_code == 429
+        release.set()
+        for _ in range(50):
+            if router.limiters["block"].active == 0:
+                break
+            time.sleep(0.02)
+        assert client.post("/l/block", json={}).json() == {"result": "done"}
+
+        assert client.post("/l/count_to/stream", json={"n": 3}).status_code == 200
+        assert router.limiters["count_to"].active == 0
+        stats = instrumentation.stats()["tools"]["/l/count_to"]
+        assert (stats["calls"], stats["errors"], stats["in_flight"]) == (1, 0, 0)
+
+
+def test_upstream_guard_retries_and_circuit_breaker(tmp_path):
+    from openapi.resilience import CircuitBreaker, UpstreamGuard
+    from tests.stub_server import StubServer, echo, json_response
+
+    failures = {"remaining": 2}
+
+    def flaky(request):
+        if request["method"] == "POST":
+            return json_response({"detail": "down"}, status=500)
+        if failures["remaining"]:
+            failures["remaining"] -= 1
+            return json_response({"detail": "busy"}, status=503)
+        return echo(request)
+
+    with StubServer(flaky) as upstream:
+        guard = UpstreamGuard(
+            max_retries=2,
+            backoff=0.001,
+            breaker=CircuitBreaker(failure_rate=0.5, min_calls=5, reset_timeout=60),
+        )
+        tools = create_llm_tools_from_openapi(
+            write_spec(tmp_path, upstream.url), guard=guard
+        )
+        client = TestClient(create_kithub([create_kit(prefix="/items", tools=tools)]))
+
+        # GET is idempotent, the two 503s are retried away
+        response = client.post("/items/items_item_id", json={"item_id": 1})
+        assert response.json()["result"]["path"] == "/items/1"
+        assert len(upstream.requests) == 3
+
+        # POST is not retried, and its failures open the circuit
+        for _ in range(2):
+            result = client.post("/items/items", json={"name": "a"}).json()["result"]
+            assert result["status_code"] == 500
+        assert len(upstream.requests) == 5
+
+        result = client.post("/items/items_item_id", json={"item_id": 1}).json()["result"]
+        assert result["status_code"] == 503
+        assert len(upstream.requests) == 5
+
+        stats = client.get("/items/_stats").json()["upstreams"][upstream.url]
+        assert stats["circuit"] == "open"
+        assert stats["retries"] == 2
+        assert stats["short_circuited"] == 1
+
+    limited = UpstreamGuard(rate_limit=1, max_wait=0)
+    assert limited.call("GET", lambda: {"ok": True}) == {"ok": True}
+    assert limited.call("GET", lambda: {"ok": True})["status_code"] == 429
+
+    # Calls short-circuited by the open circuit leave the rate limit's tokens alone
+    tripped = CircuitBreaker(min_calls=1, reset_timeout=60)
+    tripped.record(True, 0.01)
+    guarded = UpstreamGuard(rate_limit=1, max_wait=0, breaker=tripped)
+    assert guarded.call("GET", lambda: {"ok": True})["status_code"] == 503
+    assert guarded.stats()["tokens"] == 1
+
+    breaker = CircuitBreaker(min_calls=1, reset_timeout=0, slow_call_seconds=1)
+    breaker.record(False, 2.0)  # too slow counts as a failure
+    assert breaker.state == "half_open"
+    assert breaker.allow() and not breaker.allow()
+    breaker.record(False, 0.01)
+    assert breaker.state == "closed"
+
+
+def test_fast_serialization_and_raw_upstream_passthrough(tmp_path):
+    import datetime
+
+    from serialization import RawJSON
+    from tests.stub_server import StubServer
+
+    def report(day: int):
+        """Build a report."""
+        return {"day": datetime.date(2024, 1, day), "rows": [{"n": i} for i in range(3)]}
+
+    with StubServer() as upstream:
+        items = create_llm_tools_from_openapi(
+            write_spec(tmp_path, upstream.url), raw_responses=True
+        )
+        get_item = next(tool for tool in items if tool.name == "items_item_id")
+        raw_result = get_item.invoke({"item_id": 3})
+        assert isinstance(raw_result, RawJSON)
+        assert raw_result.parse()["path"] == "/items/3"
+
+        fast = TestClient(
+            create_kithub(
+                [
+                    create_kit(prefix="/fast", tools=[report], fast_serialization=True),
+                    create_kit(prefix="/raw", tools=items, fast_serialization=True),
+                    create_kit(prefix="/plain", tools=items),
+                ]
+            )
+        )
+        response = fast.post("/fast/report", json={"day": 2})
+        assert response.json() == {
+            "result": {"day": "2024-01-02", "rows": [{"n": 0}, {"n": 1}, {"n": 2}]}
+        }
+
+        for prefix in ("/raw", "/plain"):
+            response = fast.post(f"{prefix}/items_item_id", json={"item_id": 3})
+            assert response.json()["result"]["path"] == "/items/3"
+
+        response = fast.post(
+            "/raw/_batch",
+            json=[
+                {"function_name": "items_item_id", "params": {"item_id": 4}},
+                {"function_name": "missing", "params": {}},
+            ],
+        )
+        assert response.json()[0]["result"]["path"] == "/items/4"
+        assert response.json()[1]["status_code"] == 404
+
+
+def test_openapi_calls_are_validated_once(tmp_path, monkeypatch):
+    from models import AuthenticatedTool
+    from openapi.utils import RequestPlan
+    from tests.stub_server import StubServer
+
+    builds, parses = [], []
+    build, parse_input = RequestPlan.build, AuthenticatedTool._parse_input
+
+    def counting_build(self, kwargs, validated=False):
+        builds.append(validated)
+        return build(self, kwargs, validated)
+
+    def counting_parse_input(self, tool_input):
+        parses.append(self.name)
+        return parse_input(self, tool_input)
+
+    monkeypatch.setattr(RequestPlan, "build", counting_build)
+    monkeypatch.setattr(AuthenticatedTool, "_parse_input", counting_parse_input)
+
+    with StubServer() as upstream:
+        tools = create_llm_tools_from_openapi(write_spec(tmp_path, upstream.url))
+        client = TestClient(
+            create_kithub(
+                [
+                    create_kit(prefix="/once", tools=tools),
+                    create_kit(prefix="/thrice", tools=tools, validate_once=False),
+                ]
+            )
+        )
+        response = client.post("/once/items", json={"name": "pen"})
+        assert response.json()["result"]["json"] == {"name": "pen"}
+        assert client.post("/once/items", json={"name": 1}).status_code == 422
+        assert builds == [True] and parses == []
+
+        response = client.post("/thrice/items", json={"name": "pen"})
+        assert response.json()["result"]["json"] == {"name": "pen"}
+        assert builds == [True, False] and parses == ["items"]
+
+    # The kit validates against the tool's own model
+    schemas = client.get("/openapi.json").json()["components"]["schemas"]
+    assert "Post_itemsModel" in schemas and "itemsParams" in schemas
+
+
+def test_client_credentials_tokens_are_cached_and_refreshed(tmp_path):
+    import asyncio
+    import time
+    from urllib.parse import parse_qs
+
+    import yaml
+
+    from openapi.oauth import ClientCredentials, TokenManager
+    from tests.stub_server import StubServer, echo, json_response
+
+    issued, revoked = [], set()
+
+    def handler(request):
+        if request["path"] == "/token":
+            form = parse_qs(request["body"].decode())
+            if form["client_secret"] != ["s3cret"]:
+                return json_response({"error": "invalid_client"}, 401)
+            time.sleep(0.05)  # long enough for concurrent callers to pile up
+            issued.append(form.get("scope", [""])[0])
+            expires_in = 0.4 if form["client_id"] == ["short"] else 3600
+            return json_response(
+                {"access_token": f"tok-{len(issued)}", "expires_in": expires_in}
+            )
+        if request["headers"].get("Authorization", "")[7:] in revoked:
+            return json_response({"error": "invalid_token"}, 401)
+        return echo(request)
+
+    with StubServer(handler) as upstream:
+        spec = {
+            "openapi": "3.0.0",
+            "servers": [{"url": upstream.url}],
+            "info": {"title": "Reports", "version": "1.0.0"},
+            "paths": {
+                "/reports": {
+                    "get": {
+                        "summary": "List reports",
+                        "security": [{"OAuth": ["reports:read"]}],
+                    }
+                }
+            },
+            "components": {
+                "securitySchemes": {
+                    "OAuth": {
+                        "type": "oauth2",
+                        "flows": {"clientCredentials": {"tokenUrl": "/token"}},
+                    }
+                }
+            },
+        }
+        spec_file = tmp_path / "reports.yaml"
+        spec_file.write_text(yaml.safe_dump(spec))
+        manager = TokenManager(refresh_margin=0.3)
+
+        def client_for(secret, manager):
+            credentials = ClientCredentials("kit", secret, manager=manager)
+            tools = create_llm_tools_from_openapi(
+                str(spec_file), credentials={"OAuth": credentials}
+            )
+            assert tools[0].auth_requirements == []
+            return TestClient(create_kithub([create_kit(prefix="/r", tools=tools)]))
+
+        client = client_for("s3cret", manager)
+        for _ in range(3):
+            # No Authorization from the caller, the kit fetches its own token
+            assert client.post("/r/reports", json={}).status_code == 200
+        assert upstream.requests[-1]["headers"]["Authorization"] == "Bearer tok-1"
+        assert issued == ["reports:read"]
+
+        # A token the upstream rejects is dropped and replaced on the next call
+        revoked.add("tok-1")
+        assert client.post("/r/reports", json={}).json()["result"]["status_code"] == 401
+        client.post("/r/reports", json={})
+        assert upstream.requests[-1]["headers"]["Authorization"] == "Bearer tok-2"
+
+        error = client_for("wrong", TokenManager()).post("/r/reports", json={}).json()["result"]
+        assert "Failed to retrieve token" in error["error"]
+
+        # Concurrent callers share a single fetch
+        token_url = f"{upstream.url}/token"
+
+        async def fetch_concurrently():
+            return await asyncio.gather(
+                *(manager.atoken(token_url, "short", "s3cret", ["a"]) for _ in range(10))
+            )
+
+        tokens = asyncio.run(fetch_concurrently())
+        assert len(set(tokens)) == 1 and len(issued) == 3
+
+        # Near expiry the old token is still served while one refresh runs
+        time.sleep(0.25)
+        assert manager.token(token_url, "short", "s3cret", ["a"]) == tokens[0]
+        assert manager.token(token_url, "short", "s3cret", ["a"]) == tokens[0]
+        deadline = time.monotonic() + 5
+        while len(issued) < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert manager.token(token_url, "short", "s3cret", ["a"]) == "tok-4"
+        assert manager.stats()["background_refreshes"] == 1
+
+
+def test_openapi_proxy_mode_relays_upstream_body(tmp_path):
+    import yaml
+
+    from tests.stub_server import StubServer
+
+    csv = b"".join(b"%d,row %d\n" % (i, i) for i in range(50_000))
+
+    def export(request):
+        if request["headers"].get("X-API-Key") != "secret":
+            return 401, {"Content-Type": "text/plain"}, b"no key"
+        return (
+            200,
+            {"Content-Type": "text/csv", "Content-Disposition": "attachment; x.csv"},
+            csv,
+        )
+
+    with StubServer(export) as upstream:
+        spec = {
+            "openapi": "3.0.0",
+            "servers": [{"url": upstream.url}],
+            "info": {"title": "Exports", "version": "1.0.0"},
+            "paths": {
+                "/exports/{name}": {
+                    "get": {
+                        "summary": "Download an export",
+                        "security": [{"ApiKeyAuth": []}],
+                        "parameters": [
+                            {
+                                "name": "name",
+                                "in": "path",
+                                "required": True,
+                                "schema": {"type": "string"},
+                            }
+                        ],
+                    }
+                }
+            },
+            "components": {
+                "securitySchemes": {
+                    "ApiKeyAuth": {"type": "apiKey", "in": "header", "name": "X-API-Key"}
+                }
+            },
+        }
+        spec_file = tmp_path / "exports.yaml"
+        spec_file.write_text(yaml.safe_dump(spec))
+        tools = create_llm_tools_from_openapi(str(spec_file), proxy=True)
+        assert not tools[0].cacheable
+        client = TestClient(create_kithub([create_kit(prefix="/files", tools=tools)]))
+
+        response = client.post(
+            "/files/exports_name", json={"name": "daily"}, headers={"X-API-Key": "secret"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "text/csv"
+        assert response.headers["content-disposition"] == "attachment; x.csv"
+        assert response.content == csv
+        assert upstream.requests[-1]["path"] == "/exports/daily"
+
+        response = client.post(
+            "/files/exports_name", json={"name": "daily"}, headers={"X-API-Key": "wrong"}
+        )
+        assert response.status_code == 401
+        assert response.content == b"no key"
+
+        response = client.post(
+            "/files/_batch",
+            json=[{"function_name": "exports_name", "params": {"name": "daily"}}],
+            headers={"X-API-Key": "secret"},
+        )
+        assert response.json()[0]["status_code"] == 400
+
+
+def test_catalog_etag_compression_and_filters(tmp_path):
+    items = create_kit(
+        prefix="/items",
+        tools=create_llm_tools_from_openapi(write_spec(tmp_path, "http://localhost")),
+        catalog_max_age=30,
+    )
+    example = create_kit(
+        prefix="/example", tools=[example_function, example_tool, example_tool_with_args]
+    )
+    client = TestClient(create_kithub([items, example]))
+
+    response = client.get("/example", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["cache-control"] == "no-cache"
+    assert len(response.json()) == 3
+
+    etag = response.headers["etag"]
+    response = client.get("/example", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.get("/items", params={"tag": "Admin"})
+    assert response.headers["cache-control"] == "max-age=30"
+    assert [func["name"] for func in response.json()] == ["items"]
+    response = client.get("/example", params={"prefix": "example_tool"})
+    assert [func["name"] for func in response.json()] == [
+        "example_tool",
+        "example_tool_with_args",
+    ]
+    assert response.headers["etag"] != etag
+
+    hub = client.get("/_catalog").json()
+    assert sorted(hub) == ["/example", "/items"]
+    assert len(hub["/items"]) == 2
+    assert client.get("/_catalog", params={"tag": "Items"}).json() == {
+        "/items": [func for func in hub["/items"] if func["name"] == "items_item_id"]
+    }
+
+
+def test_registry_hot_reloads_specs_and_drains_old_kits(tmp_path):
+    import asyncio
+    import os
+
+    import httpx
+    import yaml
+    from langchain_core.tools import StructuredTool
+
+    from openapi.openapi_tools import OpenAPIToolset
+
+    spec_file = write_spec(tmp_path, "http://localhost")
+    toolset = OpenAPIToolset(spec_file)
+    app = create_kithub([], reload_interval=None)
+    registry = app.registry
+    registry.watch("/items", toolset)
+    assert not toolset.changed()
+    unchanged = {tool.name: tool for tool in toolset.tools}["items_item_id"]
+
+    spec = yaml.safe_load(open(spec_file))
+    spec["paths"]["/items"]["post"]["summary"] = "Create a new item"
+    spec["paths"]["/orders"] = {"get": {"summary": "List orders"}}
+    with open(spec_file, "w") as file:
+        yaml.safe_dump(spec, file)
+    os.utime(spec_file, ns=(0, 0))
+
+    release = None
+
+    async def slow():
+        """Answer once released."""
+        await release.wait()
+        return "v1"
+
+    def fast():
+        """Answer straight away."""
+        return "v2"
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        await registry._startup()
+        assert toolset.changed()
+        assert await registry.refresh() == ["/items"]
+        assert (toolset.built, toolset.reused) == (2, 1)
+        assert {tool.name: tool for tool in toolset.tools}["items_item_id"] is unchanged
+
+        v1 = create_kit(
+            prefix="/slow", tools=[StructuredTool.from_function(coroutine=slow)]
+        )
+        registry.add(v1)
+        transport = httpx.ASGITransport(app=app)  # type: ignore
+        async with httpx.AsyncClient(transport=transport, base_url="http://hub") as client:
+            catalog = (await client.get("/items")).json()
+            assert sorted(func["name"] for func in catalog) == [
+                "items",
+                "items_item_id",
+                "orders",
+            ]
+
+            in_flight = asyncio.ensure_future(client.post("/slow/slow", json={}))
+            await asyncio.sleep(0.1)
+            v2 = create_kit(prefix="/slow", tools=[fast])
+            assert registry.replace(v2) is v1
+            assert (await client.post("/slow/fast", json={})).json() == {"result": "v2"}
+            assert (await client.post("/slow/slow", json={})).status_code == 404
+
+            release.set()
+            assert (await in_flight).json() == {"result": "v1"}
+            await registry.drained()
+
+            registry.remove("/items")
+            assert (await client.get("/items")).status_code == 404
+            assert list((await client.get("/_catalog")).json()) == ["/slow"]
+        await registry._shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_registry_runs_startup_handlers_of_kits_added_before_startup():
+    started = []
+    kit = create_kit(prefix="/t", tools=[example_function])
+    kit.add_event_handler("startup", lambda: started.append("/t"))
+    app = create_kithub([kit], reload_interval=None)
+    replaced = create_kit(prefix="/gone", tools=[example_function])
+    replaced.add_event_handler("startup", lambda: started.append("/gone"))
+    app.registry.add(replaced)
+    app.registry.remove("/gone")
+
+    with TestClient(app):
+        assert started == ["/t"]
+
+
+def test_table_dispatch_serves_and_documents_every_tool():
+    from models import AuthenticatedTool
+
+    def count_to(n: int):
+        """Count from one to n."""
+        for i in range(1, n + 1):
+            yield i
+
+    def whoami(auth_headers=None):
+        """Return the caller's API key."""
+        return auth_headers["x-api-key"]
+
+    secured = AuthenticatedTool.from_function(
+        func=whoami,
+        name="whoami",
+        description=whoami.__doc__,
+        auth_requirements=[{"type": "apiKey", "name": "X-API-Key"}],
+    )
+    router = create_kit(
+        prefix="/t",
+        tools=[example_tool_with_args, count_to, secured],
+        dispatch="table",
+    )
+    client = TestClient(create_kithub([router]))
+    # One route serves every tool
+    assert len(router.routes) == 5
+
+    response = client.post("/t/example_tool_with_args", json={"x": 2, "y": 3})
+    assert response.json() == {"result": "The sum of 2 and 3 is 5"}
+    response = client.post("/t/example_tool_with_args", json={"x": "two"})
+    assert response.status_code == 422
+    assert set(response.json()["errors"]) == {"x", "y"}
+    assert client.post("/t/missing", json={}).status_code == 404
+
+    assert client.post("/t/whoami", json={}).status_code == 403
+    response = client.post("/t/whoami", json={}, headers={"X-API-Key": "k1"})
+    assert response.json() == {"result": "k1"}
+
+    response = client.post("/t/count_to/stream", json={"n": 2})
+    assert response.text.splitlines() == ['{"chunk": 1}', '{"chunk": 2}', '{"end": {}}']
+    assert client.post("/t/whoami/stream", json={}).status_code == 403
+
+    response = client.post(
+        "/t/_batch",
+        json=[{"function_name": "example_tool_with_args", "params": {"x": 1, "y": 1}}],
+    )
+    assert response.json() == [{"result": "The sum of 1 and 1 is 2"}]
+
+    paths = client.get("/openapi.json").json()["paths"]
+    assert {"/t/example_tool_with_args", "/t/count_to/stream", "/t/whoami"} <= set(paths)
+    assert "/t/{function_name}" not in paths
+    assert paths["/t/whoami"]["post"]["security"] == [{"APIKeyHeader": []}]
+
+
+def test_schema_cache_shares_models_and_keeps_nested_types(tmp_path, monkeypatch):
+    from typing import Dict, List, Optional, Union
+
+    from pydantic.v1 import BaseModel
+
+    import schemas
+    from schemas import SchemaCache
+
+    class Point(BaseModel):
+        x: int
+        y: Optional[float] = None
+
+    def plot(points: List[Point], weights: Dict[str, int], key: Union[int, str]):
+        """Plot some points."""
+        return [point.x for point in points]
+
+    cache = SchemaCache(str(tmp_path / "schemas.json"))
+    first = create_kit(prefix="/a", tools=[plot], schema_cache=cache)
+    second = create_kit(prefix="/b", tools=[plot], schema_cache=cache)
+    assert cache.stats() == {"functions": 1, "models": 1, "hits": 1, "misses": 1}
+    assert first.catalog.entries[0] is second.catalog.entries[0]
+
+    client = TestClient(create_kithub([first, second]))
+    body = {"points": [{"x": 1}, {"x": 2, "y": 0.5}], "weights": {"a": 1}, "key": 7}
+    assert client.post("/b/plot", json=body).json() == {"result": [1, 2]}
+    for bad in ({"points": [{"y": 1}]}, {"points": ["p"]}, {"weights": {"a": "heavy"}}):
+        response = client.post("/a/plot", json={**body, **bad})
+        assert response.status_code == 422
+
+    # A new process loads the converted schema from disk instead of converting it
+    def no_conversion(tool):
+        raise AssertionError("converted again")
+
+    monkeypatch.setattr(schemas, "convert_to_openai_function", no_conversion)
+    cold = SchemaCache(str(tmp_path / "schemas.json"))
+    create_kit(prefix="/c", tools=[plot], schema_cache=cold)
+    assert cold.stats()["hits"] == 1
+
+
+def test_jobs_run_in_background_with_bounded_queue_and_cancel():
+    import asyncio
+    import time
+
+    from jobs import JobManager
+    from models import AuthenticatedTool
+
+    async def nap(seconds: float):
+        """Sleep for a while."""
+        await asyncio.sleep(seconds)
+        return "awake"
+
+    nap_tool = AuthenticatedTool.from_function(
+        coroutine=nap, name="nap", description=nap.__doc__
+    )
+    jobs = JobManager(workers=1, max_queue=1, ttl=60, retry_after=2)
+    router = create_kit(prefix="/jobs", tools=[nap_tool], jobs=jobs)
+
+    with TestClient(create_kithub([router])) as client:
+        submitted = client.post(
+            "/jobs/_jobs", json={"function_name": "nap", "params": {"seconds": 0.3}}
+        )
+        assert submitted.status_code == 202
+        first = submitted.json()
+        assert submitted.headers["Location"] == f"/jobs/_jobs/{first['id']}"
+        deadline = time.monotonic() + 5
+        while client.get(f"/jobs/_jobs/{first['id']}").json()["status"] != "running":
+            assert time.monotonic() < deadline
+
+        queued = client.post(
+            "/jobs/_jobs", json={"function_name": "nap", "params": {"seconds": 5}}
+        ).json()
+        assert queued["status"] == "queued"
+        full = client.post(
+            "/jobs/_jobs", json={"function_name": "nap", "params": {"seconds": 0}}
+        )
+        assert full.status_code == 429
+        assert full.headers["Retry-After"] == "2"
+        invalid = client.post(
+            "/jobs/_jobs", json={"function_name": "nap", "params": {"seconds": "x"}}
+        )
+        assert invalid.status_code == 422
+
+        cancelled = client.delete(f"/jobs/_jobs/{queued['id']}")
+        assert cancelled.json()["status"] == "cancelled"
+        assert client.delete(f"/jobs/_jobs/{queued['id']}").status_code == 409
+
+        done = client.get(f"/jobs/_jobs/{first['id']}", params={"wait": 5}).json()
+        assert done["status"] == "succeeded"
+        assert done["result"] == "awake"
+        assert "owner" not in done
+        assert client.get("/jobs/_jobs/unknown").status_code == 404
+
+        stats = client.get("/jobs/_stats").json()["jobs"]
+        assert stats["succeeded"] == 1
+        assert stats["cancelled"] == 1
+        assert stats["rejected"] == 1
+        assert stats["queued"] == 0
+
+
+def test_job_manager_shared_across_a_kit_reload():
+    import threading
+
+    from jobs import JobManager
+
+    started, release, wake = threading.Event(), threading.Event(), threading.Event()
+
+    def hold():
+        """Block until released."""
+        started.set()
+        release.wait(5)
+        return "held"
+
+    def nap():
+        """Sleep until woken."""
+        wake.wait(5)
+        return "awake"
+
+    jobs = JobManager(workers=1)
+    app = create_kithub([create_kit(prefix="/j", tools=[hold], jobs=jobs)])
+
+    with TestClient(app) as client:
+        # The old kit drains only once its call is done, with a job of the new one running
+        old_call = threading.Thread(
+            target=client.post, args=("/j/hold",), kwargs={"json": {}}
+        )
+        old_call.start()
+        assert started.wait(5)
+        app.registry.replace(create_kit(prefix="/j", tools=[nap], jobs=jobs))
+        job = client.post("/j/_jobs", json={"function_name": "nap", "params": {}}).json()
+        release.set()
+        old_call.join(5)
+        client.portal.call(app.registry.drained)
+        wake.set()
+        record = client.get(f"/j/_jobs/{job['id']}?wait=5").json()
+        assert (record["status"], record.get("result")) == ("succeeded", "awake")
+
+
+def test_worker_pool_balances_and_restarts_workers():
+    import os
+    import time
+
+    from workers import WorkerPool
+
+    pool = WorkerPool("tests.example_tools:worker_tools", workers=2, health_interval=0.1)
+    router = create_kit(prefix="/workers", tools=pool.tools, workers=pool)
+
+    with TestClient(create_kithub([router])) as client:
+        response = client.post("/workers/example_tool_with_args", json={"x": 1, "y": 2})
+        assert response.json() == {"result": "The sum of 1 and 2 is 3"}
+        pids = {
+            client.post("/workers/worker_pid", json={}).json()["result"] for _ in range(4)
+        }
+        assert len(pids) == 2
+        assert os.getpid() not in pids
+
+        assert client.post("/workers/crash", json={}).status_code == 503
+        deadline = time.monotonic() + 30
+        while True:
+            workers = client.get("/workers/_stats").json()["workers"]["workers"]
+            restarts = sum(worker["restarts"] for worker in workers)
+            if restarts == 1 and all(worker["healthy"] for worker in workers):
+                break
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        assert client.post("/workers/worker_pid", json={}).status_code == 200
+
+    assert pool.stats()["workers"] == []
+
+
+def test_worker_pool_shared_across_a_kit_reload():
+    import threading
+
+    from workers import WorkerPool
+
+    pool = WorkerPool("tests.example_tools:worker_tools", workers=1, health_interval=0.1)
+    app = create_kithub([create_kit(prefix="/w", tools=pool.tools, workers=pool)])
+
+    with TestClient(app) as client:
+        app.registry.replace(create_kit(prefix="/w", tools=pool.tools, workers=pool))
+        client.portal.call(app.registry.drained)
+        # The old kit's shutdown leaves the pool to the new kit
+        assert client.post("/w/worker_pid", json={}).status_code == 200
+        health_threads = [
+            thread
+            for thread in threading.enumerate()
+            if thread.name == "kithub-workers-health"
+        ]
+        assert len(health_threads) == 1
+
+    assert pool.stats()["workers"] == []
+    assert not health_threads[0].is_alive()
+
+
+def test_micro_batching_groups_concurrent_calls():
+    import asyncio
+
+    import httpx
+
+    from batching import MicroBatcher
+    from instrumentation import Instrumentation
+    from models import AuthenticatedTool
+
+    batches = []
+
+    def embed(text: str):
+        """Embed a text."""
+        return len(text)
+
+    def embed_many(items):
+        batches.append(len(items))
+        return [len(item["text"]) or ValueError("Empty text") for item in items]
+
+    embed_tool = AuthenticatedTool.from_function(
+        func=embed, description=embed.__doc__, batch_func=embed_many, batch_max_size=4
+    )
+    router = create_kit(
+        prefix="/b",
+        tools=[embed_tool],
+        batcher=MicroBatcher(window=0.05),
+        instrumentation=Instrumentation(),
+    )
+    app = create_kithub([router])
+
+    async def call_concurrently():
+        transport = httpx.ASGITransport(app=app)  # type: ignore
+        async with httpx.AsyncClient(transport=transport, base_url="http://hub") as client:
+            return await asyncio.gather(
+                *(client.post("/b/embed", json={"text": "x" * i}) for i in range(6))
+            )
+
+    responses = asyncio.run(call_concurrently())
+    assert responses[0].status_code == 500
+    assert [response.json()["result"] for response in responses[1:]] == [1, 2, 3, 4, 5]
+    assert sorted(batches) == [2, 4]
+
+    client = TestClient(app)
+    stats = client.get("/b/_stats").json()["batching"]["tools"]["embed"]
+    assert stats == {"batches": 2, "calls": 6, "full": 1, "mean_size": 3.0}
+    assert 'kithub_batch_size_bucket{kit="/b",tool="embed",le="4"} 2' in client.get(
+        "/metrics"
+    ).text
+
+    # Callers only share a batch, and its credentials, when all of theirs match
+    async def run_batch(items, credentials):
+        return [credentials["auth_params"]["key"]] * len(items)
+
+    async def call_as_alice_and_bob():
+        runner = MicroBatcher(window=0.01).wrap("whoami", run_batch, ["X-Team"])
+        return await asyncio.gather(
+            *(
+                runner({"auth_headers": {"x-team": "t"}, "auth_params": {"key": key}})
+                for key in ("alice", "bob", "alice")
+            )
+        )
+
+    assert asyncio.run(call_as_alice_and_bob()) == ["alice", "bob", "alice"]
+
+
+def test_plain_async_functions_are_awaited_and_streamed():
+    import asyncio
+
+    async def add_later(x: int, y: int):
+        """Add two numbers after a pause."""
+        await asyncio.sleep(0)
+        return x + y
+
+    async def count_up(n: int):
+        """Count from zero to n."""
+        for i in range(n):
+            yield i
+
+    router = create_kit(prefix="/test", tools=[add_later, count_up])
+    client = TestClient(create_kithub([router]))
+
+    assert client.post("/test/add_later", json={"x": 1, "y": 2}).json() == {"result": 3}
+    response = client.post("/test/count_up/stream", json={"n": 3})
+    assert response.status_code == 200
+    assert [line for line in response.text.splitlines() if "chunk" in line] == [
+        '{"chunk": 0}',
+        '{"chunk": 1}',
+        '{"chunk": 2}',
+    ]
+
+
+def test_accepted_auth_keys_does_not_keep_functions_alive():
+    import gc
+    import weakref
+
+    from models import accepted_auth_keys
+
+    def tool(query: str, auth_headers=None):
+        return query
+
+    assert accepted_auth_keys(tool) == {"auth_headers"}
+    assert accepted_auth_keys(tool) == {"auth_headers"}
+    ref = weakref.ref(tool)
+    del tool
+    gc.collect()
+    assert ref() is None
+
+
+def test_guard_shared_by_kits_is_reported_once(tmp_path):
+    from instrumentation import Instrumentation
+    from openapi.resilience import CircuitBreaker, UpstreamGuard
+
+    guard = UpstreamGuard(breaker=CircuitBreaker())
+    tools = create_llm_tools_from_openapi(
+        write_spec(tmp_path, "http://upstream"), guard=guard
+    )
+    instrumentation = Instrumentation()
+    client = TestClient(
+        create_kithub(
+            [
+                create_kit(prefix=prefix, tools=tools, instrumentation=instrumentation)
+                for prefix in ("/a", "/b")
+            ]
+        )
+    )
+
+    lines = client.get("/metrics").text.splitlines()
+    for metric in ("kithub_upstream_retries_total", "kithub_upstream_circuit_state"):
+        samples = [line for line in lines if line.startswith(metric + "{")]
+        assert samples == [f'{metric}{{upstream="http://upstream"}} 0']
+
+
+def test_extension_bases_are_abstract():
+    from caching import CacheBackend
+    from jobs import JobBackend
+    from models import LazyTool
+    from streaming import ByteStream
+
+    for base in (CacheBackend, JobBackend, LazyTool, ByteStream):
+        with pytest.raises(TypeError):
+            base()
+
+    class GetOnly(CacheBackend):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError, match="clear, set"):
+        GetOnly()
+
+
+def test_get_python_type_still_importable_from_kithub():
+    from kithub import get_python_type
+
+    assert get_python_type("integer") is int
+
+
+def test_server_base_path_is_kept_by_both_transports(tmp_path):
+    import asyncio
+
+    from tests.stub_server import StubServer
+
+    with StubServer() as upstream:
+        tools = create_llm_tools_from_openapi(write_spec(tmp_path, upstream.url + "/v1/"))
+        get_item = next(tool for tool in tools if tool.name == "items_item_id")
+        assert get_item.invoke({"item_id": 3})["path"] == "/v1/items/3"
+        result = asyncio.run(get_item.ainvoke({"item_id": 3}))
+        assert result["path"] == "/v1/items/3"
+
+
+def test_validated_requests_keep_required_values_and_check_path_params():
+    from typing import Annotated, Optional
+
+    from pydantic import ValidationError, create_model
+
+    from openapi.resolver import ParamLocation
+    from openapi.utils import RequestPlan
+
+    RequestModel = create_model(
+        "GetItem",
+        item_id=(Annotated[Optional[int], ParamLocation("path")], None),
+        verbose=(Annotated[Optional[str], ParamLocation("query")], None),
+        note=(Optional[str], ...),
+    )
+    plan = RequestPlan("post", "/items/{item_id}", RequestModel, [])
+
+    request = plan.build({"item_id": 3, "verbose": None, "note": None}, validated=True)
+    assert request["path"] == "/items/3"
+    assert request["params"] == {}
+    assert request["json"] == {"note": None}  # required, so sent even when null
+
+    for params in ({"item_id": None, "note": "a"}, {"note": "a"}):
+        with pytest.raises(ValidationError, match="item_id"):
+            plan.build(params, validated=True)
+    with pytest.raises(ValidationError, match="item_id"):
+        plan.build({"note": "a"})